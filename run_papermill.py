@@ -1,153 +1,349 @@
-import papermill as pm
+"""
+Chạy pipeline notebook bằng papermill theo DAG.
+
+- Mỗi stage khai báo notebook, parameters, inputs (file đọc) và outputs (file ghi).
+- Hash(notebook + inputs + parameters + cluster_library.py) được lưu trong
+  notebooks/runs/.pipeline_state.json; stage có hash không đổi và outputs còn
+  đủ sẽ được bỏ qua.
+- Stage độc lập (Apriori, FP-Growth, So sánh) chạy song song trong các process riêng.
+- --instrument: ghi thời gian từng method của cluster_library vào
+  notebooks/runs/<stage>_run.instrumentation.jsonl (thêm --instrument-memory
+  để đo cả peak memory, chậm hơn đáng kể).
+
+Cách dùng:
+    python run_papermill.py                  # chạy các stage đã thay đổi
+    python run_papermill.py --force          # chạy lại toàn bộ
+    python run_papermill.py --only clustering_from_rules --jobs 2
+    python run_papermill.py --instrument     # ghi instrumentation log
+"""
+
+import argparse
+import hashlib
+import json
 import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 
-os.makedirs("notebooks/runs", exist_ok=True)
-
-# run_preprocessing_and_eda.py
-pm.execute_notebook(
-    "notebooks/preprocessing_and_eda.ipynb",
-    "notebooks/runs/preprocessing_and_eda_run.ipynb",
-    parameters=dict(
-        DATA_PATH="data/raw/online_retail.csv",
-        COUNTRY="United Kingdom",
-        OUTPUT_DIR="data/processed",
-        PLOT_REVENUE=True,         # tắt bớt plot khi chạy batch
-        PLOT_TIME_PATTERNS=True,
-        PLOT_PRODUCTS=True,
-        PLOT_CUSTOMERS=True,
-        PLOT_RFM=True,
-    ),
-    kernel_name="python3",
-)
-
-# run_basket_preparation.py
-
-pm.execute_notebook(
-    "notebooks/basket_preparation.ipynb",
-    "notebooks/runs/basket_preparation_run.ipynb",
-    parameters=dict(
-        CLEANED_DATA_PATH="data/processed/cleaned_uk_data.csv",
-        BASKET_BOOL_PATH="data/processed/basket_bool.parquet",
-        INVOICE_COL="InvoiceNo",
-        ITEM_COL="Description",
-        QUANTITY_COL="Quantity",
-        THRESHOLD=1,
+import papermill as pm
+
+RUNS_DIR = "notebooks/runs"
+STATE_PATH = os.path.join(RUNS_DIR, ".pipeline_state.json")
+LIBRARY_PATH = "src/cluster_library.py"
+
+STAGES = [
+    dict(
+        name="preprocessing_and_eda",
+        notebook="notebooks/preprocessing_and_eda.ipynb",
+        parameters=dict(
+            DATA_PATH="data/raw/online_retail.csv",
+            COUNTRY="United Kingdom",
+            RAW_CACHE_PATH="data/processed/online_retail_raw.parquet",
+            OUTPUT_DIR="data/processed",
+            PLOT_REVENUE=True,         # tắt bớt plot khi chạy batch
+            PLOT_TIME_PATTERNS=True,
+            PLOT_PRODUCTS=True,
+            PLOT_CUSTOMERS=True,
+            PLOT_RFM=True,
+        ),
+        inputs=["data/raw/online_retail.csv"],
+        outputs=[
+            "data/processed/online_retail_raw.parquet",
+            "data/processed/cleaned_uk_data.parquet",
+        ],
     ),
-    kernel_name="python3",
-)
-
-# Chạy Notebook Apriori Modelling
-pm.execute_notebook(
-    "notebooks/apriori_modelling.ipynb",
-    "notebooks/runs/apriori_modelling_run.ipynb",
-    parameters=dict(
-        BASKET_BOOL_PATH="data/processed/basket_bool.parquet",
-        RULES_OUTPUT_PATH="data/processed/rules_apriori_filtered.csv",
-
-        # Tham số Apriori
-        MIN_SUPPORT=0.01,
-        MAX_LEN=3,
-
-        # Generate rules
-        METRIC="lift",
-        MIN_THRESHOLD=1.0,
-
-        # Lọc luật
-        FILTER_MIN_SUPPORT=0.01,
-        FILTER_MIN_CONF=0.3,
-        FILTER_MIN_LIFT=1.2,
-        FILTER_MAX_ANTECEDENTS=2,
-        FILTER_MAX_CONSEQUENTS=1,
-
-        # Số luật để vẽ
-        TOP_N_RULES=20,
-
-        # Tắt plot khi chạy batch (bật = True nếu muốn xem hình)
-        PLOT_TOP_LIFT=True,
-        PLOT_TOP_CONF=True,
-        PLOT_SCATTER=True,
-        PLOT_NETWORK=True,
-        PLOT_PLOTLY_NETWORK=True,
-        PLOT_PLOTLY_SCATTER=True,  
+    dict(
+        name="basket_preparation",
+        notebook="notebooks/basket_preparation.ipynb",
+        parameters=dict(
+            CLEANED_DATA_PATH="data/processed/cleaned_uk_data.parquet",
+            BASKET_BOOL_PATH="data/processed/basket_bool.parquet",
+            INVOICE_COL="InvoiceNo",
+            ITEM_COL="Description",
+            QUANTITY_COL="Quantity",
+            THRESHOLD=1,
+        ),
+        inputs=["data/processed/cleaned_uk_data.parquet"],
+        outputs=["data/processed/basket_bool.parquet", "data/processed/basket_bool.labels.parquet"],
     ),
-    kernel_name="python3",
-)
-
-# Chạy Notebook FP_Growth Modelling
-pm.execute_notebook(
-    "notebooks/fp_growth_modelling.ipynb",
-    "notebooks/runs/fp_growth_modelling_run.ipynb",
-    parameters=dict(
-        BASKET_BOOL_PATH="data/processed/basket_bool.parquet",
-        RULES_OUTPUT_PATH="data/processed/rules_fpgrowth_filtered.csv",
-
-        MIN_SUPPORT=0.01,
-        MAX_LEN=3,
-
-        METRIC="lift",
-        MIN_THRESHOLD=1.0,
-
-        FILTER_MIN_SUPPORT=0.01,
-        FILTER_MIN_CONF=0.3,
-        FILTER_MIN_LIFT=1.2,
-        FILTER_MAX_ANTECEDENTS=2,
-        FILTER_MAX_CONSEQUENTS=1,
-
-        TOP_N_RULES=20,
-
-        PLOT_TOP_LIFT=True,
-        PLOT_TOP_CONF=True,
-        PLOT_SCATTER=True,
-        PLOT_NETWORK=True,
-        PLOT_PLOTLY_SCATTER=True,
+    # Chạy Notebook Apriori Modelling
+    dict(
+        name="apriori_modelling",
+        notebook="notebooks/apriori_modelling.ipynb",
+        parameters=dict(
+            BASKET_BOOL_PATH="data/processed/basket_bool.parquet",
+            RULES_OUTPUT_PATH="data/processed/rules_apriori_filtered.csv",
+            ITEMSET_CACHE_DIR="data/processed/itemset_cache",
+
+            # Tham số Apriori
+            MIN_SUPPORT=0.01,
+            MAX_LEN=3,
+
+            # Generate rules
+            METRIC="lift",
+            MIN_THRESHOLD=1.0,
+
+            # Lọc luật
+            FILTER_MIN_SUPPORT=0.01,
+            FILTER_MIN_CONF=0.3,
+            FILTER_MIN_LIFT=1.2,
+            FILTER_MAX_ANTECEDENTS=2,
+            FILTER_MAX_CONSEQUENTS=1,
+
+            # Số luật để vẽ
+            TOP_N_RULES=20,
+
+            # Tắt plot khi chạy batch (bật = True nếu muốn xem hình)
+            PLOT_TOP_LIFT=True,
+            PLOT_TOP_CONF=True,
+            PLOT_SCATTER=True,
+            PLOT_NETWORK=True,
+            PLOT_PLOTLY_NETWORK=True,
+            PLOT_PLOTLY_SCATTER=True,
+        ),
+        inputs=["data/processed/basket_bool.parquet", "data/processed/basket_bool.labels.parquet"],
+        outputs=["data/processed/rules_apriori_filtered.csv"],
     ),
-    kernel_name="python3",
-)
+    # Chạy Notebook FP_Growth Modelling
+    dict(
+        name="fp_growth_modelling",
+        notebook="notebooks/fp_growth_modelling.ipynb",
+        parameters=dict(
+            BASKET_BOOL_PATH="data/processed/basket_bool.parquet",
+            RULES_OUTPUT_PATH="data/processed/rules_fpgrowth_filtered.csv",
+            ITEMSET_CACHE_DIR="data/processed/itemset_cache",
 
-# Chạy Notebook So sánh Apriori và FP-Growth
-pm.execute_notebook(
-    "notebooks/compare_apriori_fpgrowth.ipynb",
-    "notebooks/runs/compare_apriori_fpgrowth_run.ipynb",
-    parameters=dict(
-        BASKET_BOOL_PATH="data/processed/basket_bool.parquet",
+            MIN_SUPPORT=0.01,
+            MAX_LEN=3,
 
-        MIN_SUPPORT=0.01,
-        MAX_LEN=3,
+            METRIC="lift",
+            MIN_THRESHOLD=1.0,
 
-        METRIC="lift",
-        MIN_THRESHOLD=1.0,
+            FILTER_MIN_SUPPORT=0.01,
+            FILTER_MIN_CONF=0.3,
+            FILTER_MIN_LIFT=1.2,
+            FILTER_MAX_ANTECEDENTS=2,
+            FILTER_MAX_CONSEQUENTS=1,
+
+            TOP_N_RULES=20,
+
+            PLOT_TOP_LIFT=True,
+            PLOT_TOP_CONF=True,
+            PLOT_SCATTER=True,
+            PLOT_NETWORK=True,
+            PLOT_PLOTLY_SCATTER=True,
+        ),
+        inputs=["data/processed/basket_bool.parquet", "data/processed/basket_bool.labels.parquet"],
+        outputs=["data/processed/rules_fpgrowth_filtered.csv"],
+    ),
+    # Chạy Notebook So sánh Apriori và FP-Growth
+    dict(
+        name="compare_apriori_fpgrowth",
+        notebook="notebooks/compare_apriori_fpgrowth.ipynb",
+        parameters=dict(
+            BASKET_BOOL_PATH="data/processed/basket_bool.parquet",
+
+            MIN_SUPPORT=0.01,
+            MAX_LEN=3,
+
+            METRIC="lift",
+            MIN_THRESHOLD=1.0,
+        ),
+        inputs=["data/processed/basket_bool.parquet", "data/processed/basket_bool.labels.parquet"],
+        outputs=[],
     ),
-    kernel_name="python3",
-)
-
-
-# run_clustering_from_rules.py
-pm.execute_notebook(
-    "notebooks/clustering_from_rules.ipynb",
-    "notebooks/runs/clustering_from_rules_run.ipynb",
-    parameters=dict(
-        CLEANED_DATA_PATH="data/processed/cleaned_uk_data.csv",
-        RULES_INPUT_PATH="data/processed/rules_apriori_filtered.csv",
-
-        TOP_K_RULES=200,
-        SORT_RULES_BY="lift",
-        WEIGHTING="lift",
-        MIN_ANTECEDENT_LEN=1,
-        USE_RFM=True,
-        RFM_SCALE=True,
-        RULE_SCALE=False,
-
-        K_MIN=2,
-        K_MAX=10,
-        N_CLUSTERS=None,
-        RANDOM_STATE=42,
-
-        OUTPUT_CLUSTER_PATH="data/processed/customer_clusters_from_rules.csv",
-
-        PROJECTION_METHOD="pca",
-        PLOT_2D=True,
+    dict(
+        name="clustering_from_rules",
+        notebook="notebooks/clustering_from_rules.ipynb",
+        parameters=dict(
+            CLEANED_DATA_PATH="data/processed/cleaned_uk_data.parquet",
+            RULES_INPUT_PATH="data/processed/rules_apriori_filtered.csv",
+
+            TOP_K_RULES=200,
+            SORT_RULES_BY="lift",
+            WEIGHTING="lift",
+            MIN_ANTECEDENT_LEN=1,
+            USE_RFM=True,
+            RFM_SCALE=True,
+            RULE_SCALE=False,
+
+            K_MIN=2,
+            K_MAX=10,
+            N_CLUSTERS=None,
+            RANDOM_STATE=42,
+            N_JOBS=1,
+
+            OUTPUT_CLUSTER_PATH="data/processed/customer_clusters_from_rules.csv",
+            MODEL_OUTPUT_DIR="data/processed/cluster_model",
+
+            PROJECTION_METHOD="pca",
+            PLOT_2D=True,
+        ),
+        inputs=[
+            "data/processed/cleaned_uk_data.parquet",
+            "data/processed/rules_apriori_filtered.csv",
+        ],
+        outputs=[
+            "data/processed/customer_clusters_from_rules.csv",
+            "data/processed/cluster_model",
+        ],
     ),
-    kernel_name="python3",
-)
+]
+
+
+def output_notebook(stage: dict) -> str:
+    return os.path.join(RUNS_DIR, f"{stage['name']}_run.ipynb")
+
+
+def file_hash(path: str) -> str:
+    """sha256 nội dung file, hoặc mọi file trong thư mục (dataset Parquet phân vùng); "missing" nếu chưa có."""
+    if not os.path.exists(path):
+        return "missing"
+    if os.path.isdir(path):
+        files = sorted(
+            os.path.join(root, name) for root, _, names in os.walk(path) for name in names
+        )
+    else:
+        files = [path]
+    h = hashlib.sha256()
+    for file in files:
+        h.update(os.path.relpath(file, path).encode("utf-8"))
+        with open(file, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    return h.hexdigest()
+
+
+def stage_hash(stage: dict) -> str:
+    """Hash của notebook + library + inputs + parameters của một stage."""
+    h = hashlib.sha256()
+    for path in [stage["notebook"], LIBRARY_PATH, *stage["inputs"]]:
+        h.update(path.encode("utf-8"))
+        h.update(file_hash(path).encode("utf-8"))
+    h.update(json.dumps(stage["parameters"], sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+def dependencies(stages: list[dict]) -> dict[str, set[str]]:
+    """Stage A phụ thuộc stage B nếu A đọc một output của B."""
+    producer = {out: s["name"] for s in stages for out in s["outputs"]}
+    return {
+        s["name"]: {producer[i] for i in s["inputs"] if i in producer and producer[i] != s["name"]}
+        for s in stages
+    }
+
+
+def instrumentation_log(stage: dict) -> str:
+    return os.path.join(RUNS_DIR, f"{stage['name']}_run.instrumentation.jsonl")
+
+
+def run_stage(stage: dict, instrument: bool = False, instrument_memory: bool = False) -> tuple[str, float]:
+    """Chạy một notebook (trong process con)."""
+    # kernel kế thừa biến môi trường => cluster_library tự bật instrumentation khi import
+    os.environ.pop("CLUSTER_LIBRARY_INSTRUMENT", None)
+    os.environ.pop("CLUSTER_LIBRARY_INSTRUMENT_MEMORY", None)
+    if instrument:
+        log_path = instrumentation_log(stage)
+        if os.path.exists(log_path):
+            os.remove(log_path)
+        os.environ["CLUSTER_LIBRARY_INSTRUMENT"] = os.path.abspath(log_path)
+        if instrument_memory:
+            os.environ["CLUSTER_LIBRARY_INSTRUMENT_MEMORY"] = "1"
+
+    start = time.perf_counter()
+    pm.execute_notebook(
+        stage["notebook"],
+        output_notebook(stage),
+        parameters=stage["parameters"],
+        kernel_name="python3",
+    )
+    return stage["name"], time.perf_counter() - start
+
+
+def load_state() -> dict:
+    if os.path.exists(STATE_PATH):
+        with open(STATE_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def save_state(state: dict):
+    with open(STATE_PATH, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+
+
+def is_up_to_date(stage: dict, state: dict) -> bool:
+    outputs = [*stage["outputs"], output_notebook(stage)]
+    return state.get(stage["name"]) == stage_hash(stage) and all(os.path.exists(o) for o in outputs)
+
+
+def run_pipeline(
+    stages: list[dict],
+    jobs: int | None = None,
+    force: bool = False,
+    only: list[str] | None = None,
+    instrument: bool = False,
+    instrument_memory: bool = False,
+):
+    """
+    Chạy DAG: stage chỉ được chạy khi mọi stage phụ thuộc đã xong, stage đã
+    cập nhật thì bỏ qua (hash được tính lại sau khi upstream chạy xong).
+    """
+    os.makedirs(RUNS_DIR, exist_ok=True)
+    state = load_state()
+    deps = dependencies(stages)
+    by_name = {s["name"]: s for s in stages}
+
+    pending = set(by_name) if only is None else set(only)
+    unknown = pending - set(by_name)
+    if unknown:
+        raise ValueError(f"Stage không tồn tại: {sorted(unknown)}")
+    done: set[str] = set(by_name) - pending
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        running = {}
+        while pending or running:
+            ready = [n for n in sorted(pending) if deps[n] <= done]
+            for name in ready:
+                pending.discard(name)
+                stage = by_name[name]
+                if not force and is_up_to_date(stage, state):
+                    print(f"[skip] {name} (không thay đổi)")
+                    done.add(name)
+                    continue
+                print(f"[run ] {name}")
+                running[executor.submit(run_stage, stage, instrument, instrument_memory)] = name
+
+            if not running:
+                if pending and not [n for n in pending if deps[n] <= done]:
+                    raise RuntimeError(f"Phụ thuộc vòng giữa các stage: {sorted(pending)}")
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                _, elapsed = future.result()
+                state[name] = stage_hash(by_name[name])
+                save_state(state)
+                done.add(name)
+                print(f"[done] {name} ({elapsed:.1f}s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chạy pipeline notebook (papermill) theo DAG có cache.")
+    parser.add_argument("--jobs", type=int, default=None, help="Số notebook chạy song song (mặc định: số CPU)")
+    parser.add_argument("--force", action="store_true", help="Chạy lại mọi stage, bỏ qua cache")
+    parser.add_argument("--only", nargs="+", default=None, help="Chỉ chạy các stage này")
+    parser.add_argument("--instrument", action="store_true", help="Ghi instrumentation log (thời gian từng method)")
+    parser.add_argument("--instrument-memory", action="store_true",
+                        help="Đo thêm peak memory bằng tracemalloc (chậm hơn đáng kể)")
+    args = parser.parse_args()
 
-print("Đã chạy xong pipeline")
\ No newline at end of file
+    run_pipeline(
+        STAGES,
+        jobs=args.jobs,
+        force=args.force,
+        only=args.only,
+        instrument=args.instrument or args.instrument_memory,
+        instrument_memory=args.instrument_memory,
+    )
+    print("Đã chạy xong pipeline")
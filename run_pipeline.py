@@ -0,0 +1,106 @@
+"""
+Chạy toàn bộ pipeline (làm sạch -> basket -> luật -> phân cụm) trong một
+process Python, không cần Jupyter kernel / papermill.
+
+Cách dùng:
+    python run_pipeline.py
+    python run_pipeline.py --algorithm fpgrowth --n-clusters 4 --save rules clusters model
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+
+from cluster_library import (  # noqa: E402
+    PIPELINE_ARTIFACTS,
+    InstrumentationCollector,
+    disable_instrumentation,
+    enable_instrumentation,
+    run_pipeline,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline phân cụm khách hàng từ luật kết hợp (không notebook).")
+    parser.add_argument("--data-path", default="data/raw/online_retail.csv")
+    parser.add_argument("--country", default="United Kingdom")
+    parser.add_argument("--output-dir", default="data/processed")
+    parser.add_argument("--save", nargs="*", default=["rules", "clusters"], choices=PIPELINE_ARTIFACTS,
+                        help="Artifact cần ghi ra output-dir (để trống = không ghi gì)")
+    parser.add_argument("--no-vocab", action="store_true", help="Không dùng Vocabulary id item")
+
+    # Khai phá luật
+    parser.add_argument("--algorithm", default="apriori", choices=["apriori", "fpgrowth", "eclat"])
+    parser.add_argument("--min-support", type=float, default=0.01)
+    parser.add_argument("--max-len", type=int, default=3)
+    parser.add_argument("--itemset-mode", default="all", choices=["all", "closed"],
+                        help="closed = chỉ sinh luật từ closed itemsets (bỏ luật dư thừa)")
+    parser.add_argument("--min-confidence", type=float, default=0.3)
+    parser.add_argument("--min-lift", type=float, default=1.2)
+    parser.add_argument("--max-antecedents", type=int, default=2)
+    parser.add_argument("--max-consequents", type=int, default=1)
+
+    # Phân cụm
+    parser.add_argument("--top-k-rules", type=int, default=200)
+    parser.add_argument("--sort-rules-by", default="lift")
+    parser.add_argument("--weighting", default="lift", choices=["none", "lift", "confidence", "support", "lift_x_conf"])
+    parser.add_argument("--min-antecedent-len", type=int, default=1)
+    parser.add_argument("--no-rfm", action="store_true")
+    parser.add_argument("--rule-scale", action="store_true")
+    parser.add_argument("--k-min", type=int, default=2)
+    parser.add_argument("--k-max", type=int, default=10)
+    parser.add_argument("--n-clusters", type=int, default=None)
+    parser.add_argument("--random-state", type=int, default=42)
+    parser.add_argument("--silhouette-sample-size", type=int, default=None)
+    parser.add_argument("--instrument", default=None, metavar="LOG_PATH",
+                        help="Ghi thời gian từng bước ra file .jsonl hoặc .csv")
+    parser.add_argument("--instrument-memory", action="store_true",
+                        help="Đo thêm peak memory khi --instrument (tracemalloc, chậm hơn đáng kể)")
+    args = parser.parse_args()
+
+    if args.instrument:
+        enable_instrumentation(InstrumentationCollector(), track_memory=args.instrument_memory)
+
+    result = run_pipeline(
+        data_path=args.data_path,
+        country=args.country,
+        use_vocab=not args.no_vocab,
+        algorithm=args.algorithm,
+        min_support=args.min_support,
+        max_len=args.max_len,
+        itemset_mode=args.itemset_mode,
+        min_confidence=args.min_confidence,
+        min_lift=args.min_lift,
+        max_len_antecedents=args.max_antecedents,
+        max_len_consequents=args.max_consequents,
+        top_k_rules=args.top_k_rules,
+        sort_rules_by=args.sort_rules_by,
+        weighting=args.weighting,
+        min_antecedent_len=args.min_antecedent_len,
+        use_rfm=not args.no_rfm,
+        rule_scale=args.rule_scale,
+        k_min=args.k_min,
+        k_max=args.k_max,
+        n_clusters=args.n_clusters,
+        random_state=args.random_state,
+        silhouette_sample_size=args.silhouette_sample_size,
+        output_dir=args.output_dir if args.save else None,
+        save=tuple(args.save),
+    )
+
+    if args.instrument:
+        collector = disable_instrumentation()
+        collector.save(args.instrument)
+        print(collector.summary().to_string(index=False))
+
+    clusters = result["clusters"]
+    print(f"Số luật: {len(result['rules']):,}")
+    print(f"Số khách hàng: {len(clusters):,}, số cụm: {clusters['cluster'].nunique()}")
+    print(clusters["cluster"].value_counts().sort_index().to_string())
+    print("Đã chạy xong pipeline")
+
+
+if __name__ == "__main__":
+    main()
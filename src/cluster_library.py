@@ -7,18 +7,36 @@ and association rule analysis for shopping cart.
 """
 
 import datetime as dt
+import functools
+import hashlib
+import inspect
+import itertools
+import json
 import os
+import shutil
+import tempfile
 import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import seaborn as sns
-from scipy import stats
+from pandas.api.types import union_categoricals
+from scipy import sparse, stats
 from mlxtend.frequent_patterns import apriori, fpgrowth, association_rules
 from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
-from sklearn.metrics import silhouette_score
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import (
+    calinski_harabasz_score,
+    davies_bouldin_score,
+    pairwise_distances_argmin,
+    silhouette_score,
+)
 from sklearn.decomposition import PCA, TruncatedSVD
 import plotly.express as px
 import networkx as nx
@@ -47,14 +65,32 @@ class DataCleaner:
         self.df = None
         self.df_uk = None
         self.rfm_data = None
+        self.rfm_state_ = None
+        self.vocab_ = None
 
-    def load_data(self):
+    def load_data(self, cache_path=None):
         """
         Load and display basic information about the dataset.
 
+        Args:
+            cache_path (str | None): File Parquet cache cho dữ liệu gốc. Nếu
+                cache mới hơn file CSV thì đọc từ cache, ngược lại đọc CSV rồi
+                ghi lại cache (None = luôn đọc CSV)
+
         Returns:
             pd.DataFrame: Loaded dataframe
         """
+        if (
+            cache_path is not None
+            and os.path.exists(cache_path)
+            and os.path.getmtime(cache_path) >= os.path.getmtime(self.data_path)
+        ):
+            self.df = pd.read_parquet(cache_path, engine="pyarrow")
+            print(f"Đọc dữ liệu gốc từ cache: {cache_path}")
+            print(f"Kích thước dữ liệu: {self.df.shape}")
+            print(f"Số bản ghi: {len(self.df):,}")
+            return self.df
+
         dtype = dict(
             InvoiceNo=np.object_,
             StockCode=np.object_,
@@ -80,11 +116,109 @@ class DataCleaner:
             .str.zfill(6)
         )
 
+        if cache_path is not None:
+            os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+            self.df.to_parquet(cache_path, engine="pyarrow", index=False)
+            print(f"Đã lưu cache dữ liệu gốc: {cache_path}")
+
         print(f"Kích thước dữ liệu: {self.df.shape}")
         print(f"Số bản ghi: {len(self.df):,}")
 
         return self.df
 
+    def load_data_chunked(
+        self,
+        chunksize: int = 500_000,
+        country: str = "United Kingdom",
+    ) -> pd.DataFrame:
+        """
+        Stream the raw CSV in chunks, applying the clean_data() filters per
+        chunk and keeping only surviving rows with compact dtypes.
+
+        Peak memory is bounded by chunksize instead of the full raw file.
+        InvoiceNo, StockCode, Description, CustomerID and Country are stored
+        as categoricals (CustomerID keeps the 6-character format of
+        load_data(), computed once per distinct value).
+
+        Args:
+            chunksize (int): Number of raw rows per chunk
+            country (str): Country to keep
+
+        Returns:
+            pd.DataFrame: Cleaned dataset (also stored in self.df_uk; self.df
+                points to the same frame since other rows are not kept)
+        """
+        dtype = dict(
+            InvoiceNo=str,
+            StockCode=str,
+            Description=str,
+            Quantity=np.int32,
+            UnitPrice=np.float64,
+            CustomerID=str,
+            Country=str,
+        )
+        cat_cols = ["InvoiceNo", "StockCode", "Description", "CustomerID", "Country"]
+
+        n_raw = 0
+        chunks = []
+        reader = pd.read_csv(
+            self.data_path,
+            encoding="ISO-8859-1",
+            parse_dates=["InvoiceDate"],
+            dtype=dtype,
+            chunksize=chunksize,
+        )
+        for chunk in reader:
+            n_raw += len(chunk)
+
+            # Cùng bộ lọc với clean_data()
+            chunk = chunk[
+                ~chunk["InvoiceNo"].str.startswith("C", na=False)
+                & (chunk["Country"] == country)
+                & (chunk["Quantity"] > 0)
+                & (chunk["UnitPrice"] > 0)
+                & chunk["Description"].notna()
+            ]
+            chunk = chunk.astype({c: "category" for c in cat_cols})
+            chunks.append(chunk)
+
+        if not chunks:
+            raise ValueError(f"Không đọc được dòng nào từ {self.data_path}.")
+
+        # Gộp categorical của các chunk (union categories, không về object)
+        df = pd.DataFrame(
+            {
+                col: (
+                    union_categoricals([c[col] for c in chunks])
+                    if col in cat_cols
+                    else pd.concat([c[col] for c in chunks], ignore_index=True)
+                )
+                for col in chunks[0].columns
+            }
+        )
+
+        # Chuyển CustomerID thành format 6 ký tự (chỉ trên các giá trị phân biệt)
+        customer_ids = df["CustomerID"].cat.add_categories(["nan"]).fillna("nan")
+        new_categories = (
+            pd.Index(customer_ids.cat.categories)
+            .str.replace(".0", "", regex=False)
+            .str.zfill(6)
+        )
+        unique_ids, remap = np.unique(np.asarray(new_categories, dtype=str), return_inverse=True)
+        df["CustomerID"] = pd.Categorical.from_codes(
+            remap[customer_ids.cat.codes.to_numpy()], categories=unique_ids
+        )
+
+        df["TotalPrice"] = df["Quantity"] * df["UnitPrice"]
+
+        self.df_uk = df
+        self.df = df
+
+        print(f"Số bản ghi thô: {n_raw:,}")
+        print(f"Kích thước dữ liệu sau làm sạch: {df.shape}")
+
+        return self.df_uk
+
     def clean_data(self):
         """
         Clean the dataset by removing invalid records and focusing on UK customers.
@@ -114,6 +248,21 @@ class DataCleaner:
 
         return self.df_uk
 
+    def build_vocabulary(self, item_col="Description", customer_col="CustomerID"):
+        """
+        Build the shared item/customer Vocabulary from cleaned UK data.
+
+        Returns:
+            Vocabulary: Integer id mapping used by every later stage
+        """
+        if self.df_uk is None:
+            raise ValueError("Cleaned UK data not available. Call clean_data() first.")
+
+        self.vocab_ = Vocabulary.from_transactions(
+            self.df_uk, item_col=item_col, customer_col=customer_col
+        )
+        return self.vocab_
+
     def create_time_features(self):
         """
         Create time-based features for analysis.
@@ -149,55 +298,408 @@ class DataCleaner:
         if self.df_uk is None:
             raise ValueError("Cleaned UK data not available. Call clean_data() first.")
 
-        df = self.df_uk.copy()
+        # Gom nhóm vectorized (không copy df_uk, không lambda theo nhóm);
+        # giữ lại state để cập nhật tăng dần bằng rfm_state_.update()
+        self.rfm_state_ = RFMState.from_transactions(self.df_uk)
+        self.rfm_data = self.rfm_state_.rfm(snapshot_date)
+        return self.rfm_data
 
-        # Đảm bảo có TotalPrice
-        if "TotalPrice" not in df.columns:
-            df["TotalPrice"] = df["Quantity"] * df["UnitPrice"]
+    def save_cleaned_data(self, output_dir="../data/processed", file_format="parquet"):
+        """
+        Save cleaned data to specified directory.
 
-        # Xác định snapshot_date
-        if snapshot_date is None:
-            snapshot_date = df["InvoiceDate"].max() + pd.Timedelta(days=1)
+        Args:
+            output_dir (str): Output directory path
+            file_format (str): "parquet" (dataset cleaned_uk_data.parquet/ phân
+                vùng theo Country và InvoiceMonth, đọc lại bằng
+                load_cleaned_transactions()) hoặc "csv" (cleaned_uk_data.csv)
+        """
+        if self.df_uk is None:
+            raise ValueError("Cleaned UK data not available. Call clean_data() first.")
+
+        os.makedirs(output_dir, exist_ok=True)
+
+        if file_format == "parquet":
+            output_path = f"{output_dir}/cleaned_uk_data.parquet"
+            df = self.df_uk.copy()
+            df["InvoiceMonth"] = df["InvoiceDate"].dt.strftime("%Y-%m")
+            for col in ["InvoiceNo", "StockCode", "Description", "CustomerID"]:
+                if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+                    df[col] = df[col].astype("category")
+            # ghi vào thư mục tạm rồi thay thế toàn bộ dataset cũ (không để sót
+            # phân vùng Country / InvoiceMonth của lần lưu trước)
+            tmp_path = tempfile.mkdtemp(prefix=".cleaned_uk_data.", dir=output_dir)
+            try:
+                df.to_parquet(
+                    tmp_path,
+                    engine="pyarrow",
+                    index=False,
+                    partition_cols=["Country", "InvoiceMonth"],
+                )
+                if os.path.isdir(output_path):
+                    shutil.rmtree(output_path)
+                os.replace(tmp_path, output_path)
+            except BaseException:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                raise
+        elif file_format == "csv":
+            output_path = f"{output_dir}/cleaned_uk_data.csv"
+            self.df_uk.to_csv(output_path, index=False)
         else:
-            # Cho phép truyền vào dạng string 'YYYY-MM-DD'
-            if isinstance(snapshot_date, str):
-                snapshot_date = pd.to_datetime(snapshot_date)
+            raise ValueError("file_format phải là 'csv' hoặc 'parquet'.")
+
+        print(f"Đã lưu dữ liệu đã làm sạch: {output_path}")
+
 
-        # Tính RFM
-        rfm = df.groupby("CustomerID").agg(
+def load_cleaned_transactions(
+    path: str,
+    columns: list = None,
+    countries: list = None,
+    start_date=None,
+    end_date=None,
+) -> pd.DataFrame:
+    """
+    Đọc dữ liệu đã làm sạch, chỉ lấy các cột và phân vùng cần thiết.
+
+    - Với dataset Parquet (save_cleaned_data(file_format="parquet")): lọc
+      Country/InvoiceMonth bằng partition pruning và InvoiceDate bằng
+      predicate push-down của pyarrow.
+    - Với file CSV: đọc như cũ rồi lọc trong pandas.
+
+    Args:
+        path (str): Đường dẫn cleaned_uk_data.parquet/ hoặc cleaned_uk_data.csv
+        columns (list | None): Các cột cần đọc (None = tất cả)
+        countries (list | None): Chỉ lấy các quốc gia này
+        start_date (str | datetime | None): InvoiceDate >= start_date
+        end_date (str | datetime | None): InvoiceDate < end_date
+
+    Returns:
+        pd.DataFrame: Transaction-level dataframe
+    """
+    start_date = pd.to_datetime(start_date) if start_date is not None else None
+    end_date = pd.to_datetime(end_date) if end_date is not None else None
+
+    if str(path).endswith(".csv"):
+        df = pd.read_csv(path, parse_dates=["InvoiceDate"])
+        if countries is not None:
+            df = df[df["Country"].isin(countries)]
+        if start_date is not None:
+            df = df[df["InvoiceDate"] >= start_date]
+        if end_date is not None:
+            df = df[df["InvoiceDate"] < end_date]
+        if columns is not None:
+            df = df[list(columns)]
+        return df.reset_index(drop=True)
+
+    filters = []
+    if countries is not None:
+        filters.append(("Country", "in", list(countries)))
+    if start_date is not None:
+        filters.append(("InvoiceMonth", ">=", start_date.strftime("%Y-%m")))
+        filters.append(("InvoiceDate", ">=", start_date))
+    if end_date is not None:
+        filters.append(("InvoiceMonth", "<=", end_date.strftime("%Y-%m")))
+        filters.append(("InvoiceDate", "<", end_date))
+
+    read_columns = None
+    if columns is not None:
+        read_columns = list(columns)
+
+    df = pd.read_parquet(
+        path,
+        engine="pyarrow",
+        columns=read_columns,
+        filters=filters or None,
+    )
+    if columns is None and "InvoiceMonth" in df.columns:
+        df = df.drop(columns="InvoiceMonth")
+    return df.reset_index(drop=True)
+
+
+class Vocabulary:
+    """
+    Từ điển dùng chung ánh xạ item và customer (chuỗi) sang id số nguyên
+    int32 liên tục (0..n-1).
+
+    Được tạo một lần từ dữ liệu đã làm sạch (DataCleaner.build_vocabulary())
+    và dùng lại ở mọi bước: basket, itemsets, luật và ma trận khách hàng chỉ
+    mang id; chuỗi chỉ được gắn vào khi hiển thị (decode_items).
+    """
+
+    def __init__(self, items, customers=None):
+        """
+        Initialize the Vocabulary.
+
+        Args:
+            items (iterable): Danh sách item (id = vị trí trong danh sách)
+            customers (iterable | None): Danh sách customer
+        """
+        self.items = pd.Index(items, dtype=object)
+        self.customers = pd.Index([] if customers is None else customers, dtype=object)
+        if not self.items.is_unique or not self.customers.is_unique:
+            raise ValueError("Vocabulary items/customers phải là duy nhất.")
+
+    @classmethod
+    def from_transactions(
+        cls,
+        df: pd.DataFrame,
+        item_col: str = "Description",
+        customer_col: str = "CustomerID",
+    ) -> "Vocabulary":
+        """Tạo vocabulary (đã sắp xếp) từ transaction-level dataframe."""
+        items = np.sort(df[item_col].dropna().astype(str).unique())
+        customers = None
+        if customer_col is not None and customer_col in df.columns:
+            customers = np.sort(df[customer_col].dropna().astype(str).unique())
+        return cls(items, customers)
+
+    @property
+    def n_items(self) -> int:
+        return len(self.items)
+
+    @property
+    def n_customers(self) -> int:
+        return len(self.customers)
+
+    def encode_items(self, values) -> np.ndarray:
+        """Chuỗi item -> id int32 (-1 nếu không có trong vocabulary)."""
+        return self.items.get_indexer(pd.Index(values).astype(str)).astype(np.int32)
+
+    def decode_items(self, ids) -> np.ndarray:
+        """Id item -> chuỗi item."""
+        return self.items.to_numpy()[np.asarray(ids, dtype=np.int64)]
+
+    def encode_customers(self, values) -> np.ndarray:
+        """Chuỗi customer -> id int32 (-1 nếu không có trong vocabulary)."""
+        return self.customers.get_indexer(pd.Index(values).astype(str)).astype(np.int32)
+
+    def decode_customers(self, ids) -> np.ndarray:
+        """Id customer -> chuỗi customer."""
+        return self.customers.to_numpy()[np.asarray(ids, dtype=np.int64)]
+
+    def itemset_to_str(self, itemset) -> str:
+        """Itemset id -> chuỗi "A, B, C" (tên đã sắp xếp) để hiển thị."""
+        return ", ".join(sorted(self.decode_items(sorted(itemset))))
+
+    def save(self, path: str):
+        """Lưu vocabulary ra JSON."""
+        out_dir = os.path.dirname(path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"items": self.items.tolist(), "customers": self.customers.tolist()},
+                f,
+                ensure_ascii=False,
+            )
+        print(f"Đã lưu vocabulary: {path}")
+
+    @classmethod
+    def load(cls, path: str) -> "Vocabulary":
+        """Đọc vocabulary từ JSON."""
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["items"], data.get("customers"))
+
+
+class RFMState:
+    """
+    Trạng thái RFM theo khách hàng, cập nhật tăng dần từ giao dịch mới.
+
+    Chỉ lưu ngày mua cuối, số hoá đơn và tổng chi tiêu của từng khách; Recency
+    được tính lại cho bất kỳ snapshot_date nào. update() chỉ gom nhóm phần
+    giao dịch mới, không đọc lại lịch sử.
+
+    Để không đếm trùng Frequency khi một hoá đơn nằm ở hai lô liên tiếp, state
+    chỉ giữ các hoá đơn còn "mở": ngày hoá đơn >= max_date_ - invoice_window.
+    Hoá đơn cũ hơn cửa sổ này được coi là đã đóng và bị bỏ khỏi state.
+    """
+
+    def __init__(
+        self,
+        customer_col: str = "CustomerID",
+        invoice_col: str = "InvoiceNo",
+        date_col: str = "InvoiceDate",
+        quantity_col: str = "Quantity",
+        price_col: str = "UnitPrice",
+        invoice_window_days: float = 1.0,
+    ):
+        self.customer_col = customer_col
+        self.invoice_col = invoice_col
+        self.date_col = date_col
+        self.quantity_col = quantity_col
+        self.price_col = price_col
+        self.invoice_window_days = invoice_window_days
+
+        self.state = pd.DataFrame(
             {
-                "InvoiceDate": lambda x: (snapshot_date - x.max()).days,  # Recency
-                "InvoiceNo": "nunique",  # Frequency
-                "TotalPrice": "sum",     # Monetary
-            }
+                "last_purchase": pd.Series(dtype="datetime64[ns]"),
+                "frequency": pd.Series(dtype=np.int64),
+                "monetary": pd.Series(dtype=np.float64),
+            },
+            index=pd.Index([], name=customer_col, dtype=object),
+        )
+        # hoá đơn còn mở: số hoá đơn (str) -> ngày giao dịch cuối của hoá đơn
+        self.open_invoices_ = pd.Series(
+            dtype="datetime64[ns]", index=pd.Index([], name=invoice_col, dtype=object)
+        )
+        self.max_date_: pd.Timestamp | None = None
+
+    @classmethod
+    def from_transactions(cls, df: pd.DataFrame, **columns) -> "RFMState":
+        """Tạo state từ toàn bộ giao dịch (một lần update)."""
+        return cls(**columns).update(df)
+
+    def _delta(self, new_transactions: pd.DataFrame) -> pd.DataFrame:
+        """Gom nhóm giao dịch mới theo khách: ngày mua cuối, số hoá đơn mới, tổng tiền."""
+        dates = pd.to_datetime(new_transactions[self.date_col])
+        if "TotalPrice" in new_transactions.columns:
+            amount = new_transactions["TotalPrice"].to_numpy(dtype=np.float64)
+        else:
+            amount = (
+                new_transactions[self.quantity_col].to_numpy(dtype=np.float64)
+                * new_transactions[self.price_col].to_numpy(dtype=np.float64)
+            )
+        slim = pd.DataFrame({
+            self.customer_col: new_transactions[self.customer_col].to_numpy(),
+            # so sánh số hoá đơn dạng str (CSV có thể đọc ra int hoặc str)
+            self.invoice_col: new_transactions[self.invoice_col].astype(str).to_numpy(),
+            "last_purchase": dates.to_numpy(),
+            "monetary": amount,
+        })
+
+        grouped = slim.groupby(self.customer_col, sort=False)
+        delta = grouped.agg(last_purchase=("last_purchase", "max"), monetary=("monetary", "sum"))
+
+        # Frequency: chỉ đếm hoá đơn chưa thấy trong các hoá đơn còn mở
+        pairs = slim[[self.customer_col, self.invoice_col]].drop_duplicates()
+        new_pairs = pairs[~pairs[self.invoice_col].isin(self.open_invoices_.index)]
+        delta["frequency"] = (
+            new_pairs.groupby(self.customer_col, sort=False).size()
+            .reindex(delta.index, fill_value=0).astype(np.int64)
         )
 
-        rfm.rename(
-            columns={
-                "InvoiceDate": "Recency",
-                "InvoiceNo": "Frequency",
-                "TotalPrice": "Monetary",
-            },
-            inplace=True,
+        invoice_dates = slim.groupby(self.invoice_col, sort=False)["last_purchase"].max()
+        self.open_invoices_ = (
+            pd.concat([self.open_invoices_, invoice_dates]).groupby(level=0, sort=False).max()
         )
+        return delta
 
-        self.rfm_data = rfm.reset_index()
-        return self.rfm_data
+    def _prune_invoices(self):
+        """Bỏ các hoá đơn cũ hơn cửa sổ invoice_window_days (không thể còn nối sang lô sau)."""
+        cutoff = self.max_date_ - pd.Timedelta(days=self.invoice_window_days)
+        self.open_invoices_ = self.open_invoices_[self.open_invoices_ >= cutoff]
+        self.open_invoices_.index.name = self.invoice_col
 
-    def save_cleaned_data(self, output_dir="../data/processed"):
+    def update(self, new_transactions: pd.DataFrame) -> "RFMState":
         """
-        Save cleaned data to specified directory.
+        Gộp một lô giao dịch mới (vd dữ liệu trong ngày) vào state.
 
         Args:
-            output_dir (str): Output directory path
+            new_transactions (pd.DataFrame): Giao dịch đã làm sạch, cần các cột
+                customer / invoice / date và TotalPrice (hoặc quantity + price)
+
+        Returns:
+            RFMState: self
         """
-        if self.df_uk is None:
-            raise ValueError("Cleaned UK data not available. Call clean_data() first.")
+        if new_transactions.shape[0] == 0:
+            return self
+
+        delta = self._delta(new_transactions)
+        batch_max = delta["last_purchase"].max()
+        self.max_date_ = batch_max if self.max_date_ is None else max(self.max_date_, batch_max)
+        self._prune_invoices()
+
+        if self.state.shape[0] == 0:
+            self.state = delta[["last_purchase", "frequency", "monetary"]]
+            self.state.index.name = self.customer_col
+            return self
+
+        pos = self.state.index.get_indexer(delta.index)
+        known = pos >= 0
+        if known.any():
+            rows = pos[known]
+            old = self.state.iloc[rows]
+            known_delta = delta.iloc[np.flatnonzero(known)]
+            self.state.iloc[rows, self.state.columns.get_loc("last_purchase")] = np.maximum(
+                old["last_purchase"].to_numpy(), known_delta["last_purchase"].to_numpy()
+            )
+            self.state.iloc[rows, self.state.columns.get_loc("frequency")] = (
+                old["frequency"].to_numpy() + known_delta["frequency"].to_numpy()
+            )
+            self.state.iloc[rows, self.state.columns.get_loc("monetary")] = (
+                old["monetary"].to_numpy() + known_delta["monetary"].to_numpy()
+            )
+        if (~known).any():
+            self.state = pd.concat(
+                [self.state, delta.loc[~known, ["last_purchase", "frequency", "monetary"]]]
+            )
+            self.state.index.name = self.customer_col
+        return self
+
+    def rfm(self, snapshot_date=None) -> pd.DataFrame:
+        """
+        RFM tại snapshot_date (mặc định: ngày giao dịch cuối + 1 ngày).
+
+        Returns:
+            pd.DataFrame: [CustomerID, Recency, Frequency, Monetary], sort theo khách
+        """
+        if snapshot_date is None:
+            if self.max_date_ is None:
+                raise ValueError("RFM state rỗng. Hãy gọi update() trước.")
+            snapshot_date = self.max_date_ + pd.Timedelta(days=1)
+        else:
+            snapshot_date = pd.to_datetime(snapshot_date)
+
+        state = self.state.sort_index()
+        rfm = pd.DataFrame(
+            {
+                "Recency": (snapshot_date - state["last_purchase"]).dt.days.astype(np.int64),
+                "Frequency": state["frequency"].astype(np.int64),
+                "Monetary": state["monetary"].astype(np.float64),
+            },
+            index=state.index,
+        )
+        return rfm.reset_index()
 
+    def save(self, output_dir: str):
+        """Lưu state ra thư mục: state.parquet, invoices.parquet (hoá đơn còn mở), meta.json."""
         os.makedirs(output_dir, exist_ok=True)
-        output_path = f"{output_dir}/cleaned_uk_data.csv"
-        self.df_uk.to_csv(output_path, index=False)
-        print(f"Đã lưu dữ liệu đã làm sạch: {output_path}")
+        self.state.reset_index().to_parquet(os.path.join(output_dir, "state.parquet"), index=False)
+        self.open_invoices_.rename("last_seen").reset_index().to_parquet(
+            os.path.join(output_dir, "invoices.parquet"), index=False
+        )
+        meta = {
+            "columns": {
+                "customer_col": self.customer_col,
+                "invoice_col": self.invoice_col,
+                "date_col": self.date_col,
+                "quantity_col": self.quantity_col,
+                "price_col": self.price_col,
+                "invoice_window_days": self.invoice_window_days,
+            },
+            "max_date": None if self.max_date_ is None else self.max_date_.isoformat(),
+        }
+        with open(os.path.join(output_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        print(f"Đã lưu RFM state: {output_dir}")
+
+    @classmethod
+    def load(cls, model_dir: str) -> "RFMState":
+        """Đọc state đã lưu bằng save()."""
+        with open(os.path.join(model_dir, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        rfm_state = cls(**meta["columns"])
+        state = pd.read_parquet(os.path.join(model_dir, "state.parquet"))
+        rfm_state.state = state.set_index(rfm_state.customer_col)
+        invoices = pd.read_parquet(os.path.join(model_dir, "invoices.parquet"))
+        rfm_state.open_invoices_ = pd.Series(
+            pd.to_datetime(invoices["last_seen"]).to_numpy(),
+            index=pd.Index(invoices[rfm_state.invoice_col].astype(str), name=rfm_state.invoice_col),
+        )
+        if meta["max_date"] is not None:
+            rfm_state.max_date_ = pd.Timestamp(meta["max_date"])
+        return rfm_state
 
 
 # =========================================================
@@ -218,6 +720,7 @@ class BasketPreparer:
         invoice_col: str = "InvoiceNo",
         item_col: str = "Description",
         quantity_col: str = "Quantity",
+        vocab: Vocabulary = None,
     ):
         """
         Initialize the BasketPreparer with cleaned dataframe.
@@ -227,14 +730,46 @@ class BasketPreparer:
             invoice_col (str): Column name for invoice number
             item_col (str): Column name for item description
             quantity_col (str): Column name for item quantity
+            vocab (Vocabulary | None): Nếu có, encode_basket_sparse() dùng id
+                item của vocabulary làm tên cột (itemsets/luật mang id)
         """
         self.df = df
         self.invoice_col = invoice_col
         self.item_col = item_col
         self.quantity_col = quantity_col
+        self.vocab = vocab
         self.basket = None
         self.basket_bool = None
 
+        # artifacts của chế độ sparse
+        self.basket_csr = None
+        self.invoices_ = None
+        self.items_ = None
+
+    @classmethod
+    def from_cleaned_data(
+        cls,
+        path: str,
+        invoice_col: str = "InvoiceNo",
+        item_col: str = "Description",
+        quantity_col: str = "Quantity",
+        **filters,
+    ) -> "BasketPreparer":
+        """
+        Tạo BasketPreparer từ dữ liệu đã làm sạch, chỉ đọc 3 cột cần dùng.
+
+        Args:
+            path (str): cleaned_uk_data.parquet/ hoặc cleaned_uk_data.csv
+            **filters: countries / start_date / end_date cho
+                load_cleaned_transactions()
+        """
+        df = load_cleaned_transactions(
+            path,
+            columns=[invoice_col, item_col, quantity_col],
+            **filters,
+        )
+        return cls(df, invoice_col=invoice_col, item_col=item_col, quantity_col=quantity_col)
+
     def create_basket(self):
         """
         Create a basket format dataframe for Apriori algorithm.
@@ -244,7 +779,7 @@ class BasketPreparer:
         """
 
         basket = (
-            self.df.groupby([self.invoice_col, self.item_col])[self.quantity_col]
+            self.df.groupby([self.invoice_col, self.item_col], observed=True)[self.quantity_col]
             .sum()
             .unstack()
             .fillna(0)
@@ -266,24 +801,179 @@ class BasketPreparer:
 
         if self.basket is None:
             raise ValueError("Basket not created. Please run create_basket() first.")
-        basket_bool = self.basket.applymap(lambda x: 1 if x >= threshold else 0)
-        basket_bool = basket_bool.astype(bool)
+        basket_bool = self.basket >= threshold
         self.basket_bool = basket_bool
+        self.basket_csr = None
+        return self.basket_bool
+
+    def encode_basket_sparse(self, threshold: int = 1) -> pd.DataFrame:
+        """
+        Encode the basket into a sparse boolean format without building the
+        dense Invoice × Item table.
+
+        (invoice, item) pairs are integer-coded with pd.factorize and summed
+        directly into a scipy.sparse CSR matrix; only cells with total
+        quantity >= threshold are kept.
+
+        Args:
+            threshold (int): Minimum quantity to consider an item as present
+
+        Returns:
+            pd.DataFrame: Boolean basket with pandas sparse dtype
+                (accepted directly by mlxtend apriori/fpgrowth)
+        """
+        invoice_codes, invoices = pd.factorize(self.df[self.invoice_col], sort=True)
+        if self.vocab is not None:
+            # cột = id item của vocabulary dùng chung
+            item_codes = self.vocab.encode_items(self.df[self.item_col])
+            items = pd.RangeIndex(self.vocab.n_items)
+        else:
+            item_codes, items = pd.factorize(self.df[self.item_col], sort=True)
+        quantity = self.df[self.quantity_col].to_numpy(dtype=np.float64)
+
+        # factorize trả về -1 cho giá trị NA (groupby cũng bỏ các dòng này)
+        valid = (invoice_codes >= 0) & (item_codes >= 0)
+
+        # csr_matrix tự cộng dồn các cặp (invoice, item) trùng lặp
+        basket_qty = sparse.csr_matrix(
+            (quantity[valid], (invoice_codes[valid], item_codes[valid])),
+            shape=(len(invoices), len(items)),
+        )
+        basket_qty.data = (basket_qty.data >= threshold).astype(np.float64)
+        basket_qty.eliminate_zeros()
+        basket_csr = basket_qty.astype(bool)
+
+        self.basket_csr = basket_csr
+        self.invoices_ = pd.Index(invoices, name=self.invoice_col)
+        if self.vocab is not None:
+            self.items_ = pd.Index(items, name=self.item_col)
+        else:
+            self.items_ = pd.Index(items.astype(str), name=self.item_col)
+
+        self.basket_bool = pd.DataFrame.sparse.from_spmatrix(
+            basket_csr,
+            index=self.invoices_,
+            columns=self.items_,
+        )
         return self.basket_bool
 
     def save_basket_bool(self, output_path: str):
         """
-        Save the boolean encoded basket dataframe to a Parquet file.
+        Save the boolean encoded basket to a Parquet file in long format.
+
+        Chỉ ghi các ô = 1 dưới dạng cặp (invoice, item) int32; nhãn hoá đơn /
+        item được ghi thành dữ liệu trong file đi kèm (basket_labels_path()),
+        schema metadata chỉ giữ các giá trị vô hướng. Không dựng bảng dense
+        Invoice × Item. Đọc lại bằng load_basket_bool().
 
         Args:
             output_path (str): Path to save the Parquet file
         """
         if self.basket_bool is None:
             raise ValueError("Basket not encoded. Please call encode_basket() first.")
-        basket_bool_to_save = self.basket_bool.reset_index(drop=True)
 
-        basket_bool_to_save.to_parquet(output_path, index=False)
-        print(f"Đã lưu basket boolean: {output_path}")
+        if self.basket_csr is not None:
+            coo = self.basket_csr.tocoo()
+            rows, cols = coo.row, coo.col
+        elif hasattr(self.basket_bool, "sparse"):
+            coo = self.basket_bool.sparse.to_coo()
+            keep = coo.data.astype(bool)
+            rows, cols = coo.row[keep], coo.col[keep]
+        else:
+            rows, cols = np.nonzero(self.basket_bool.to_numpy(dtype=bool))
+
+        invoices = self.basket_bool.index.astype(str)
+        items = self.basket_bool.columns
+        item_label_type = "int" if pd.api.types.is_integer_dtype(items.dtype) else "str"
+
+        # nhãn: một bảng dài (axis, label), axis = "invoice" | "item" theo đúng thứ tự mã
+        labels_path = basket_labels_path(output_path)
+        labels = pa.table(
+            {
+                "axis": pa.DictionaryArray.from_arrays(
+                    pa.array(np.repeat([0, 1], [len(invoices), len(items)]).astype(np.int8)),
+                    pa.array(["invoice", "item"]),
+                ),
+                "label": pa.array(np.concatenate([invoices.to_numpy(), items.astype(str).to_numpy()])),
+            }
+        )
+        pq.write_table(labels, labels_path)
+
+        table = pa.table(
+            {
+                "invoice": pa.array(np.asarray(rows, dtype=np.int32)),
+                "item": pa.array(np.asarray(cols, dtype=np.int32)),
+            }
+        )
+        metadata = {
+            "basket_labels": os.path.basename(labels_path),
+            "basket_n_invoices": str(len(invoices)),
+            "basket_n_items": str(len(items)),
+            "basket_item_label_type": item_label_type,
+            "basket_invoice_col": json.dumps(self.basket_bool.index.name),
+            "basket_item_col": json.dumps(self.basket_bool.columns.name),
+        }
+        table = table.replace_schema_metadata({k: v.encode("utf-8") for k, v in metadata.items()})
+        pq.write_table(table, output_path)
+        print(f"Đã lưu basket boolean: {output_path} (nhãn: {labels_path})")
+
+
+def basket_labels_path(path: str) -> str:
+    """File nhãn hoá đơn / item đi kèm basket Parquet (basket_bool.parquet -> basket_bool.labels.parquet)."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.labels{ext or '.parquet'}"
+
+
+def load_basket_bool(path: str) -> pd.DataFrame:
+    """
+    Đọc basket đã lưu bằng BasketPreparer.save_basket_bool() thành DataFrame
+    boolean kiểu pandas sparse (đưa thẳng vào các miner), không qua bảng dense.
+
+    File basket dạng bảng rộng cũ (mỗi item một cột) vẫn đọc được.
+
+    Args:
+        path (str): Đường dẫn file .parquet
+
+    Returns:
+        pd.DataFrame: Boolean basket (Invoice × Item) với pandas sparse dtype
+    """
+    table = pq.read_table(path)
+    metadata = table.schema.metadata or {}
+    if b"basket_labels" not in metadata:
+        wide = table.to_pandas()
+        return pd.DataFrame.sparse.from_spmatrix(
+            sparse.csr_matrix(wide.to_numpy(dtype=bool)), index=wide.index, columns=wide.columns
+        )
+
+    n_invoices = int(metadata[b"basket_n_invoices"])
+    n_items = int(metadata[b"basket_n_items"])
+    invoice_col = json.loads(metadata[b"basket_invoice_col"].decode("utf-8"))
+    item_col = json.loads(metadata[b"basket_item_col"].decode("utf-8"))
+
+    labels_file = os.path.join(os.path.dirname(path), metadata[b"basket_labels"].decode("utf-8"))
+    labels = pq.read_table(labels_file).column("label").to_numpy(zero_copy_only=False)
+    if len(labels) != n_invoices + n_items:
+        raise ValueError(f"File nhãn {labels_file} không khớp với basket {path}.")
+    invoices = labels[:n_invoices]
+    items = labels[n_invoices:]
+    if metadata[b"basket_item_label_type"] == b"int":
+        items = items.astype(np.int64)
+
+    basket_csr = sparse.csr_matrix(
+        (
+            np.ones(table.num_rows, dtype=bool),
+            (
+                table.column("invoice").to_numpy().astype(np.int64),
+                table.column("item").to_numpy().astype(np.int64),
+            ),
+        ),
+        shape=(n_invoices, n_items),
+    )
+    return pd.DataFrame.sparse.from_spmatrix(
+        basket_csr,
+        index=pd.Index(invoices, name=invoice_col),
+        columns=pd.Index(items, name=item_col),
+    )
 
 
 # =========================================================
@@ -298,15 +988,19 @@ class AssociationRulesMiner:
     association rules based on specified metrics.
     """
 
-    def __init__(self, basket_bool: pd.DataFrame):
+    def __init__(self, basket_bool: pd.DataFrame, cache: "ItemsetCache" = None):
         """
         Initialize the AssociationRulesMiner with basket data.
 
         Args:
             basket_bool (pd.DataFrame): Boolean encoded basket dataframe
+            cache (ItemsetCache | None): Cache frequent itemsets trên đĩa
+                (None = không dùng cache)
         """
         self.basket_bool = basket_bool
+        self.cache = cache
         self.frequent_itemsets = None
+        self.itemset_mode = "all"
         self.rules = None
 
     def mine_frequent_itemsets(
@@ -314,23 +1008,53 @@ class AssociationRulesMiner:
         min_support: float = 0.01,
         max_len: int = None,
         use_colnames: bool = True,
+        n_partitions: int = None,
+        n_jobs: int = None,
+        mode: str = "all",
     ) -> pd.DataFrame:
         """
         Mine frequent itemsets using the Apriori algorithm.
 
+        Args:
+            n_partitions (int | None): Nếu > 1, chia hoá đơn thành n_partitions
+                phân vùng và khai phá song song theo SON
+                (xem mine_frequent_itemsets_son)
+            n_jobs (int | None): Số process cho chế độ SON (None = số CPU)
+            mode (str): "all", "closed" hoặc "maximal" (xem condense_itemsets);
+                cache luôn lưu toàn bộ itemsets, việc rút gọn làm sau
+
         Returns:
             pd.DataFrame: DataFrame of frequent itemsets
         """
 
-        fi = apriori(
-            self.basket_bool,
-            min_support=min_support,
-            use_colnames=use_colnames,
-            max_len=max_len,
-        )
+        def _mine():
+            if n_partitions is not None and n_partitions > 1:
+                return mine_frequent_itemsets_son(
+                    self.basket_bool,
+                    algorithm="apriori",
+                    min_support=min_support,
+                    max_len=max_len,
+                    use_colnames=use_colnames,
+                    n_partitions=n_partitions,
+                    n_jobs=n_jobs,
+                )
+            return apriori(
+                self.basket_bool,
+                min_support=min_support,
+                use_colnames=use_colnames,
+                max_len=max_len,
+            )
+
+        if self.cache is not None:
+            fi = self.cache.fetch_or_mine(
+                self.basket_bool, "apriori", _mine, min_support, max_len, use_colnames
+            )
+        else:
+            fi = _mine()
 
         fi.sort_values(by="support", ascending=False, inplace=True)
-        self.frequent_itemsets = fi
+        self.frequent_itemsets = condense_itemsets(fi, mode)
+        self.itemset_mode = mode
         return self.frequent_itemsets
 
     def generate_rules(
@@ -354,25 +1078,79 @@ class AssociationRulesMiner:
                 "Frequent itemsets not mined. Please run mine_frequent_itemsets() first."
             )
 
-        rules = association_rules(
-            self.frequent_itemsets,
-            metric=metric,
-            min_threshold=min_threshold,
-        )
+        if self.itemset_mode == "maximal":
+            raise ValueError(
+                "Maximal itemsets không còn support của tập con. "
+                "Dùng mine_frequent_itemsets(mode='closed') để sinh luật."
+            )
+        if self.itemset_mode == "closed":
+            # sinh luật từ closed itemsets, support tập con suy ra từ closed superset
+            rules = generate_rules_constrained(
+                self.frequent_itemsets, metrics=RULE_METRICS, closed=True
+            )
+            rules = rules[rules[metric] >= min_threshold]
+        else:
+            rules = association_rules(
+                self.frequent_itemsets,
+                metric=metric,
+                min_threshold=min_threshold,
+            )
 
         rules = rules.sort_values(["lift", "confidence"], ascending=False)
         self.rules = rules
         return self.rules
 
+    def generate_rules_constrained(
+        self,
+        max_len_antecedents: int = None,
+        max_len_consequents: int = None,
+        min_support: float = None,
+        min_confidence: float = None,
+        min_lift: float = None,
+        metrics: tuple = ("antecedent support", "consequent support", "support", "confidence", "lift"),
+    ) -> pd.DataFrame:
+        """
+        Generate rules with length/confidence/lift constraints pushed into the
+        enumeration (xem generate_rules_constrained ở mức module).
+
+        Returns:
+            pd.DataFrame: DataFrame of association rules
+        """
+        if self.frequent_itemsets is None:
+            raise ValueError(
+                "Frequent itemsets not mined. Please run mine_frequent_itemsets() first."
+            )
+        if self.itemset_mode == "maximal":
+            raise ValueError(
+                "Maximal itemsets không còn support của tập con. "
+                "Dùng mine_frequent_itemsets(mode='closed') để sinh luật."
+            )
+
+        self.rules = generate_rules_constrained(
+            self.frequent_itemsets,
+            max_len_antecedents=max_len_antecedents,
+            max_len_consequents=max_len_consequents,
+            min_support=min_support,
+            min_confidence=min_confidence,
+            min_lift=min_lift,
+            metrics=metrics,
+            closed=self.itemset_mode == "closed",
+        )
+        return self.rules
+
     @staticmethod
     def _frozenset_to_str(fs: frozenset) -> str:
         return ", ".join(sorted(list(fs)))
 
-    def add_readable_rule_str(self) -> pd.DataFrame:
+    def add_readable_rule_str(self, vocab: Vocabulary = None) -> pd.DataFrame:
         """
         Add human-readable columns for antecedents, consequents, and rule_str
         to the rules dataframe.
 
+        Args:
+            vocab (Vocabulary | None): Nếu itemsets mang id item, giải mã sang
+                tên để hiển thị và thêm cột antecedent_ids / consequent_ids
+
         Returns:
             pd.DataFrame: Rules dataframe with extra readable columns
         """
@@ -380,8 +1158,14 @@ class AssociationRulesMiner:
             raise ValueError("rules is not available. Call generate_rules() first.")
 
         rules = self.rules.copy()
-        rules["antecedents_str"] = rules["antecedents"].apply(self._frozenset_to_str)
-        rules["consequents_str"] = rules["consequents"].apply(self._frozenset_to_str)
+        if vocab is not None:
+            rules["antecedent_ids"] = rules["antecedents"].apply(sorted)
+            rules["consequent_ids"] = rules["consequents"].apply(sorted)
+            rules["antecedents_str"] = rules["antecedents"].apply(vocab.itemset_to_str)
+            rules["consequents_str"] = rules["consequents"].apply(vocab.itemset_to_str)
+        else:
+            rules["antecedents_str"] = rules["antecedents"].apply(self._frozenset_to_str)
+            rules["consequents_str"] = rules["consequents"].apply(self._frozenset_to_str)
         rules["rule_str"] = rules["antecedents_str"] + " → " + rules["consequents_str"]
 
         self.rules = rules
@@ -421,19 +1205,30 @@ class AssociationRulesMiner:
         filtered = filtered.reset_index(drop=True)
         return filtered
 
-    def save_rules(self, output_path: str, rules_df: pd.DataFrame = None):
+    def save_rules(
+        self,
+        output_path: str,
+        rules_df: pd.DataFrame = None,
+        vocab: Vocabulary = None,
+    ):
         """
-        Save rules dataframe to CSV.
+        Save rules dataframe to CSV, or to the binary Parquet rule store when
+        output_path ends with ".parquet" (xem save_rules_parquet).
 
         Args:
-            output_path (str): CSV path
+            output_path (str): CSV / Parquet path
             rules_df (pd.DataFrame): Rules dataframe to save (if None, use self.rules)
+            vocab (Vocabulary | None): Vocabulary nếu itemsets mang id item
         """
         if rules_df is None:
             if self.rules is None:
                 raise ValueError("No rules to save.")
             rules_df = self.rules
 
+        if output_path.endswith(".parquet"):
+            save_rules_parquet(rules_df, output_path, vocab=vocab)
+            return
+
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
         rules_df.to_csv(output_path, index=False)
         print(f"Đã lưu luật vào: {output_path}")
@@ -451,15 +1246,19 @@ class FPGrowthMiner:
     để dễ tái sử dụng và so sánh.
     """
 
-    def __init__(self, basket_bool: pd.DataFrame):
+    def __init__(self, basket_bool: pd.DataFrame, cache: "ItemsetCache" = None):
         """
         Initialize the FPGrowthMiner with basket data.
 
         Args:
             basket_bool (pd.DataFrame): Boolean encoded basket dataframe
+            cache (ItemsetCache | None): Cache frequent itemsets trên đĩa
+                (None = không dùng cache)
         """
         self.basket_bool = basket_bool
+        self.cache = cache
         self.frequent_itemsets = None
+        self.itemset_mode = "all"
         self.rules = None
 
     def mine_frequent_itemsets(
@@ -467,6 +1266,9 @@ class FPGrowthMiner:
         min_support: float = 0.01,
         max_len: int = None,
         use_colnames: bool = True,
+        n_partitions: int = None,
+        n_jobs: int = None,
+        mode: str = "all",
     ) -> pd.DataFrame:
         """
         Mine frequent itemsets using the FP-Growth algorithm.
@@ -475,18 +1277,41 @@ class FPGrowthMiner:
             min_support (float): Ngưỡng support tối thiểu.
             max_len (int | None): Độ dài tối đa của itemset.
             use_colnames (bool): True nếu muốn itemsets dùng tên cột.
+            n_partitions (int | None): Nếu > 1, khai phá song song theo SON
+                trên n_partitions phân vùng hoá đơn.
+            n_jobs (int | None): Số process cho chế độ SON (None = số CPU).
+            mode (str): "all", "closed" hoặc "maximal" (xem condense_itemsets).
 
         Returns:
             pd.DataFrame: DataFrame of frequent itemsets
         """
-        fi = fpgrowth(
-            self.basket_bool,
-            min_support=min_support,
-            use_colnames=use_colnames,
-            max_len=max_len,
-        )
+        def _mine():
+            if n_partitions is not None and n_partitions > 1:
+                return mine_frequent_itemsets_son(
+                    self.basket_bool,
+                    algorithm="fpgrowth",
+                    min_support=min_support,
+                    max_len=max_len,
+                    use_colnames=use_colnames,
+                    n_partitions=n_partitions,
+                    n_jobs=n_jobs,
+                )
+            return fpgrowth(
+                self.basket_bool,
+                min_support=min_support,
+                use_colnames=use_colnames,
+                max_len=max_len,
+            )
+
+        if self.cache is not None:
+            fi = self.cache.fetch_or_mine(
+                self.basket_bool, "fpgrowth", _mine, min_support, max_len, use_colnames
+            )
+        else:
+            fi = _mine()
         fi.sort_values(by="support", ascending=False, inplace=True)
-        self.frequent_itemsets = fi
+        self.frequent_itemsets = condense_itemsets(fi, mode)
+        self.itemset_mode = mode
         return self.frequent_itemsets
 
     def generate_rules(
@@ -510,24 +1335,78 @@ class FPGrowthMiner:
                 "Please run mine_frequent_itemsets() first."
             )
 
-        rules = association_rules(
-            self.frequent_itemsets,
-            metric=metric,
-            min_threshold=min_threshold,
-        )
-        rules = rules.sort_values(["lift", "confidence"], ascending=False)
-        self.rules = rules
+        if self.itemset_mode == "maximal":
+            raise ValueError(
+                "Maximal itemsets không còn support của tập con. "
+                "Dùng mine_frequent_itemsets(mode='closed') để sinh luật."
+            )
+        if self.itemset_mode == "closed":
+            # sinh luật từ closed itemsets, support tập con suy ra từ closed superset
+            rules = generate_rules_constrained(
+                self.frequent_itemsets, metrics=RULE_METRICS, closed=True
+            )
+            rules = rules[rules[metric] >= min_threshold]
+        else:
+            rules = association_rules(
+                self.frequent_itemsets,
+                metric=metric,
+                min_threshold=min_threshold,
+            )
+        rules = rules.sort_values(["lift", "confidence"], ascending=False)
+        self.rules = rules
+        return self.rules
+
+    def generate_rules_constrained(
+        self,
+        max_len_antecedents: int = None,
+        max_len_consequents: int = None,
+        min_support: float = None,
+        min_confidence: float = None,
+        min_lift: float = None,
+        metrics: tuple = ("antecedent support", "consequent support", "support", "confidence", "lift"),
+    ) -> pd.DataFrame:
+        """
+        Generate rules with length/confidence/lift constraints pushed into the
+        enumeration (xem generate_rules_constrained ở mức module).
+
+        Returns:
+            pd.DataFrame: DataFrame of association rules
+        """
+        if self.frequent_itemsets is None:
+            raise ValueError(
+                "Frequent itemsets not mined. Please run mine_frequent_itemsets() first."
+            )
+        if self.itemset_mode == "maximal":
+            raise ValueError(
+                "Maximal itemsets không còn support của tập con. "
+                "Dùng mine_frequent_itemsets(mode='closed') để sinh luật."
+            )
+
+        self.rules = generate_rules_constrained(
+            self.frequent_itemsets,
+            max_len_antecedents=max_len_antecedents,
+            max_len_consequents=max_len_consequents,
+            min_support=min_support,
+            min_confidence=min_confidence,
+            min_lift=min_lift,
+            metrics=metrics,
+            closed=self.itemset_mode == "closed",
+        )
         return self.rules
 
     @staticmethod
     def _frozenset_to_str(fs: frozenset) -> str:
         return ", ".join(sorted(list(fs)))
 
-    def add_readable_rule_str(self) -> pd.DataFrame:
+    def add_readable_rule_str(self, vocab: Vocabulary = None) -> pd.DataFrame:
         """
         Add human-readable columns for antecedents, consequents, and rule_str
         to the rules dataframe.
 
+        Args:
+            vocab (Vocabulary | None): Nếu itemsets mang id item, giải mã sang
+                tên để hiển thị và thêm cột antecedent_ids / consequent_ids
+
         Returns:
             pd.DataFrame: Rules dataframe with extra readable columns
         """
@@ -535,8 +1414,14 @@ class FPGrowthMiner:
             raise ValueError("rules is not available. Call generate_rules() first.")
 
         rules = self.rules.copy()
-        rules["antecedents_str"] = rules["antecedents"].apply(self._frozenset_to_str)
-        rules["consequents_str"] = rules["consequents"].apply(self._frozenset_to_str)
+        if vocab is not None:
+            rules["antecedent_ids"] = rules["antecedents"].apply(sorted)
+            rules["consequent_ids"] = rules["consequents"].apply(sorted)
+            rules["antecedents_str"] = rules["antecedents"].apply(vocab.itemset_to_str)
+            rules["consequents_str"] = rules["consequents"].apply(vocab.itemset_to_str)
+        else:
+            rules["antecedents_str"] = rules["antecedents"].apply(self._frozenset_to_str)
+            rules["consequents_str"] = rules["consequents"].apply(self._frozenset_to_str)
         rules["rule_str"] = rules["antecedents_str"] + " → " + rules["consequents_str"]
         self.rules = rules
         return self.rules
@@ -577,193 +1462,1919 @@ class FPGrowthMiner:
         filtered = filtered.reset_index(drop=True)
         return filtered
 
-    def save_rules(self, output_path: str, rules_df: pd.DataFrame = None):
+    def save_rules(
+        self,
+        output_path: str,
+        rules_df: pd.DataFrame = None,
+        vocab: Vocabulary = None,
+    ):
         """
-        Save rules dataframe to CSV.
+        Save rules dataframe to CSV, or to the binary Parquet rule store when
+        output_path ends with ".parquet" (xem save_rules_parquet).
 
         Args:
-            output_path (str): CSV path
+            output_path (str): CSV / Parquet path
             rules_df (pd.DataFrame): Rules dataframe to save
                 (if None, use self.rules)
+            vocab (Vocabulary | None): Vocabulary nếu itemsets mang id item
         """
         if rules_df is None:
             if self.rules is None:
                 raise ValueError("No rules to save.")
             rules_df = self.rules
 
+        if output_path.endswith(".parquet"):
+            save_rules_parquet(rules_df, output_path, vocab=vocab)
+            return
+
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
         rules_df.to_csv(output_path, index=False)
         print(f"Đã lưu luật vào: {output_path}")
 
 # =========================================================
-# 5. APRIORI vs FP-GROWTH COMPARISON HELPERS
+# 4.1. ECLAT (VERTICAL BITMAP) ASSOCIATION RULES MINER
 # =========================================================
 
+# Bảng popcount cho từng byte (dùng khi numpy chưa có np.bitwise_count)
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
 
-def benchmark_apriori_vs_fpgrowth(
+
+def _popcount_rows(bits: np.ndarray) -> np.ndarray:
+    """Đếm số bit 1 trên từng dòng của ma trận bitmap uint64 (k × n_words)."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bits).sum(axis=-1, dtype=np.int64)
+    bytes_view = bits.view(np.uint8)
+    return _POPCOUNT_TABLE[bytes_view].sum(axis=-1, dtype=np.int64)
+
+
+class EclatMiner(AssociationRulesMiner):
+    """
+    A class for mining association rules using the Eclat algorithm.
+
+    Basket được chuyển sang dạng dọc (vertical): mỗi item id (số nguyên) có
+    một tidset bitmap kiểu numpy uint64 trên các hoá đơn. Support của một
+    itemset là popcount của phép AND giữa các bitmap.
+
+    Interface giống AssociationRulesMiner (generate_rules / filter_rules /
+    save_rules dùng lại từ lớp cha).
+    """
+
+    def __init__(self, basket_bool: pd.DataFrame, cache: "ItemsetCache" = None):
+        """
+        Initialize the EclatMiner with basket data.
+
+        Args:
+            basket_bool (pd.DataFrame): Boolean encoded basket dataframe
+                (dense hoặc pandas sparse dtype)
+            cache (ItemsetCache | None): Cache frequent itemsets trên đĩa
+        """
+        super().__init__(basket_bool, cache=cache)
+        self.item_bitmaps_ = None
+        self.n_transactions_ = None
+
+    def _build_bitmaps(self) -> np.ndarray:
+        """Tạo tidset bitmap (n_items × n_words, uint64) cho từng item id."""
+        n_transactions, n_items = self.basket_bool.shape
+
+        if hasattr(self.basket_bool, "sparse"):
+            coo = self.basket_bool.sparse.to_coo()
+            rows, cols = coo.row, coo.col
+            keep = coo.data.astype(bool)
+            rows, cols = rows[keep], cols[keep]
+        else:
+            rows, cols = np.nonzero(self.basket_bool.to_numpy(dtype=bool))
+
+        n_words = (n_transactions + 63) // 64
+        bitmaps = np.zeros((n_items, n_words), dtype=np.uint64)
+        rows = rows.astype(np.uint64)
+        np.bitwise_or.at(
+            bitmaps,
+            (cols, (rows >> np.uint64(6)).astype(np.int64)),
+            np.uint64(1) << (rows & np.uint64(63)),
+        )
+
+        self.item_bitmaps_ = bitmaps
+        self.n_transactions_ = n_transactions
+        return bitmaps
+
+    def mine_frequent_itemsets(
+        self,
+        min_support: float = 0.01,
+        max_len: int = None,
+        use_colnames: bool = True,
+        mode: str = "all",
+    ) -> pd.DataFrame:
+        """
+        Mine frequent itemsets using the Eclat algorithm (depth-first trên
+        tidset bitmap).
+
+        Args:
+            min_support (float): Ngưỡng support tối thiểu.
+            max_len (int | None): Độ dài tối đa của itemset.
+            use_colnames (bool): True nếu muốn itemsets dùng tên cột.
+            mode (str): "all", "closed" hoặc "maximal" (xem condense_itemsets).
+
+        Returns:
+            pd.DataFrame: DataFrame of frequent itemsets
+                (cùng schema với mlxtend: ['support', 'itemsets'])
+        """
+        if self.cache is not None:
+            fi = self.cache.fetch_or_mine(
+                self.basket_bool,
+                "eclat",
+                lambda: self._mine_eclat(min_support, max_len, use_colnames),
+                min_support,
+                max_len,
+                use_colnames,
+            )
+        else:
+            fi = self._mine_eclat(min_support, max_len, use_colnames)
+
+        fi.sort_values(by="support", ascending=False, inplace=True)
+        self.frequent_itemsets = condense_itemsets(fi, mode)
+        self.itemset_mode = mode
+        return self.frequent_itemsets
+
+    def _mine_eclat(
+        self,
+        min_support: float,
+        max_len: int = None,
+        use_colnames: bool = True,
+    ) -> pd.DataFrame:
+        """Eclat depth-first: AND bitmap của prefix với các item phía sau + popcount."""
+        bitmaps = self._build_bitmaps()
+        n_transactions = self.n_transactions_
+        # trừ sai số float để khớp điều kiện support >= min_support của mlxtend
+        min_count = int(np.ceil(min_support * n_transactions - 1e-9))
+
+        counts = _popcount_rows(bitmaps)
+        frequent = np.flatnonzero(counts >= min_count)
+
+        found_items: list[tuple[int, ...]] = []
+        found_counts: list[int] = []
+
+        def _extend(prefix, cand_items, cand_bits, cand_counts):
+            for i in range(len(cand_items)):
+                itemset = prefix + (int(cand_items[i]),)
+                found_items.append(itemset)
+                found_counts.append(int(cand_counts[i]))
+
+                if (max_len is not None and len(itemset) >= max_len) or i + 1 >= len(cand_items):
+                    continue
+
+                inter = cand_bits[i + 1:] & cand_bits[i]
+                inter_counts = _popcount_rows(inter)
+                keep = inter_counts >= min_count
+                if keep.any():
+                    _extend(
+                        itemset,
+                        cand_items[i + 1:][keep],
+                        inter[keep],
+                        inter_counts[keep],
+                    )
+
+        _extend((), frequent, bitmaps[frequent], counts[frequent])
+
+        columns = self.basket_bool.columns
+        if use_colnames:
+            itemsets = [frozenset(columns[list(ids)]) for ids in found_items]
+        else:
+            itemsets = [frozenset(ids) for ids in found_items]
+
+        fi = pd.DataFrame(
+            {
+                "support": np.asarray(found_counts, dtype=np.float64) / n_transactions,
+                "itemsets": itemsets,
+            }
+        )
+        return fi
+
+
+# =========================================================
+# 4.2. NATIVE RULE GENERATION (PAIRWISE 1→1, CONSTRAINED)
+# =========================================================
+
+RULE_METRICS = (
+    "antecedent support",
+    "consequent support",
+    "support",
+    "confidence",
+    "lift",
+    "representativity",
+    "leverage",
+    "conviction",
+    "zhangs_metric",
+    "jaccard",
+    "certainty",
+    "kulczynski",
+)
+
+
+def _rule_metrics(
+    sAC: np.ndarray,
+    sA: np.ndarray,
+    sC: np.ndarray,
+    metrics: tuple = RULE_METRICS,
+) -> dict:
+    """
+    Tính các metric của luật (cùng công thức với mlxtend.association_rules)
+    một cách vectorized từ support của A∪C, A và C.
+
+    Returns:
+        dict: {tên metric: np.ndarray}, chỉ gồm các metric được yêu cầu
+    """
+    unknown = set(metrics) - set(RULE_METRICS)
+    if unknown:
+        raise ValueError(f"Metric không hỗ trợ: {sorted(unknown)}. Chọn trong {RULE_METRICS}.")
+
+    sAC = np.asarray(sAC, dtype=np.float64)
+    sA = np.asarray(sA, dtype=np.float64)
+    sC = np.asarray(sC, dtype=np.float64)
+
+    confidence = sAC / sA
+    leverage = sAC - sA * sC
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = {
+            "antecedent support": lambda: sA,
+            "consequent support": lambda: sC,
+            "support": lambda: sAC,
+            "confidence": lambda: confidence,
+            "lift": lambda: confidence / sC,
+            "representativity": lambda: np.ones_like(sAC),
+            "leverage": lambda: leverage,
+            "conviction": lambda: np.where(
+                confidence < 1.0, (1.0 - sC) / (1.0 - confidence), np.inf
+            ),
+            "zhangs_metric": lambda: np.where(
+                np.maximum(sAC * (1 - sA), sA * (sC - sAC)) == 0,
+                0,
+                leverage / np.maximum(sAC * (1 - sA), sA * (sC - sAC)),
+            ),
+            "jaccard": lambda: sAC / (sA + sC - sAC),
+            "certainty": lambda: np.where(sC == 1, 0, (confidence - sC) / (1 - sC)),
+            "kulczynski": lambda: (sAC / sA + sAC / sC) / 2,
+        }
+        return {m: values[m]() for m in metrics}
+
+
+def _basket_to_csc(basket_bool: pd.DataFrame) -> sparse.csc_matrix:
+    """Chuyển basket_bool (dense hoặc pandas sparse dtype) sang CSC int32."""
+    if hasattr(basket_bool, "sparse"):
+        B = basket_bool.sparse.to_coo().tocsc()
+    else:
+        B = sparse.csc_matrix(basket_bool.to_numpy(dtype=bool))
+    B = B.astype(np.int32)
+    B.eliminate_zeros()
+    return B
+
+
+def mine_pairwise_rules(
     basket_bool: pd.DataFrame,
     min_support: float = 0.01,
-    max_len: int = None,
     metric: str = "lift",
     min_threshold: float = 1.0,
-) -> dict:
+) -> pd.DataFrame:
     """
-    Chạy cả Apriori và FP-Growth trên cùng một basket_bool, đo thời gian
-    và trả về summary để phục vụ so sánh trong notebook.
+    Sinh toàn bộ luật 1 item → 1 item bằng một phép nhân ma trận thưa B.T @ B.
+
+    Thay cho việc chạy Apriori/FP-Growth đầy đủ khi chỉ cần phân tích cặp
+    (vd DataVisualizer.plot_pairwise_lift_heatmap).
+
+    Args:
+        basket_bool (pd.DataFrame): Boolean encoded basket dataframe
+            (dense hoặc pandas sparse dtype)
+        min_support (float): Ngưỡng support tối thiểu của cặp item
+        metric (str): Metric để lọc luật (như generate_rules)
+        min_threshold (float): Ngưỡng tối thiểu cho metric
 
     Returns:
-        dict với các keys:
-            - "summary": pd.DataFrame với các cột:
-                ['algorithm', 'runtime_sec', 'n_itemsets',
-                 'n_rules', 'avg_itemset_length']
-            - "apriori_itemsets": frequent itemsets từ Apriori
-            - "apriori_rules": rules từ Apriori
-            - "fpgrowth_itemsets": frequent itemsets từ FP-Growth
-            - "fpgrowth_rules": rules từ FP-Growth
-    """
-    # --- Apriori ---
-    apriori_miner = AssociationRulesMiner(basket_bool=basket_bool)
-    t0 = time.time()
-    fi_ap = apriori_miner.mine_frequent_itemsets(
-        min_support=min_support,
-        max_len=max_len,
-        use_colnames=True,
+        pd.DataFrame: Rules dataframe cùng schema với association_rules()
+            (antecedents/consequents là frozenset tên cột), sắp xếp theo
+            lift, confidence giảm dần
+    """
+    B = _basket_to_csc(basket_bool)
+    n_transactions = B.shape[0]
+    columns = basket_bool.columns
+
+    # support của cặp <= support của từng item => bỏ sớm item không phổ biến
+    item_counts = np.asarray(B.sum(axis=0)).ravel()
+    min_count = min_support * n_transactions - 1e-9
+    frequent_items = np.flatnonzero(item_counts >= min_count)
+    B = B[:, frequent_items]
+
+    co = (B.T @ B).tocoo()
+    keep = (co.row != co.col) & (co.data >= min_count)
+    ant = frequent_items[co.row[keep]]
+    con = frequent_items[co.col[keep]]
+
+    sAC = co.data[keep] / n_transactions
+    sA = item_counts[ant] / n_transactions
+    sC = item_counts[con] / n_transactions
+
+    rules = pd.DataFrame(
+        {
+            "antecedents": [frozenset([columns[i]]) for i in ant],
+            "consequents": [frozenset([columns[i]]) for i in con],
+            **_rule_metrics(sAC, sA, sC),
+        }
     )
-    rules_ap = apriori_miner.generate_rules(metric=metric, min_threshold=min_threshold)
-    t_ap = time.time() - t0
 
-    avg_len_ap = (
-        fi_ap["itemsets"].apply(len).mean() if not fi_ap.empty else 0.0
-    )
+    if metric not in rules.columns:
+        raise ValueError(f"metric phải thuộc {RULE_METRICS}, nhận được '{metric}'.")
+    rules = rules[rules[metric] >= min_threshold]
 
-    # --- FP-Growth ---
-    fpg_miner = FPGrowthMiner(basket_bool=basket_bool)
-    t0 = time.time()
-    fi_fp = fpg_miner.mine_frequent_itemsets(
-        min_support=min_support,
-        max_len=max_len,
-        use_colnames=True,
-    )
-    rules_fp = fpg_miner.generate_rules(metric=metric, min_threshold=min_threshold)
-    t_fp = time.time() - t0
+    rules = rules.sort_values(["lift", "confidence"], ascending=False).reset_index(drop=True)
+    return rules
 
-    avg_len_fp = (
-        fi_fp["itemsets"].apply(len).mean() if not fi_fp.empty else 0.0
-    )
 
-    summary = pd.DataFrame(
+
+ITEMSET_MODES = ("all", "closed", "maximal")
+
+
+def condense_itemsets(frequent_itemsets: pd.DataFrame, mode: str = "closed") -> pd.DataFrame:
+    """
+    Rút gọn tập frequent itemsets về closed hoặc maximal itemsets.
+
+    - closed: không có superset nào (trong tập đã khai phá) cùng support.
+      Không mất thông tin: support của mọi itemset phổ biến = max support của
+      các closed superset (xem generate_rules_constrained(closed=True)).
+    - maximal: không có superset phổ biến nào. Gọn nhất nhưng mất support của
+      các tập con, không dùng để sinh luật được.
+
+    Chỉ cần xét superset trực tiếp (k+1 phần tử) vì support đơn điệu giảm.
+    Với max_len, các itemset dài max_len luôn được giữ lại.
+
+    Args:
+        frequent_itemsets (pd.DataFrame): Kết quả mine_frequent_itemsets()
+            (cột 'support', 'itemsets')
+        mode (str): "all", "closed" hoặc "maximal"
+
+    Returns:
+        pd.DataFrame: Các dòng được giữ lại (cùng schema, cùng thứ tự)
+    """
+    if mode not in ITEMSET_MODES:
+        raise ValueError(f"mode phải là một trong {ITEMSET_MODES}.")
+    if mode == "all":
+        return frequent_itemsets
+
+    itemsets = frequent_itemsets["itemsets"].tolist()
+    supports = frequent_itemsets["support"].to_numpy(dtype=np.float64)
+    position = {itemset: i for i, itemset in enumerate(itemsets)}
+
+    keep = np.ones(len(itemsets), dtype=bool)
+    for i, itemset in enumerate(itemsets):
+        if len(itemset) < 2:
+            continue
+        for item in itemset:
+            j = position.get(itemset - {item})
+            if j is None:
+                continue
+            # support tính cùng công thức (count / n) nên so sánh gần như tuyệt đối
+            if mode == "maximal" or abs(supports[j] - supports[i]) <= 1e-12:
+                keep[j] = False
+
+    return frequent_itemsets[keep].reset_index(drop=True)
+
+
+def _closed_support_lookup(support_of: dict):
+    """
+    Trả về hàm itemset -> support suy ra từ closed itemsets
+    (max support của các closed superset, None nếu không có superset nào).
+    """
+    itemsets = list(support_of)
+    supports = np.fromiter(support_of.values(), dtype=np.float64, count=len(itemsets))
+    postings: dict = {}
+    for i, itemset in enumerate(itemsets):
+        for item in itemset:
+            postings.setdefault(item, []).append(i)
+    postings = {item: np.asarray(rows, dtype=np.int64) for item, rows in postings.items()}
+    empty = np.empty(0, dtype=np.int64)
+
+    @functools.lru_cache(maxsize=None)
+    def lookup(itemset: frozenset):
+        rows = functools.reduce(
+            np.intersect1d,
+            sorted((postings.get(item, empty) for item in itemset), key=len),
+        )
+        return float(supports[rows].max()) if len(rows) else None
+
+    return lookup
+
+
+def _join_consequents(level: list[tuple]) -> list[tuple]:
+    """
+    Sinh consequents mức kế tiếp từ các consequent còn sống (tuple đã sort):
+    ghép hai tuple cùng tiền tố, chỉ giữ ứng viên có mọi tập con đều còn sống.
+    """
+    alive = set(level)
+    joined = []
+    for i, a in enumerate(level):
+        for b in level[i + 1:]:
+            if a[:-1] != b[:-1]:
+                break
+            cand = a + (b[-1],)
+            if all(cand[:m] + cand[m + 1:] in alive for m in range(len(cand) - 2)):
+                joined.append(cand)
+    return joined
+
+
+def generate_rules_constrained(
+    frequent_itemsets: pd.DataFrame,
+    max_len_antecedents: int = None,
+    max_len_consequents: int = None,
+    min_support: float = None,
+    min_confidence: float = None,
+    min_lift: float = None,
+    metrics: tuple = ("antecedent support", "consequent support", "support", "confidence", "lift"),
+    closed: bool = False,
+) -> pd.DataFrame:
+    """
+    Sinh luật kết hợp với ràng buộc được áp dụng ngay khi liệt kê (thay vì
+    association_rules() rồi mới filter_rules()).
+
+    - Chỉ liệt kê các cách tách antecedents/consequents thoả giới hạn độ dài.
+    - Ngưỡng support được áp trước khi tách itemset.
+    - Consequents được sinh theo từng mức kích thước (ap-genrules): nếu
+      X -> Y không đạt min_confidence thì mọi consequent chứa Y của cùng
+      itemset cũng không đạt (antecedent nhỏ hơn => support lớn hơn) nên bị
+      bỏ qua mà không cần tra support. min_lift được kiểm tra ngay khi sinh
+      từng luật.
+    - Chỉ tính các metric trong `metrics` (tập con của RULE_METRICS).
+
+    Args:
+        frequent_itemsets (pd.DataFrame): Kết quả mine_frequent_itemsets()
+            (cột 'support', 'itemsets')
+        max_len_antecedents (int | None): Độ dài tối đa của antecedents
+        max_len_consequents (int | None): Độ dài tối đa của consequents
+        min_support (float | None): Ngưỡng support tối thiểu của luật
+        min_confidence (float | None): Ngưỡng confidence tối thiểu
+        min_lift (float | None): Ngưỡng lift tối thiểu
+        metrics (tuple): Các metric cần trả về
+        closed (bool): frequent_itemsets chỉ gồm closed itemsets
+            (condense_itemsets(mode="closed")): luật chỉ sinh từ closed
+            itemsets, support của antecedents/consequents được suy ra từ
+            closed superset thay vì bỏ qua
+
+    Returns:
+        pd.DataFrame: Rules dataframe (antecedents, consequents + metrics),
+            sắp xếp theo lift, confidence giảm dần (nếu có)
+    """
+    support_of = dict(zip(frequent_itemsets["itemsets"], frequent_itemsets["support"]))
+    derived_support = _closed_support_lookup(support_of) if closed else None
+
+    def _support(itemset):
+        support = support_of.get(itemset)
+        if support is None and derived_support is not None:
+            support = derived_support(itemset)
+        return support
+
+    antecedents, consequents = [], []
+    sAC, sA, sC = [], [], []
+    for itemset, support in support_of.items():
+        k = len(itemset)
+        if k < 2 or (min_support is not None and support < min_support):
+            continue
+
+        max_c = k - 1 if max_len_consequents is None else min(k - 1, max_len_consequents)
+        min_c = 1 if max_len_antecedents is None else max(1, k - max_len_antecedents)
+
+        items = sorted(itemset)
+        # không có min_confidence thì không có gì để prune -> liệt kê thẳng các độ dài hợp lệ
+        first_c = 1 if min_confidence is not None else min_c
+        level = []
+        for c_len in range(first_c, max_c + 1):
+            if min_confidence is None:
+                level = list(itertools.combinations(items, c_len))
+            elif c_len == 1:
+                level = [(item,) for item in items]
+            else:
+                level = _join_consequents(level)
+            if not level:
+                break
+
+            survivors = []
+            for cons_items in level:
+                cons = frozenset(cons_items)
+                ants = itemset - cons
+                s_ants = _support(ants)
+                confidence = support / s_ants if s_ants is not None else None
+                if (
+                    min_confidence is not None
+                    and confidence is not None
+                    and confidence < min_confidence
+                ):
+                    # anti-monotone: bỏ luôn mọi consequent chứa cons
+                    continue
+                survivors.append(cons_items)
+
+                if c_len < min_c:
+                    # antecedent quá dài: không sinh luật, chỉ dùng để sinh mức sau
+                    continue
+                s_cons = _support(cons)
+                if s_ants is None or s_cons is None:
+                    # itemset đã bị lọc bớt (vd maximal) -> thiếu support con
+                    continue
+                if min_lift is not None and confidence / s_cons < min_lift:
+                    continue
+                antecedents.append(ants)
+                consequents.append(cons)
+                sAC.append(support)
+                sA.append(s_ants)
+                sC.append(s_cons)
+            level = survivors
+
+    sAC = np.asarray(sAC, dtype=np.float64)
+    sA = np.asarray(sA, dtype=np.float64)
+    sC = np.asarray(sC, dtype=np.float64)
+
+    rules = pd.DataFrame(
         {
-            "algorithm": ["apriori", "fpgrowth"],
-            "runtime_sec": [t_ap, t_fp],
-            "n_itemsets": [len(fi_ap), len(fi_fp)],
-            "n_rules": [len(rules_ap), len(rules_fp)],
-            "avg_itemset_length": [avg_len_ap, avg_len_fp],
+            "antecedents": antecedents,
+            "consequents": consequents,
+            **_rule_metrics(sAC, sA, sC, metrics=tuple(metrics)),
         }
     )
 
-    return {
-        "summary": summary,
-        "apriori_itemsets": fi_ap,
-        "apriori_rules": rules_ap,
-        "fpgrowth_itemsets": fi_fp,
-        "fpgrowth_rules": rules_fp,
-    }
+    sort_cols = [c for c in ("lift", "confidence") if c in rules.columns]
+    if sort_cols:
+        rules = rules.sort_values(sort_cols, ascending=False)
+    return rules.reset_index(drop=True)
+
 
 
 # =========================================================
-# 6. DATA VISUALIZER (EDA + RFM + ASSOCIATION RULES)
+# 4.3. PARTITIONED PARALLEL MINING (SON ALGORITHM)
 # =========================================================
 
-class DataVisualizer:
+_LOCAL_MINERS = {"apriori": apriori, "fpgrowth": fpgrowth}
+
+
+def _son_local_itemsets(
+    chunk: pd.DataFrame,
+    algorithm: str,
+    min_support: float,
+    max_len: int = None,
+) -> set:
+    """Pha 1 của SON: khai phá itemset phổ biến cục bộ trên một phân vùng hoá đơn."""
+    fi = _LOCAL_MINERS[algorithm](
+        chunk,
+        min_support=min_support,
+        use_colnames=False,
+        max_len=max_len,
+    )
+    return set(fi["itemsets"])
+
+
+def count_itemsets(B: sparse.csr_matrix, itemsets: list) -> np.ndarray:
     """
-    A class for creating visualizations for customer segmentation and
-    shopping behavior analysis.
+    Đếm chính xác số hoá đơn chứa từng itemset (itemset = tập item id).
 
-    This class provides methods for plotting various aspects of the data
-    including temporal patterns, customer behavior, RFM analysis,
-    và trực quan hoá luật kết hợp (Apriori).
+    Dùng ma trận chỉ báo A (Item × Itemset): hoá đơn t chứa itemset j
+    khi (B @ A)[t, j] == |itemset_j|.
+
+    Args:
+        B (sparse.csr_matrix): Basket Invoice × Item (0/1)
+        itemsets (list): Danh sách itemset (iterable các item id)
+
+    Returns:
+        np.ndarray: Số hoá đơn chứa từng itemset (cùng thứ tự với itemsets)
     """
+    rows, cols, lengths = [], [], []
+    for j, itemset in enumerate(itemsets):
+        ids = sorted(set(itemset))
+        rows.extend(ids)
+        cols.extend([j] * len(ids))
+        lengths.append(len(ids))
+
+    A = sparse.csc_matrix(
+        (np.ones(len(rows), dtype=np.int32), (rows, cols)),
+        shape=(B.shape[1], len(itemsets)),
+    )
+    hits = (sparse.csr_matrix(B, dtype=np.int32) @ A).tocoo()
+    lengths = np.asarray(lengths, dtype=np.int64)
+    full = hits.data == lengths[hits.col]
+    return np.bincount(hits.col[full], minlength=len(itemsets))
 
-    def __init__(self):
-        """Initialize the DataVisualizer with plotting settings."""
-        plt.style.use("seaborn-v0_8-whitegrid")
-        sns.set_palette("viridis")
 
-    def plot_revenue_over_time(self, df):
-        """
-        Plot daily and monthly revenue patterns.
+def mine_frequent_itemsets_son(
+    basket_bool: pd.DataFrame,
+    algorithm: str = "apriori",
+    min_support: float = 0.01,
+    max_len: int = None,
+    use_colnames: bool = True,
+    n_partitions: int = 4,
+    n_jobs: int = None,
+) -> pd.DataFrame:
+    """
+    Khai phá frequent itemsets song song theo thuật toán SON.
 
-        Args:
-            df (pd.DataFrame): Dataframe with InvoiceDate and TotalPrice columns
-        """
-        # Daily revenue
-        plt.figure(figsize=(12, 5))
-        daily_revenue = df.groupby(df["InvoiceDate"].dt.date)["TotalPrice"].sum()
-        daily_revenue.plot()
-        plt.title("Doanh thu hàng ngày")
-        plt.xlabel("Ngày")
-        plt.ylabel("Doanh thu (GBP)")
-        plt.tight_layout()
-        plt.show()
+    - Pha 1: chia basket_bool thành n_partitions phân vùng hoá đơn, khai phá
+      itemset phổ biến cục bộ (cùng min_support tương đối) trong
+      ProcessPoolExecutor.
+    - Pha 2: hợp các ứng viên và đếm support chính xác trên toàn bộ basket
+      trong một lượt duy nhất.
 
-        # Monthly revenue
-        plt.figure(figsize=(12, 5))
-        monthly_revenue = df.groupby(pd.Grouper(key="InvoiceDate", freq="M"))[
-            "TotalPrice"
-        ].sum()
-        monthly_revenue.plot(kind="bar")
-        plt.title("Doanh thu hàng tháng")
-        plt.xlabel("Tháng")
-        plt.ylabel("Doanh thu (GBP)")
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        plt.show()
+    Kết quả giống hệt khi chạy apriori/fpgrowth trên toàn bộ dữ liệu.
 
-    def plot_time_patterns(self, df):
-        """
-        Plot purchase patterns by day and hour.
+    Args:
+        basket_bool (pd.DataFrame): Boolean encoded basket dataframe
+        algorithm (str): Thuật toán cục bộ: "apriori" hoặc "fpgrowth"
+        min_support (float): Ngưỡng support tối thiểu
+        max_len (int | None): Độ dài tối đa của itemset
+        use_colnames (bool): True nếu muốn itemsets dùng tên cột
+        n_partitions (int): Số phân vùng hoá đơn
+        n_jobs (int | None): Số process (None = số CPU)
+
+    Returns:
+        pd.DataFrame: DataFrame of frequent itemsets ['support', 'itemsets']
+    """
+    if algorithm not in _LOCAL_MINERS:
+        raise ValueError(f"algorithm phải thuộc {list(_LOCAL_MINERS)}, nhận được '{algorithm}'.")
+
+    n_transactions = basket_bool.shape[0]
+    n_partitions = max(1, min(int(n_partitions), n_transactions))
+    bounds = np.linspace(0, n_transactions, n_partitions + 1).astype(int)
+    chunks = [basket_bool.iloc[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+    # Pha 1: itemset phổ biến cục bộ
+    candidates = set()
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        futures = [
+            executor.submit(_son_local_itemsets, chunk, algorithm, min_support, max_len)
+            for chunk in chunks
+        ]
+        for future in futures:
+            candidates |= future.result()
+
+    # Pha 2: đếm support toàn cục
+    candidates = list(candidates)
+    B = _basket_to_csc(basket_bool).tocsr()
+    counts = count_itemsets(B, candidates) if candidates else np.zeros(0, dtype=np.int64)
+    support = counts / n_transactions
+    keep = support >= min_support
+
+    columns = basket_bool.columns
+    itemsets = [c for c, k in zip(candidates, keep) if k]
+    if use_colnames:
+        itemsets = [frozenset(columns[sorted(c)]) for c in itemsets]
+
+    fi = pd.DataFrame({"support": support[keep], "itemsets": itemsets})
+    fi.sort_values(by="support", ascending=False, inplace=True)
+    fi.reset_index(drop=True, inplace=True)
+    return fi
+
+
+
+# =========================================================
+# 4.4. INCREMENTAL FREQUENT ITEMSET MAINTENANCE (FUP)
+# =========================================================
+
+class IncrementalItemsetMiner:
+    """
+    Duy trì frequent itemsets khi có hoá đơn mới (thuật toán FUP).
+
+    Giữ số đếm tuyệt đối của các itemset phổ biến hiện tại. Khi nhận một lô
+    hoá đơn mới Δ (duyệt theo từng mức k như Apriori):
+    - itemset đã phổ biến: count mới = count cũ + count trong Δ (không đọc dữ liệu cũ)
+    - itemset trước đây không phổ biến: chỉ có thể trở thành phổ biến nếu
+      count_Δ >= min_support · |Δ|; chỉ những ứng viên này mới phải đếm lại
+      trên dữ liệu cũ, số còn lại bị loại ngay.
 
+    Kết quả giống hệt khai phá lại từ đầu trên toàn bộ dữ liệu.
+    """
+
+    def __init__(self, min_support: float = 0.01, max_len: int = None, use_colnames: bool = True):
+        """
         Args:
-            df (pd.DataFrame): Dataframe with time features:
-                DayOfWeek, HourOfDay
+            min_support (float): Ngưỡng support tối thiểu
+            max_len (int | None): Độ dài tối đa của itemset
+            use_colnames (bool): True nếu muốn itemsets dùng tên cột
         """
-        plt.figure(figsize=(12, 5))
-        day_hour_counts = (
-            df.groupby(["DayOfWeek", "HourOfDay"]).size().unstack(fill_value=0)
+        self.min_support = min_support
+        self.max_len = max_len
+        self.use_colnames = use_colnames
+
+        self.items_ = pd.Index([], dtype=object)
+        self.blocks_: list[sparse.csr_matrix] = []
+        self.counts_: dict[tuple, int] = {}
+        self.n_transactions_ = 0
+        self.frequent_itemsets = None
+        self.last_update_stats_: dict | None = None
+
+    def fit(self, basket_bool: pd.DataFrame) -> pd.DataFrame:
+        """Khai phá từ đầu (xoá state cũ) rồi trả về frequent itemsets."""
+        self.items_ = pd.Index([], dtype=object)
+        self.blocks_ = []
+        self.counts_ = {}
+        self.n_transactions_ = 0
+        return self.update(basket_bool)
+
+    def _align(self, basket_bool: pd.DataFrame) -> sparse.csr_matrix:
+        """basket_bool -> CSR theo thứ tự item toàn cục (thêm item mới nếu có)."""
+        columns = pd.Index(basket_bool.columns)
+        new_items = columns[~columns.isin(self.items_)]
+        if len(new_items):
+            self.items_ = self.items_.append(pd.Index(new_items, dtype=object))
+        col_ids = self.items_.get_indexer(columns)
+
+        B = _basket_to_csc(basket_bool).tocsr()
+        M = sparse.csr_matrix(
+            (np.ones(len(columns), dtype=np.int32), (np.arange(len(columns)), col_ids)),
+            shape=(len(columns), len(self.items_)),
         )
-        sns.heatmap(day_hour_counts, cmap="viridis")
-        plt.title("Hoạt động mua hàng theo ngày và giờ")
-        plt.xlabel("Giờ trong ngày")
-        plt.ylabel("Ngày trong tuần (0=Thứ 2, 6=Chủ nhật)")
-        plt.tight_layout()
-        plt.show()
+        return (B @ M).tocsr()
+
+    def _count_old(self, itemsets: list[tuple]) -> np.ndarray:
+        """Đếm itemsets trên toàn bộ các lô đã nhận trước đó."""
+        n_items = len(self.items_)
+        total = np.zeros(len(itemsets), dtype=np.int64)
+        for block in self.blocks_:
+            if block.shape[1] < n_items:
+                block.resize((block.shape[0], n_items))
+            total += count_itemsets(block, itemsets)
+        return total
 
-    def plot_product_analysis(self, df, top_n=10):
+    @staticmethod
+    def _apriori_gen(frequent: list[tuple]) -> list[tuple]:
+        """Sinh ứng viên mức k+1 từ các itemset phổ biến mức k (join cùng tiền tố + prune)."""
+        frequent = sorted(frequent)
+        frequent_set = set(frequent)
+        candidates = []
+        for _, group in itertools.groupby(frequent, key=lambda x: x[:-1]):
+            group = list(group)
+            for i in range(len(group)):
+                for j in range(i + 1, len(group)):
+                    cand = group[i] + (group[j][-1],)
+                    if all(
+                        cand[:m] + cand[m + 1:] in frequent_set for m in range(len(cand) - 2)
+                    ):
+                        candidates.append(cand)
+        return candidates
+
+    def update(self, new_basket_bool: pd.DataFrame) -> pd.DataFrame:
         """
-        Plot top products by quantity and revenue.
+        Cập nhật frequent itemsets với một lô hoá đơn mới.
 
         Args:
-            df (pd.DataFrame): Transaction dataframe (có Quantity, TotalPrice)
-            top_n (int): Number of top products to show
+            new_basket_bool (pd.DataFrame): Boolean basket của các hoá đơn mới
+                (dense hoặc pandas sparse dtype; có thể có item mới)
+
+        Returns:
+            pd.DataFrame: Frequent itemsets ['support', 'itemsets'] trên toàn bộ dữ liệu
         """
-        # Top sản phẩm theo số lượng
-        plt.figure(figsize=(12, 5))
-        top_products = (
-            df.groupby("Description")["Quantity"]
-            .sum()
-            .sort_values(ascending=False)
-            .head(top_n)
-        )
-        sns.barplot(x=top_products.values, y=top_products.index)
-        plt.title(f"Top {top_n} sản phẩm theo số lượng bán")
-        plt.xlabel("Số lượng bán")
+        D = self._align(new_basket_bool)
+        n_delta = D.shape[0]
+        n_old = self.n_transactions_
+        n_total = n_old + n_delta
+        if n_total == 0:
+            raise ValueError("Chưa có hoá đơn nào để khai phá.")
+
+        update_stats = {"n_new_transactions": n_delta, "candidates": 0, "rescanned": 0, "pruned": 0}
+        if n_delta == 0:
+            # lô rỗng: support không đổi, không cần đếm lại gì trên dữ liệu cũ
+            self.last_update_stats_ = update_stats
+            return self.frequent_itemsets
+
+        s = self.min_support
+        new_counts: dict[tuple, int] = {}
+
+        k = 1
+        candidates = [(i,) for i in range(len(self.items_))]
+        while candidates and (self.max_len is None or k <= self.max_len):
+            if k == 1:
+                delta = np.asarray(D.sum(axis=0)).ravel().astype(np.int64)
+            else:
+                delta = count_itemsets(D, candidates)
+
+            known = np.fromiter((c in self.counts_ for c in candidates), dtype=bool, count=len(candidates))
+            totals = delta.copy()
+            totals[known] += np.fromiter(
+                (self.counts_[c] for c, kn in zip(candidates, known) if kn), dtype=np.int64
+            )
+
+            alive = np.ones(len(candidates), dtype=bool)
+            if n_old > 0:
+                # trước đây không phổ biến: count_cũ < s·n_old => cần count_Δ >= s·|Δ|
+                unknown = ~known
+                rescan = unknown & (delta >= s * n_delta - 1e-9)
+                alive[unknown & ~rescan] = False
+                rescan_ids = np.flatnonzero(rescan)
+                if rescan_ids.size:
+                    totals[rescan_ids] += self._count_old([candidates[i] for i in rescan_ids])
+                update_stats["rescanned"] += int(rescan_ids.size)
+                update_stats["pruned"] += int((unknown & ~rescan).sum())
+            update_stats["candidates"] += len(candidates)
+
+            frequent = alive & (totals / n_total >= s)
+            level = [c for c, f in zip(candidates, frequent) if f]
+            new_counts.update({c: int(t) for c, t in zip(level, totals[frequent])})
+
+            candidates = self._apriori_gen(level)
+            k += 1
+
+        self.blocks_.append(D)
+        self.counts_ = new_counts
+        self.n_transactions_ = n_total
+        self.last_update_stats_ = update_stats
+
+        itemsets = list(new_counts)
+        if self.use_colnames:
+            labels = self.items_.to_numpy()
+            itemsets_out = [frozenset(labels[list(c)]) for c in itemsets]
+        else:
+            itemsets_out = [frozenset(c) for c in itemsets]
+
+        fi = pd.DataFrame({
+            "support": np.fromiter(new_counts.values(), dtype=np.float64, count=len(new_counts)) / n_total,
+            "itemsets": itemsets_out,
+        })
+        fi.sort_values(by="support", ascending=False, inplace=True)
+        fi.reset_index(drop=True, inplace=True)
+        self.frequent_itemsets = fi
+        return fi
+
+
+# =========================================================
+# 4.5. FREQUENT ITEMSET CACHE
+# =========================================================
+
+class ItemsetCache:
+    """
+    Cache trên đĩa cho frequent itemsets.
+
+    Khoá cache = fingerprint của basket + (algorithm, max_len, use_colnames).
+    Mỗi khoá chỉ lưu kết quả ở min_support thấp nhất từng khai phá; mọi yêu
+    cầu với min_support cao hơn được phục vụ bằng cách lọc kết quả đã lưu
+    (tính đơn điệu của support). Tổng dung lượng được giới hạn bằng
+    max_bytes, loại bỏ theo LRU.
+
+    Itemsets được lưu dạng Parquet (cột itemsets là list). Mọi thao tác
+    đọc-sửa-ghi index.json đều giữ file lock (index.json.lock), nên nhiều
+    process (vd các notebook chạy song song) có thể dùng chung thư mục cache.
+    """
+
+    INDEX_FILE = "index.json"
+    LOCK_TIMEOUT = 60.0
+
+    def __init__(self, cache_dir: str, max_bytes: int = 512 * 1024 ** 2):
+        """
+        Initialize the ItemsetCache.
+
+        Args:
+            cache_dir (str): Thư mục lưu cache
+            max_bytes (int): Dung lượng tối đa của cache (bytes)
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_bytes)
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def fingerprint(basket_bool: pd.DataFrame) -> str:
+        """Hash nội dung basket (cấu trúc thưa + tên cột), không phụ thuộc dense/sparse."""
+        B = _basket_to_csc(basket_bool)
+        h = hashlib.sha1()
+        h.update(np.asarray(B.shape, dtype=np.int64).tobytes())
+        h.update(B.indptr.astype(np.int64).tobytes())
+        h.update(B.indices.astype(np.int64).tobytes())
+        h.update("\x1f".join(map(str, basket_bool.columns)).encode("utf-8"))
+        return h.hexdigest()
+
+    @staticmethod
+    def _key(fingerprint: str, algorithm: str, max_len: int, use_colnames: bool) -> str:
+        return f"{fingerprint}_{algorithm}_len{max_len}_{'names' if use_colnames else 'ids'}"
+
+    @contextmanager
+    def _lock(self):
+        """File lock liên process (O_CREAT | O_EXCL); lock cũ hơn LOCK_TIMEOUT giây bị coi là bỏ dở."""
+        lock_path = os.path.join(self.cache_dir, self.INDEX_FILE + ".lock")
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock_path) > self.LOCK_TIMEOUT:
+                        os.remove(lock_path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            os.close(fd)
+            os.remove(lock_path)
+
+    @staticmethod
+    def _write_itemsets(frequent_itemsets: pd.DataFrame, path: str):
+        table = pa.table(
+            {
+                "support": pa.array(frequent_itemsets["support"].to_numpy(dtype=np.float64)),
+                "itemsets": pa.array(
+                    [sorted(itemset) for itemset in frequent_itemsets["itemsets"]]
+                ),
+            }
+        )
+        tmp_path = path + ".tmp"
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read_itemsets(path: str) -> pd.DataFrame:
+        table = pq.read_table(path)
+        return pd.DataFrame(
+            {
+                "support": table.column("support").to_numpy(),
+                "itemsets": [frozenset(items) for items in table.column("itemsets").to_pylist()],
+            }
+        )
+
+    def _read_index(self) -> dict:
+        path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        if not os.path.exists(path):
+            return {}
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_index(self, index: dict):
+        path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def get(
+        self,
+        fingerprint: str,
+        algorithm: str,
+        min_support: float,
+        max_len: int = None,
+        use_colnames: bool = True,
+    ) -> pd.DataFrame | None:
+        """
+        Lấy frequent itemsets từ cache (None nếu không có kết quả ở
+        min_support <= yêu cầu).
+        """
+        key = self._key(fingerprint, algorithm, max_len, use_colnames)
+        with self._lock():
+            index = self._read_index()
+            entry = index.get(key)
+            if entry is None or entry["min_support"] > min_support:
+                return None
+
+            path = os.path.join(self.cache_dir, entry["file"])
+            if not entry["file"].endswith(".parquet") or not os.path.exists(path):
+                # file mất hoặc định dạng cũ (pickle) -> coi như chưa có
+                index.pop(key)
+                self._write_index(index)
+                return None
+
+            fi = self._read_itemsets(path)
+            entry["last_access"] = time.time()
+            self._write_index(index)
+
+        return fi[fi["support"] >= min_support].reset_index(drop=True)
+
+    def put(
+        self,
+        fingerprint: str,
+        algorithm: str,
+        min_support: float,
+        frequent_itemsets: pd.DataFrame,
+        max_len: int = None,
+        use_colnames: bool = True,
+    ):
+        """
+        Lưu frequent itemsets vào cache nếu min_support thấp hơn kết quả đang
+        lưu, sau đó loại bỏ LRU cho tới khi tổng dung lượng <= max_bytes.
+        """
+        key = self._key(fingerprint, algorithm, max_len, use_colnames)
+        with self._lock():
+            index = self._read_index()
+            entry = index.get(key)
+            if entry is not None and entry["min_support"] <= min_support and entry["file"].endswith(".parquet"):
+                return
+
+            file_name = f"{key}.parquet"
+            self._write_itemsets(frequent_itemsets, os.path.join(self.cache_dir, file_name))
+            index[key] = {
+                "file": file_name,
+                "min_support": float(min_support),
+                "size": os.path.getsize(os.path.join(self.cache_dir, file_name)),
+                "last_access": time.time(),
+            }
+
+            # LRU eviction
+            total = sum(e["size"] for e in index.values())
+            for old_key in sorted(index, key=lambda k: index[k]["last_access"]):
+                if total <= self.max_bytes or old_key == key:
+                    break
+                old = index.pop(old_key)
+                total -= old["size"]
+                old_path = os.path.join(self.cache_dir, old["file"])
+                if os.path.exists(old_path):
+                    os.remove(old_path)
+
+            self._write_index(index)
+
+    def fetch_or_mine(
+        self,
+        basket_bool: pd.DataFrame,
+        algorithm: str,
+        mine_fn,
+        min_support: float,
+        max_len: int = None,
+        use_colnames: bool = True,
+    ) -> pd.DataFrame:
+        """Trả về kết quả trong cache, hoặc gọi mine_fn() rồi lưu lại."""
+        fingerprint = self.fingerprint(basket_bool)
+        fi = self.get(fingerprint, algorithm, min_support, max_len, use_colnames)
+        if fi is not None:
+            return fi
+
+        fi = mine_fn()
+        self.put(fingerprint, algorithm, min_support, fi, max_len, use_colnames)
+        return fi
+
+    def clear(self):
+        """Xoá toàn bộ cache."""
+        with self._lock():
+            for entry in self._read_index().values():
+                path = os.path.join(self.cache_dir, entry["file"])
+                if os.path.exists(path):
+                    os.remove(path)
+            self._write_index({})
+
+
+
+# =========================================================
+# 4.6. BINARY RULE STORE (PARQUET)
+# =========================================================
+
+_RULE_ID_COLUMNS = ["antecedent_ids", "consequent_ids", "antecedent_len", "consequent_len"]
+_RULE_DERIVED_COLUMNS = [
+    "antecedents", "consequents", "antecedents_str", "consequents_str", "rule_str",
+    "antecedent_ids", "consequent_ids",
+]
+
+
+def _itemset_to_vocab_ids(itemset, vocab: Vocabulary) -> list[int]:
+    """Itemset (id hoặc tên item) -> danh sách id vocabulary đã sắp xếp."""
+    items = list(itemset)
+    if not items:
+        return []
+    if isinstance(items[0], (int, np.integer)):
+        return sorted(int(i) for i in items)
+    ids = vocab.encode_items(items)
+    if (ids < 0).any():
+        raise ValueError(f"Item không có trong vocabulary: {np.asarray(items)[ids < 0].tolist()}")
+    return sorted(ids.tolist())
+
+
+def save_rules_parquet(rules_df: pd.DataFrame, output_path: str, vocab: Vocabulary = None):
+    """
+    Lưu luật ra Parquet: itemset dạng list<int32> + từ điển item (trong
+    metadata của file), metric dạng float32 và độ dài antecedents/consequents
+    tính sẵn.
+
+    Args:
+        rules_df (pd.DataFrame): Rules dataframe (antecedents/consequents là
+            frozenset tên item hoặc id item; nếu có vocab, ưu tiên cột *_ids)
+        output_path (str): Đường dẫn file .parquet
+        vocab (Vocabulary | None): Vocabulary nếu itemsets mang id item
+    """
+    antecedents = rules_df["antecedents"].tolist()
+    consequents = rules_df["consequents"].tolist()
+
+    # CSV cũ: antecedents là repr của frozenset -> dùng cột *_str
+    if antecedents and isinstance(antecedents[0], str):
+        antecedents = [RuleBasedCustomerClusterer._parse_items(x) for x in rules_df["antecedents_str"]]
+        consequents = [RuleBasedCustomerClusterer._parse_items(x) for x in rules_df["consequents_str"]]
+
+    if vocab is not None:
+        dictionary = vocab.items.tolist()
+        if "antecedent_ids" in rules_df.columns and "consequent_ids" in rules_df.columns:
+            antecedents = [RuleBasedCustomerClusterer._parse_ids(x) for x in rules_df["antecedent_ids"]]
+            consequents = [RuleBasedCustomerClusterer._parse_ids(x) for x in rules_df["consequent_ids"]]
+        ant_ids = [_itemset_to_vocab_ids(a, vocab) for a in antecedents]
+        con_ids = [_itemset_to_vocab_ids(c, vocab) for c in consequents]
+    else:
+        dictionary = sorted(set().union(*antecedents, *consequents)) if antecedents else []
+        item_index = {item: i for i, item in enumerate(dictionary)}
+        ant_ids = [sorted(item_index[i] for i in a) for a in antecedents]
+        con_ids = [sorted(item_index[i] for i in c) for c in consequents]
+
+    columns = {
+        "antecedent_ids": pa.array(ant_ids, type=pa.list_(pa.int32())),
+        "consequent_ids": pa.array(con_ids, type=pa.list_(pa.int32())),
+        "antecedent_len": pa.array([len(a) for a in ant_ids], type=pa.int16()),
+        "consequent_len": pa.array([len(c) for c in con_ids], type=pa.int16()),
+    }
+    for col in rules_df.columns:
+        if col in _RULE_DERIVED_COLUMNS or col in columns:
+            continue
+        if pd.api.types.is_numeric_dtype(rules_df[col]):
+            columns[col] = pa.array(rules_df[col].to_numpy(dtype=np.float32))
+
+    table = pa.table(columns)
+    table = table.replace_schema_metadata(
+        {"item_dictionary": json.dumps([str(x) for x in dictionary], ensure_ascii=False)}
+    )
+
+    out_dir = os.path.dirname(output_path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    pq.write_table(table, output_path)
+    print(f"Đã lưu luật vào: {output_path}")
+
+
+def _split_list_column(column) -> list[np.ndarray]:
+    """list<int32> (pyarrow) -> danh sách mảng numpy, không qua Python list từng phần tử."""
+    array = column.combine_chunks() if isinstance(column, pa.ChunkedArray) else column
+    if len(array) == 0:
+        # np.split trên offsets rỗng trả về một mảng rỗng -> thành 1 luật giả
+        return []
+    offsets = array.offsets.to_numpy()
+    values = array.flatten().to_numpy()
+    return np.split(values, offsets[1:-1] - offsets[0])
+
+
+def load_rules_parquet(path: str, columns: list = None, vocab: Vocabulary = None) -> pd.DataFrame:
+    """
+    Đọc luật từ Parquet (save_rules_parquet) thành cùng schema với rules CSV
+    (antecedents/consequents là frozenset tên item, kèm *_str và rule_str),
+    không cần eval hay tách chuỗi.
+
+    Args:
+        path (str): Đường dẫn file .parquet
+        columns (list | None): Chỉ đọc các metric này (projection), None = tất cả
+        vocab (Vocabulary | None): Nếu có, antecedent_ids/consequent_ids được
+            ánh xạ sang id của vocabulary (-1 nếu item không có trong vocab)
+
+    Returns:
+        pd.DataFrame: Rules dataframe
+    """
+    read_columns = None
+    if columns is not None:
+        read_columns = _RULE_ID_COLUMNS + [c for c in columns if c not in _RULE_ID_COLUMNS]
+
+    table = pq.read_table(path, columns=read_columns)
+    dictionary = np.array(
+        json.loads(table.schema.metadata[b"item_dictionary"].decode("utf-8")), dtype=object
+    )
+
+    ant_ids = _split_list_column(table.column("antecedent_ids"))
+    con_ids = _split_list_column(table.column("consequent_ids"))
+
+    rules = table.drop(["antecedent_ids", "consequent_ids"]).to_pandas()
+
+    ant_names = [dictionary[ids] for ids in ant_ids]
+    con_names = [dictionary[ids] for ids in con_ids]
+    rules.insert(0, "antecedents", [frozenset(n) for n in ant_names])
+    rules.insert(1, "consequents", [frozenset(n) for n in con_names])
+    ant_str = [", ".join(sorted(n)) for n in ant_names]
+    con_str = [", ".join(sorted(n)) for n in con_names]
+    # dtype object để bảng rỗng vẫn giữ đúng kiểu cột
+    rules["antecedents_str"] = pd.Series(ant_str, index=rules.index, dtype=object)
+    rules["consequents_str"] = pd.Series(con_str, index=rules.index, dtype=object)
+    rules["rule_str"] = pd.Series(
+        [f"{a} → {c}" for a, c in zip(ant_str, con_str)], index=rules.index, dtype=object
+    )
+
+    if vocab is not None:
+        to_vocab = vocab.encode_items(dictionary) if len(dictionary) else np.zeros(0, np.int32)
+        rules["antecedent_ids"] = [sorted(to_vocab[ids].tolist()) for ids in ant_ids]
+        rules["consequent_ids"] = [sorted(to_vocab[ids].tolist()) for ids in con_ids]
+
+    return rules
+
+
+# =========================================================
+# 4.7. RULE INDEX (INVERTED INDEX + ANTECEDENT TRIE)
+# =========================================================
+
+class RuleIndex:
+    """
+    Chỉ mục luật để trả lời nhanh "luật nào kích hoạt với giỏ hàng này".
+
+    - Inverted index item -> luật (CSR), cho cả antecedents và consequents.
+    - Trie trên antecedents (item đã sắp theo id): match() chỉ đi qua các nút
+      là tập con của giỏ hàng, không lọc toàn bộ rules DataFrame.
+    - match_batch(): khớp hàng loạt giỏ hàng bằng một phép nhân ma trận thưa
+      Basket × Item @ Item × Rule theo từng lô.
+    """
+
+    def __init__(self, rules: pd.DataFrame, vocab: Vocabulary = None):
+        """
+        Args:
+            rules (pd.DataFrame): Output của miner (generate_rules / filter_rules),
+                rules CSV (cần antecedents_str, consequents_str) hoặc Parquet
+                (load_rules_parquet)
+            vocab (Vocabulary | None): Nếu có, id item là id của vocabulary
+        """
+        self.rules = rules.reset_index(drop=True)
+        self.vocab = vocab
+
+        antecedents = self._rule_itemsets(self.rules, "antecedent")
+        consequents = self._rule_itemsets(self.rules, "consequent")
+
+        if vocab is not None:
+            self.items_ = vocab.items
+            ant_ids = [self._encode_ids(a) for a in antecedents]
+            con_ids = [self._encode_ids(c) for c in consequents]
+        else:
+            self.items_ = pd.Index(sorted(set().union(*antecedents, *consequents)))
+            ant_ids = [sorted(set(self.items_.get_indexer(list(a)).tolist())) for a in antecedents]
+            con_ids = [sorted(set(self.items_.get_indexer(list(c)).tolist())) for c in consequents]
+
+        # tra cứu item -> id cho từng giỏ hàng (nhanh hơn Index.get_indexer với giỏ nhỏ)
+        self._item_pos = {item: i for i, item in enumerate(self.items_)}
+
+        n_items = len(self.items_)
+        self.antecedent_len_ = np.array([len(a) for a in ant_ids], dtype=np.int32)
+        # Item × Rule, cột j = antecedents / consequents của luật j
+        self.antecedent_matrix_ = self._indicator(ant_ids, n_items)
+        self.consequent_matrix_ = self._indicator(con_ids, n_items)
+        # Inverted index: hàng i = các luật chứa item i
+        self.antecedent_postings_ = self.antecedent_matrix_.tocsr()
+        self.consequent_postings_ = self.consequent_matrix_.tocsr()
+
+        # Trie: _children[node] = {item_id: child}, _terminal[node] = các luật kết thúc tại node
+        self._children: list[dict[int, int]] = [{}]
+        self._terminal: list[list[int]] = [[]]
+        for j, ids in enumerate(ant_ids):
+            if not ids or ids[0] < 0:
+                continue  # item không có trong vocabulary => luật không bao giờ kích hoạt
+            node = 0
+            for item in ids:
+                child = self._children[node].get(item)
+                if child is None:
+                    child = len(self._children)
+                    self._children[node][item] = child
+                    self._children.append({})
+                    self._terminal.append([])
+                node = child
+            self._terminal[node].append(j)
+
+    @classmethod
+    def from_file(cls, path: str, vocab: Vocabulary = None) -> "RuleIndex":
+        """Tạo RuleIndex từ rules CSV (vd rules_apriori_filtered.csv) hoặc Parquet."""
+        if path.endswith(".parquet"):
+            return cls(load_rules_parquet(path, vocab=vocab), vocab=vocab)
+        return cls(pd.read_csv(path), vocab=vocab)
+
+    def __len__(self) -> int:
+        return self.rules.shape[0]
+
+    @property
+    def n_nodes(self) -> int:
+        """Số nút của trie antecedents (kể cả gốc)."""
+        return len(self._children)
+
+    def _rule_itemsets(self, rules: pd.DataFrame, side: str) -> list:
+        """Itemsets một vế của từng luật: id (nếu có vocab + cột *_ids), frozenset hoặc tách *_str."""
+        ids_col, set_col, str_col = f"{side}_ids", f"{side}s", f"{side}s_str"
+        if self.vocab is not None and ids_col in rules.columns:
+            return [RuleBasedCustomerClusterer._parse_ids(x) for x in rules[ids_col]]
+        if (
+            set_col in rules.columns
+            and rules.shape[0] > 0
+            and isinstance(rules[set_col].iloc[0], (set, frozenset))
+        ):
+            return [list(x) for x in rules[set_col]]
+        if str_col in rules.columns:
+            return [RuleBasedCustomerClusterer._parse_items(x) for x in rules[str_col]]
+        raise ValueError(f"rules cần có cột {set_col} (frozenset) hoặc {str_col}.")
+
+    def _encode_ids(self, items) -> list[int]:
+        """Itemset (tên hoặc id vocabulary) -> danh sách id đã sắp xếp, [-1] nếu có item lạ."""
+        items = list(items)
+        if items and isinstance(items[0], (int, np.integer)):
+            ids = np.asarray(items, dtype=np.int64)
+        else:
+            ids = self.vocab.encode_items(items) if items else np.zeros(0, dtype=np.int64)
+        if (ids < 0).any():
+            return [-1]
+        return sorted(set(ids.tolist()))
+
+    @staticmethod
+    def _indicator(itemsets: list[list[int]], n_items: int) -> sparse.csc_matrix:
+        """Ma trận chỉ báo Item × Rule (int32), bỏ qua các itemset có id -1."""
+        valid = [ids if (not ids or ids[0] >= 0) else [] for ids in itemsets]
+        indptr = np.zeros(len(valid) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(ids) for ids in valid])
+        indices = np.fromiter(itertools.chain.from_iterable(valid), dtype=np.int32, count=indptr[-1])
+        data = np.ones(indptr[-1], dtype=np.int32)
+        return sparse.csc_matrix((data, indices, indptr), shape=(n_items, len(valid)))
+
+    def encode_basket(self, basket) -> np.ndarray:
+        """Giỏ hàng (tên item, hoặc id nếu có vocab) -> mảng id đã sắp xếp, bỏ item lạ."""
+        items = list(basket)
+        if not items:
+            return np.zeros(0, dtype=np.int64)
+        if self.vocab is not None and isinstance(items[0], (int, np.integer)):
+            ids = np.asarray(items, dtype=np.int64)
+            ids = ids[(ids >= 0) & (ids < len(self.items_))]
+        else:
+            pos = self._item_pos
+            ids = np.fromiter((pos[x] for x in items if x in pos), dtype=np.int64)
+        return np.unique(ids)
+
+    def rules_with_item(self, item, side: str = "antecedent") -> np.ndarray:
+        """
+        Tra inverted index: vị trí các luật chứa item.
+
+        Args:
+            item: Tên item (hoặc id nếu có vocab)
+            side (str): "antecedent", "consequent" hoặc "any"
+        """
+        ids = self.encode_basket([item])
+        if ids.size == 0:
+            return np.zeros(0, dtype=np.int64)
+        i = int(ids[0])
+        postings = []
+        if side in ("antecedent", "any"):
+            P = self.antecedent_postings_
+            postings.append(P.indices[P.indptr[i]:P.indptr[i + 1]])
+        if side in ("consequent", "any"):
+            P = self.consequent_postings_
+            postings.append(P.indices[P.indptr[i]:P.indptr[i + 1]])
+        if not postings:
+            raise ValueError("side phải là 'antecedent', 'consequent' hoặc 'any'.")
+        return np.unique(np.concatenate(postings)).astype(np.int64)
+
+    def match(self, basket) -> np.ndarray:
+        """
+        Vị trí (trong self.rules) các luật có antecedents ⊆ basket, duyệt trie.
+
+        Chỉ các nút trie là tập con của giỏ hàng được thăm, nên chi phí phụ
+        thuộc kích thước giỏ hàng chứ không phụ thuộc số luật.
+        """
+        ids = self.encode_basket(basket).tolist()
+        fired: list[int] = []
+        stack = [(0, 0)]
+        while stack:
+            node, start = stack.pop()
+            fired.extend(self._terminal[node])
+            children = self._children[node]
+            if not children:
+                continue
+            for pos in range(start, len(ids)):
+                child = children.get(ids[pos])
+                if child is not None:
+                    stack.append((child, pos + 1))
+        return np.sort(np.asarray(fired, dtype=np.int64))
+
+    def match_rules(self, basket) -> pd.DataFrame:
+        """Các dòng luật kích hoạt với basket (xem match)."""
+        return self.rules.iloc[self.match(basket)]
+
+    def encode_baskets(self, baskets) -> sparse.csr_matrix:
+        """
+        Basket × Item CSR theo id item của index (dùng cho match_batch và
+        CrossSellRecommender); item không có trong index bị bỏ qua, nhưng
+        DataFrame không có cột nào khớp item của index sẽ báo lỗi.
+
+        Args:
+            baskets: Basket × Item DataFrame (dense / pandas sparse), scipy
+                sparse matrix theo id item của index, hoặc danh sách giỏ hàng
+        """
+        n_items = len(self.items_)
+        if isinstance(baskets, pd.DataFrame):
+            B = _basket_to_csc(baskets).tocsr()
+            if self.vocab is not None and pd.api.types.is_integer_dtype(baskets.columns):
+                col_ids = np.asarray(baskets.columns, dtype=np.int64)
+                col_ids[(col_ids < 0) | (col_ids >= n_items)] = -1
+            elif self.vocab is not None:
+                col_ids = self.vocab.encode_items(baskets.columns)
+            else:
+                # tra đúng kiểu cột như encode_basket; chỉ ép sang str khi item của index là str
+                col_ids = self.items_.get_indexer(baskets.columns)
+                if (col_ids < 0).all() and self.items_.inferred_type == "string":
+                    col_ids = self.items_.get_indexer(baskets.columns.astype(str))
+            keep = np.flatnonzero(col_ids >= 0)
+            if baskets.shape[1] and not keep.size:
+                raise ValueError(
+                    "Không cột nào của baskets khớp item của RuleIndex "
+                    f"(cột kiểu {baskets.columns.dtype}, item kiểu {self.items_.dtype})."
+                )
+            # ánh xạ cột của baskets -> id item của index
+            M = sparse.csr_matrix(
+                (np.ones(keep.size, dtype=np.int32), (keep, col_ids[keep])),
+                shape=(B.shape[1], n_items),
+            )
+            return (B @ M).tocsr()
+
+        if sparse.issparse(baskets):
+            if baskets.shape[1] != n_items:
+                raise ValueError("Ma trận thưa phải có số cột bằng số item của index.")
+            return sparse.csr_matrix(baskets, dtype=np.int32)
+
+        encoded = [self.encode_basket(b) for b in baskets]
+        indptr = np.zeros(len(encoded) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([e.size for e in encoded])
+        indices = np.concatenate(encoded) if encoded else np.zeros(0, dtype=np.int64)
+        data = np.ones(indices.size, dtype=np.int32)
+        return sparse.csr_matrix((data, indices, indptr), shape=(len(encoded), n_items))
+
+    def match_batch(self, baskets, batch_size: int = 100_000) -> sparse.csr_matrix:
+        """
+        Khớp hàng loạt giỏ hàng: luật j kích hoạt với giỏ i khi
+        (B @ A)[i, j] == len(antecedents_j).
+
+        Args:
+            baskets: Basket × Item DataFrame (dense / pandas sparse, vd basket_bool
+                hoặc customer_item_bool), scipy sparse matrix theo id item của
+                index, hoặc danh sách giỏ hàng (iterable tên item)
+            batch_size (int): Số giỏ hàng mỗi lô (giới hạn bộ nhớ trung gian)
+
+        Returns:
+            sparse.csr_matrix: Basket × Rule boolean, hàng i = các luật kích hoạt
+        """
+        B = self.encode_baskets(baskets)
+        A = self.antecedent_matrix_.tocsr()
+        blocks = []
+        for start in range(0, B.shape[0], batch_size):
+            hits = (B[start:start + batch_size] @ A).tocsr()
+            hits.data = (hits.data == self.antecedent_len_[hits.indices])
+            hits.eliminate_zeros()
+            hits.sort_indices()
+            blocks.append(hits.astype(bool))
+        if not blocks:
+            return sparse.csr_matrix((0, len(self)), dtype=bool)
+        return sparse.vstack(blocks, format="csr")
+
+
+# =========================================================
+# 5. APRIORI vs FP-GROWTH vs ECLAT COMPARISON HELPERS
+# =========================================================
+
+
+def benchmark_apriori_vs_fpgrowth(
+    basket_bool: pd.DataFrame,
+    min_support: float = 0.01,
+    max_len: int = None,
+    metric: str = "lift",
+    min_threshold: float = 1.0,
+    algorithms: tuple = ("apriori", "fpgrowth", "eclat"),
+) -> dict:
+    """
+    Chạy Apriori, FP-Growth và Eclat trên cùng một basket_bool, đo thời gian
+    và trả về summary để phục vụ so sánh trong notebook.
+
+    Args:
+        algorithms (tuple): Các thuật toán cần chạy
+            (tập con của "apriori", "fpgrowth", "eclat")
+
+    Returns:
+        dict với các keys:
+            - "summary": pd.DataFrame với các cột:
+                ['algorithm', 'runtime_sec', 'n_itemsets',
+                 'n_rules', 'avg_itemset_length']
+            - "<algorithm>_itemsets": frequent itemsets của từng thuật toán
+              (vd "apriori_itemsets", "fpgrowth_itemsets", "eclat_itemsets")
+            - "<algorithm>_rules": rules của từng thuật toán
+    """
+    miner_classes = {
+        "apriori": AssociationRulesMiner,
+        "fpgrowth": FPGrowthMiner,
+        "eclat": EclatMiner,
+    }
+
+    rows = []
+    result = {}
+    for algorithm in algorithms:
+        if algorithm not in miner_classes:
+            raise ValueError(
+                f"algorithm phải thuộc {list(miner_classes)}, nhận được '{algorithm}'."
+            )
+
+        miner = miner_classes[algorithm](basket_bool=basket_bool)
+        t0 = time.time()
+        fi = miner.mine_frequent_itemsets(
+            min_support=min_support,
+            max_len=max_len,
+            use_colnames=True,
+        )
+        rules = miner.generate_rules(metric=metric, min_threshold=min_threshold)
+        runtime = time.time() - t0
+
+        avg_len = fi["itemsets"].apply(len).mean() if not fi.empty else 0.0
+
+        rows.append(
+            {
+                "algorithm": algorithm,
+                "runtime_sec": runtime,
+                "n_itemsets": len(fi),
+                "n_rules": len(rules),
+                "avg_itemset_length": avg_len,
+            }
+        )
+        result[f"{algorithm}_itemsets"] = fi
+        result[f"{algorithm}_rules"] = rules
+
+    result["summary"] = pd.DataFrame(rows)
+    return result
+
+
+_BENCHMARK_MINERS = {
+    "apriori": lambda basket: AssociationRulesMiner(basket_bool=basket),
+    "fpgrowth": lambda basket: FPGrowthMiner(basket_bool=basket),
+    "eclat": lambda basket: EclatMiner(basket_bool=basket),
+}
+
+
+def _run_mining_once(
+    basket_bool: pd.DataFrame,
+    algorithm: str,
+    min_support: float,
+    max_len: int,
+    metric: str,
+    min_threshold: float,
+) -> dict:
+    """Chạy mining + sinh luật một lần, đo riêng thời gian từng pha (perf_counter)."""
+    miner = _BENCHMARK_MINERS[algorithm](basket_bool)
+
+    t0 = time.perf_counter()
+    fi = miner.mine_frequent_itemsets(
+        min_support=min_support,
+        max_len=max_len,
+        use_colnames=True,
+    )
+    t1 = time.perf_counter()
+    rules = miner.generate_rules(metric=metric, min_threshold=min_threshold)
+    t2 = time.perf_counter()
+
+    return {
+        "mine_sec": t1 - t0,
+        "rules_sec": t2 - t1,
+        "total_sec": t2 - t0,
+        "n_itemsets": len(fi),
+        "n_rules": len(rules),
+    }
+
+
+def benchmark_mining_grid(
+    basket_bool: pd.DataFrame,
+    min_supports: tuple = (0.02, 0.01),
+    max_lens: tuple = (2, 3),
+    algorithms: tuple = ("apriori", "fpgrowth", "eclat"),
+    n_repeats: int = 3,
+    warmup: int = 1,
+    track_memory: bool = True,
+    metric: str = "lift",
+    min_threshold: float = 1.0,
+    output_path: str = None,
+) -> pd.DataFrame:
+    """
+    Benchmark các thuật toán khai phá trên lưới tham số
+    (min_support × max_len × algorithm).
+
+    - Mỗi cấu hình chạy `warmup` lần bỏ qua, sau đó `n_repeats` lần đo bằng
+      time.perf_counter, tách riêng thời gian mining và sinh luật.
+    - Nếu track_memory=True, chạy thêm một lần trong track(track_memory=True)
+      để lấy peak memory (tách khỏi các lần đo thời gian vì tracemalloc làm
+      chậm). track() không tắt / reset trace do code khác bật: khi gọi bên
+      trong một tracemalloc ngoài (không phải track()), peak_mem_mb là NaN.
+
+    Args:
+        basket_bool (pd.DataFrame): Boolean encoded basket dataframe
+        min_supports (tuple): Các ngưỡng support cần thử
+        max_lens (tuple): Các giá trị max_len cần thử
+        algorithms (tuple): Tập con của "apriori", "fpgrowth", "eclat"
+        n_repeats (int): Số lần đo cho mỗi cấu hình
+        warmup (int): Số lần chạy khởi động (không ghi nhận)
+        track_memory (bool): Đo peak memory bằng tracemalloc
+        metric (str): Metric cho generate_rules
+        min_threshold (float): Ngưỡng cho generate_rules
+        output_path (str | None): Lưu kết quả ra .json hoặc .csv (nếu có)
+
+    Returns:
+        pd.DataFrame: Bảng tidy, mỗi dòng là một lần đo với các cột
+            ['algorithm', 'min_support', 'max_len', 'repeat', 'mine_sec',
+             'rules_sec', 'total_sec', 'n_itemsets', 'n_rules', 'peak_mem_mb']
+    """
+    unknown = set(algorithms) - set(_BENCHMARK_MINERS)
+    if unknown:
+        raise ValueError(
+            f"algorithm phải thuộc {list(_BENCHMARK_MINERS)}, nhận được {sorted(unknown)}."
+        )
+
+    rows = []
+    for algorithm, min_support, max_len in itertools.product(algorithms, min_supports, max_lens):
+        args = (basket_bool, algorithm, min_support, max_len, metric, min_threshold)
+
+        for _ in range(int(warmup)):
+            _run_mining_once(*args)
+
+        peak_mem_mb = np.nan
+        if track_memory:
+            stage = f"benchmark_mining_grid[{algorithm}, min_support={min_support}, max_len={max_len}]"
+            with track(stage, track_memory=True) as event:
+                _run_mining_once(*args)
+            if event["peak_mem_mb"] is not None:
+                peak_mem_mb = event["peak_mem_mb"]
+
+        for repeat in range(int(n_repeats)):
+            run = _run_mining_once(*args)
+            rows.append(
+                {
+                    "algorithm": algorithm,
+                    "min_support": min_support,
+                    "max_len": max_len,
+                    "repeat": repeat,
+                    **run,
+                    "peak_mem_mb": peak_mem_mb,
+                }
+            )
+
+    results = pd.DataFrame(rows)
+
+    if output_path is not None:
+        out_dir = os.path.dirname(output_path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        if output_path.endswith(".json"):
+            results.to_json(output_path, orient="records", indent=2)
+        else:
+            results.to_csv(output_path, index=False)
+        print(f"Đã lưu kết quả benchmark: {output_path}")
+
+    return results
+
+
+# =========================================================
+# 5.1. SYNTHETIC TRANSACTION GENERATOR (SCALING BENCHMARKS)
+# =========================================================
+
+class SyntheticTransactionGenerator:
+    """
+    Sinh dữ liệu giao dịch giả lập có cùng dạng với output của DataCleaner
+    (InvoiceNo, StockCode, Description, Quantity, InvoiceDate, UnitPrice,
+    CustomerID, Country, TotalPrice) để benchmark pipeline ở quy mô lớn.
+
+    Mô hình (kiểu IBM Quest):
+    - Độ phổ biến item theo power law (Zipf, tham số item_alpha).
+    - Kích thước giỏ ~ 1 + Poisson(avg_basket_size - 1).
+    - Một tập "pattern" (itemset tiềm năng) được chèn vào một phần hoá đơn,
+      tạo ra các luật kết hợp thật để miner tìm thấy.
+    - Tần suất quay lại của khách theo power law (customer_alpha).
+
+    Dữ liệu được sinh theo từng chunk hoá đơn để có thể ghi ra 1M–100M dòng
+    mà không cần giữ toàn bộ trong bộ nhớ.
+    """
+
+    def __init__(
+        self,
+        n_items: int = 4000,
+        n_customers: int = 4000,
+        avg_basket_size: float = 20.0,
+        item_alpha: float = 1.0,
+        customer_alpha: float = 1.0,
+        n_patterns: int = 200,
+        avg_pattern_len: float = 3.0,
+        pattern_rate: float = 0.3,
+        start_date: str = "2010-12-01",
+        end_date: str = "2011-12-09",
+        country: str = "United Kingdom",
+        random_state: int = 42,
+    ):
+        """
+        Initialize the generator.
+
+        Args:
+            n_items (int): Số sản phẩm
+            n_customers (int): Số khách hàng
+            avg_basket_size (float): Số dòng (item) trung bình mỗi hoá đơn
+            item_alpha (float): Số mũ power law cho độ phổ biến item
+            customer_alpha (float): Số mũ power law cho tần suất mua của khách
+            n_patterns (int): Số pattern được chèn
+            avg_pattern_len (float): Độ dài trung bình của pattern
+            pattern_rate (float): Tỷ lệ hoá đơn chứa một pattern
+            start_date (str): Ngày bắt đầu của InvoiceDate
+            end_date (str): Ngày kết thúc của InvoiceDate
+            country (str): Giá trị cột Country
+            random_state (int): Seed
+        """
+        self.n_items = int(n_items)
+        self.n_customers = int(n_customers)
+        self.avg_basket_size = float(avg_basket_size)
+        self.pattern_rate = float(pattern_rate)
+        self.start_date = pd.Timestamp(start_date)
+        self.end_date = pd.Timestamp(end_date)
+        self.country = country
+        self.rng = np.random.default_rng(random_state)
+
+        ranks = np.arange(1, self.n_items + 1, dtype=np.float64)
+        self.item_probs = ranks ** -float(item_alpha)
+        self.item_probs /= self.item_probs.sum()
+        # thứ tự phổ biến không trùng với thứ tự id
+        self.rng.shuffle(self.item_probs)
+
+        cust_ranks = np.arange(1, self.n_customers + 1, dtype=np.float64)
+        self.customer_probs = cust_ranks ** -float(customer_alpha)
+        self.customer_probs /= self.customer_probs.sum()
+
+        pattern_lens = np.clip(
+            self.rng.poisson(avg_pattern_len - 2, size=n_patterns) + 2, 2, self.n_items
+        )
+        self.patterns = [
+            self.rng.choice(self.n_items, size=k, replace=False, p=self.item_probs)
+            for k in pattern_lens
+        ]
+        self.pattern_probs = self.rng.exponential(1.0, size=n_patterns)
+        self.pattern_probs /= self.pattern_probs.sum()
+
+        self.descriptions = np.array(
+            [f"SYNTHETIC ITEM {i:05d}" for i in range(self.n_items)], dtype=object
+        )
+        self.stock_codes = np.array([str(10000 + i) for i in range(self.n_items)], dtype=object)
+        self.unit_prices = np.round(self.rng.lognormal(mean=0.7, sigma=0.8, size=self.n_items), 2)
+        self.unit_prices = np.maximum(self.unit_prices, 0.01)
+
+    def _generate_chunk(self, first_invoice: int, n_invoices: int, t_start, t_end) -> pd.DataFrame:
+        """Sinh một chunk gồm n_invoices hoá đơn liên tiếp."""
+        rng = self.rng
+        sizes = rng.poisson(max(self.avg_basket_size - 1.0, 0.0), size=n_invoices) + 1
+
+        invoice_idx = np.repeat(np.arange(n_invoices), sizes)
+        items = rng.choice(self.n_items, size=invoice_idx.size, p=self.item_probs)
+
+        # chèn pattern vào một phần hoá đơn
+        has_pattern = np.flatnonzero(rng.random(n_invoices) < self.pattern_rate)
+        if len(has_pattern) and self.patterns:
+            chosen = rng.choice(len(self.patterns), size=len(has_pattern), p=self.pattern_probs)
+            pattern_items = [self.patterns[p] for p in chosen]
+            invoice_idx = np.concatenate(
+                [invoice_idx, np.repeat(has_pattern, [len(p) for p in pattern_items])]
+            )
+            items = np.concatenate([items, np.concatenate(pattern_items)])
+
+        # bỏ dòng trùng (invoice, item)
+        pairs = np.unique(invoice_idx.astype(np.int64) * self.n_items + items)
+        invoice_idx = pairs // self.n_items
+        items = pairs % self.n_items
+
+        customers = rng.choice(self.n_customers, size=n_invoices, p=self.customer_probs)
+        seconds = np.sort(rng.uniform(t_start, t_end, size=n_invoices)).astype(np.int64)
+        quantity = rng.geometric(0.3, size=len(items)).astype(np.int64)
+        unit_price = self.unit_prices[items]
+
+        df = pd.DataFrame(
+            {
+                "InvoiceNo": (first_invoice + invoice_idx).astype(str),
+                "StockCode": self.stock_codes[items],
+                "Description": self.descriptions[items],
+                "Quantity": quantity,
+                "InvoiceDate": pd.to_datetime(seconds[invoice_idx], unit="s"),
+                "UnitPrice": unit_price,
+                "CustomerID": pd.Series(12000 + customers[invoice_idx]).astype(str).str.zfill(6).values,
+                "Country": self.country,
+            }
+        )
+        df["TotalPrice"] = df["Quantity"] * df["UnitPrice"]
+        return df
+
+    def iter_chunks(self, n_invoices: int, chunk_size: int = 100_000, first_invoice: int = 536365):
+        """
+        Sinh dữ liệu theo từng chunk hoá đơn.
+
+        Args:
+            n_invoices (int): Tổng số hoá đơn
+            chunk_size (int): Số hoá đơn mỗi chunk
+            first_invoice (int): InvoiceNo bắt đầu
+
+        Yields:
+            pd.DataFrame: Transaction-level dataframe của từng chunk
+        """
+        t0 = self.start_date.value // 10 ** 9
+        t1 = self.end_date.value // 10 ** 9
+        bounds = np.linspace(t0, t1, int(np.ceil(n_invoices / chunk_size)) + 1)
+
+        for i, start in enumerate(range(0, int(n_invoices), int(chunk_size))):
+            n = min(int(chunk_size), int(n_invoices) - start)
+            yield self._generate_chunk(first_invoice + start, n, bounds[i], bounds[i + 1])
+
+    def generate(self, n_invoices: int, chunk_size: int = 100_000) -> pd.DataFrame:
+        """Sinh toàn bộ dữ liệu vào một DataFrame (chỉ dùng cho quy mô vừa phải)."""
+        return pd.concat(list(self.iter_chunks(n_invoices, chunk_size)), ignore_index=True)
+
+    def to_csv(self, output_path: str, n_invoices: int, chunk_size: int = 100_000) -> int:
+        """
+        Ghi dữ liệu giả lập ra CSV theo từng chunk (không giữ toàn bộ trong bộ nhớ).
+
+        Returns:
+            int: Tổng số dòng đã ghi
+        """
+        out_dir = os.path.dirname(output_path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+
+        n_rows = 0
+        for i, chunk in enumerate(self.iter_chunks(n_invoices, chunk_size)):
+            chunk.to_csv(output_path, mode="w" if i == 0 else "a", header=(i == 0), index=False)
+            n_rows += len(chunk)
+
+        print(f"Đã sinh {n_rows:,} dòng giao dịch giả lập: {output_path}")
+        return n_rows
+
+
+
+# =========================================================
+# 6. DATA VISUALIZER (EDA + RFM + ASSOCIATION RULES)
+# =========================================================
+
+class DataVisualizer:
+    """
+    A class for creating visualizations for customer segmentation and
+    shopping behavior analysis.
+
+    This class provides methods for plotting various aspects of the data
+    including temporal patterns, customer behavior, RFM analysis,
+    và trực quan hoá luật kết hợp (Apriori).
+    """
+
+    def __init__(self):
+        """Initialize the DataVisualizer with plotting settings."""
+        plt.style.use("seaborn-v0_8-whitegrid")
+        sns.set_palette("viridis")
+
+    def plot_revenue_over_time(self, df):
+        """
+        Plot daily and monthly revenue patterns.
+
+        Args:
+            df (pd.DataFrame): Dataframe with InvoiceDate and TotalPrice columns
+        """
+        # Daily revenue
+        plt.figure(figsize=(12, 5))
+        daily_revenue = df.groupby(df["InvoiceDate"].dt.date)["TotalPrice"].sum()
+        daily_revenue.plot()
+        plt.title("Doanh thu hàng ngày")
+        plt.xlabel("Ngày")
+        plt.ylabel("Doanh thu (GBP)")
+        plt.tight_layout()
+        plt.show()
+
+        # Monthly revenue
+        plt.figure(figsize=(12, 5))
+        monthly_revenue = df.groupby(pd.Grouper(key="InvoiceDate", freq="M"))[
+            "TotalPrice"
+        ].sum()
+        monthly_revenue.plot(kind="bar")
+        plt.title("Doanh thu hàng tháng")
+        plt.xlabel("Tháng")
+        plt.ylabel("Doanh thu (GBP)")
+        plt.xticks(rotation=45)
+        plt.tight_layout()
+        plt.show()
+
+    def plot_time_patterns(self, df):
+        """
+        Plot purchase patterns by day and hour.
+
+        Args:
+            df (pd.DataFrame): Dataframe with time features:
+                DayOfWeek, HourOfDay
+        """
+        plt.figure(figsize=(12, 5))
+        day_hour_counts = (
+            df.groupby(["DayOfWeek", "HourOfDay"]).size().unstack(fill_value=0)
+        )
+        sns.heatmap(day_hour_counts, cmap="viridis")
+        plt.title("Hoạt động mua hàng theo ngày và giờ")
+        plt.xlabel("Giờ trong ngày")
+        plt.ylabel("Ngày trong tuần (0=Thứ 2, 6=Chủ nhật)")
+        plt.tight_layout()
+        plt.show()
+
+    def plot_product_analysis(self, df, top_n=10):
+        """
+        Plot top products by quantity and revenue.
+
+        Args:
+            df (pd.DataFrame): Transaction dataframe (có Quantity, TotalPrice)
+            top_n (int): Number of top products to show
+        """
+        # Top sản phẩm theo số lượng
+        plt.figure(figsize=(12, 5))
+        top_products = (
+            df.groupby("Description", observed=True)["Quantity"]
+            .sum()
+            .sort_values(ascending=False)
+            .head(top_n)
+        )
+        sns.barplot(x=top_products.values, y=top_products.index)
+        plt.title(f"Top {top_n} sản phẩm theo số lượng bán")
+        plt.xlabel("Số lượng bán")
         plt.tight_layout()
         plt.show()
 
         # Top sản phẩm theo doanh thu
         plt.figure(figsize=(12, 5))
         top_revenue_products = (
-            df.groupby("Description")["TotalPrice"]
+            df.groupby("Description", observed=True)["TotalPrice"]
             .sum()
             .sort_values(ascending=False)
             .head(top_n)
@@ -783,7 +3394,7 @@ class DataVisualizer:
         """
         # Số giao dịch trên mỗi khách hàng
         plt.figure(figsize=(10, 5))
-        transactions_per_customer = df.groupby("CustomerID")["InvoiceNo"].nunique()
+        transactions_per_customer = df.groupby("CustomerID", observed=True)["InvoiceNo"].nunique()
         sns.histplot(transactions_per_customer, bins=30, kde=True)
         plt.title("Phân phối số giao dịch trên mỗi khách hàng")
         plt.xlabel("Số giao dịch")
@@ -793,7 +3404,7 @@ class DataVisualizer:
 
         # Chi tiêu trên mỗi khách hàng
         plt.figure(figsize=(10, 5))
-        spend_per_customer = df.groupby("CustomerID")["TotalPrice"].sum()
+        spend_per_customer = df.groupby("CustomerID", observed=True)["TotalPrice"].sum()
         spend_filter = spend_per_customer < spend_per_customer.quantile(0.99)
         sns.histplot(spend_per_customer[spend_filter], bins=30, kde=True)
         plt.title("Phân phối tổng chi tiêu trên mỗi khách hàng")
@@ -1233,6 +3844,140 @@ class DataVisualizer:
 # =========================================================
 # 7. RULE-BASED CUSTOMER CLUSTERING (ASSOCIATION RULES -> KMEANS)
 # =========================================================
+K_SELECTION_METRICS = (
+    "silhouette",
+    "simplified_silhouette",
+    "calinski_harabasz",
+    "davies_bouldin",
+    "inertia",
+)
+
+
+def _simplified_silhouette(distances: np.ndarray, labels: np.ndarray) -> float:
+    """
+    Silhouette rút gọn theo centroid, O(n·k): a = khoảng cách tới centroid
+    của cụm mình, b = khoảng cách tới centroid gần nhất còn lại.
+    """
+    n = distances.shape[0]
+    a = distances[np.arange(n), labels]
+    others = distances.copy()
+    others[np.arange(n), labels] = np.inf
+    b = others.min(axis=1)
+    denom = np.maximum(a, b)
+    s = np.divide(b - a, denom, out=np.zeros_like(a), where=denom > 0)
+    return float(s.mean())
+
+
+def _evaluate_k(
+    X: np.ndarray,
+    k: int,
+    random_state: int,
+    algorithm: str,
+    batch_size: int,
+    sample_size: int | None,
+    metrics: tuple,
+) -> dict:
+    """Fit KMeans với k cụm và tính các metric chọn k (chạy được trong process con)."""
+    km = RuleBasedCustomerClusterer._make_kmeans(k, random_state, algorithm, batch_size)
+    labels = km.fit_predict(X)
+
+    row = {"k": int(k)}
+    if "silhouette" in metrics:
+        row["silhouette"] = float(
+            silhouette_score(X, labels, sample_size=sample_size, random_state=random_state)
+        )
+    if "simplified_silhouette" in metrics:
+        row["simplified_silhouette"] = _simplified_silhouette(km.transform(X), labels)
+    if "calinski_harabasz" in metrics:
+        row["calinski_harabasz"] = float(calinski_harabasz_score(X, labels))
+    if "davies_bouldin" in metrics:
+        row["davies_bouldin"] = float(davies_bouldin_score(X, labels))
+    if "inertia" in metrics:
+        row["inertia"] = float(km.inertia_)
+    return row
+
+
+def _variant_features(
+    activations: np.ndarray,
+    rfm_values: np.ndarray,
+    rule_weights: dict,
+    antecedent_len: np.ndarray,
+    variant: dict,
+) -> tuple[np.ndarray, StandardScaler | None, StandardScaler | None]:
+    """
+    Dựng feature của một biến thể từ ma trận kích hoạt nhị phân và RFM thô
+    dùng chung (chỉ nhân trọng số / scale, không tính lại kích hoạt).
+
+    Returns:
+        (X, rfm_scaler, rule_scaler): scaler đã fit (None nếu không scale)
+    """
+    top_k = int(variant.get("top_k") or activations.shape[1])
+    X = np.asarray(activations[:, :top_k], dtype=np.float32)
+
+    w = rule_weights[variant.get("weighting", "none")][:top_k].copy()
+    w[antecedent_len[:top_k] < int(variant.get("min_antecedent_len", 1))] = 0.0
+    X = X * w[np.newaxis, :]
+
+    if not variant.get("use_rfm", True):
+        return X, None, None
+
+    rfm = np.asarray(rfm_values, dtype=np.float32)
+    rfm_scaler = rule_scaler = None
+    if variant.get("rfm_scale", True):
+        rfm_scaler = StandardScaler().fit(rfm)
+        rfm = rfm_scaler.transform(rfm)
+    if variant.get("rule_scale", False):
+        rule_scaler = StandardScaler().fit(X)
+        X = rule_scaler.transform(X)
+    return np.hstack([X, rfm]).astype(np.float32), rfm_scaler, rule_scaler
+
+
+def _evaluate_variant(
+    activations: np.ndarray,
+    rfm_values: np.ndarray,
+    rule_weights: dict,
+    antecedent_len: np.ndarray,
+    variant: dict,
+    k_min: int,
+    k_max: int,
+    random_state: int,
+    sample_size: int | None,
+) -> dict:
+    """Chọn k (trừ khi biến thể cố định n_clusters) + fit KMeans cho một biến thể."""
+    X, _, _ = _variant_features(activations, rfm_values, rule_weights, antecedent_len, variant)
+
+    k_scores = None
+    if variant.get("n_clusters"):
+        best_k = int(variant["n_clusters"])
+    else:
+        k_scores = RuleBasedCustomerClusterer.choose_k_by_silhouette(
+            X, k_min=k_min, k_max=k_max, random_state=random_state, sample_size=sample_size,
+        )
+        best_k = int(k_scores.loc[0, "k"])
+    km = KMeans(n_clusters=best_k, n_init="auto", random_state=random_state)
+    labels = km.fit_predict(X)
+    sizes = np.bincount(labels, minlength=best_k)
+    silhouette = silhouette_score(X, labels, sample_size=sample_size, random_state=random_state)
+
+    return {
+        "name": variant.get("name"),
+        "n_features": int(X.shape[1]),
+        "best_k": best_k,
+        "silhouette": float(silhouette),
+        "min_cluster_size": int(sizes.min()),
+        "max_cluster_size": int(sizes.max()),
+        "k_scores": k_scores,
+        "labels": labels,
+    }
+
+
+def _evaluate_variant_memmap(activations_path: str, rfm_path: str, *args) -> dict:
+    """_evaluate_variant trong process con: đọc ma trận dùng chung qua memmap."""
+    activations = np.load(activations_path, mmap_mode="r")
+    rfm_values = np.load(rfm_path, mmap_mode="r")
+    return _evaluate_variant(activations, rfm_values, *args)
+
+
 class RuleBasedCustomerClusterer:
     """Tạo đặc trưng (feature) từ LUẬT KẾT HỢP, sau đó phân cụm khách hàng.
 
@@ -1256,6 +4001,7 @@ class RuleBasedCustomerClusterer:
         quantity_col: str = "Quantity",
         price_col: str = "UnitPrice",
         date_col: str = "InvoiceDate",
+        vocab: Vocabulary | None = None,
     ):
         self.df = df_clean.copy()
         self.customer_col = customer_col
@@ -1264,13 +4010,91 @@ class RuleBasedCustomerClusterer:
         self.quantity_col = quantity_col
         self.price_col = price_col
         self.date_col = date_col
+        # vocabulary dùng chung: cột customer_item matrix = id item (int)
+        self.vocab = vocab
 
         # runtime artifacts
         self.customer_item_bool: pd.DataFrame | None = None
+        self.customer_item_csr_: sparse.csr_matrix | None = None
         self.customers_: list[str] | None = None
         self.rules_df_: pd.DataFrame | None = None
         self.X_: np.ndarray | None = None
         self.model_: KMeans | None = None
+        self.feature_rule_map_: pd.DataFrame | None = None
+
+        # fitted artifacts dùng cho predict() / save() / load()
+        self.feature_params_: dict | None = None
+        self.item_columns_: list | None = None
+        self.rfm_scaler_: StandardScaler | None = None
+        self.rule_scaler_: StandardScaler | None = None
+        self.cluster_centers_: np.ndarray | None = None
+        self.variant_results_: list[dict] | None = None
+
+    @classmethod
+    def from_cleaned_data(
+        cls,
+        path: str,
+        customer_col: str = "CustomerID",
+        invoice_col: str = "InvoiceNo",
+        item_col: str = "Description",
+        quantity_col: str = "Quantity",
+        price_col: str = "UnitPrice",
+        date_col: str = "InvoiceDate",
+        vocab: Vocabulary | None = None,
+        **filters,
+    ) -> "RuleBasedCustomerClusterer":
+        """Tạo clusterer từ dữ liệu đã làm sạch, chỉ đọc các cột cần dùng.
+
+        **filters: countries / start_date / end_date cho load_cleaned_transactions().
+        """
+        df = load_cleaned_transactions(
+            path,
+            columns=[customer_col, invoice_col, item_col, quantity_col, price_col, date_col],
+            **filters,
+        )
+        return cls(
+            df,
+            customer_col=customer_col,
+            invoice_col=invoice_col,
+            item_col=item_col,
+            quantity_col=quantity_col,
+            price_col=price_col,
+            date_col=date_col,
+            vocab=vocab,
+        )
+
+    @staticmethod
+    def _parse_ids(ids) -> list[int]:
+        """Đọc danh sách id item (list hoặc chuỗi "[3, 17]" khi đọc lại từ CSV)."""
+        if isinstance(ids, (list, tuple, set, frozenset, np.ndarray)):
+            return [int(i) for i in ids]
+        s = str(ids).strip().strip("[]")
+        return [int(x) for x in s.split(",") if x.strip()]
+
+    def _rule_antecedents(self, rules: pd.DataFrame) -> list[list]:
+        """Antecedents của từng luật dưới dạng nhãn cột của customer_item matrix.
+
+        - Có vocabulary và cột antecedent_ids: dùng trực tiếp id (không tách chuỗi tên).
+        - Luật đọc từ Parquet (antecedents là frozenset): dùng trực tiếp tên item.
+        - Ngược lại: tách antecedents_str, rồi mã hoá sang id nếu có vocabulary.
+        """
+        if self.vocab is not None and "antecedent_ids" in rules.columns:
+            return [self._parse_ids(x) for x in rules["antecedent_ids"]]
+
+        if (
+            "antecedents" in rules.columns
+            and rules.shape[0] > 0
+            and isinstance(rules["antecedents"].iloc[0], frozenset)
+        ):
+            antecedents = [sorted(a) for a in rules["antecedents"]]
+        elif "antecedents_str" in rules.columns:
+            antecedents = [self._parse_items(x) for x in rules["antecedents_str"]]
+        else:
+            antecedents = [[] for _ in range(rules.shape[0])]
+
+        if self.vocab is not None:
+            antecedents = [self.vocab.encode_items(a).tolist() if a else [] for a in antecedents]
+        return antecedents
 
     @staticmethod
     def _parse_items(items_str: str) -> list[str]:
@@ -1282,8 +4106,12 @@ class RuleBasedCustomerClusterer:
         # format mặc định trong project: "A, B, C"
         return [x.strip() for x in s.split(",") if x.strip()]
 
-    def build_customer_item_matrix(self, threshold: int = 1) -> pd.DataFrame:
-        """Tạo Customer × Item boolean (khách đã từng mua item hay chưa)."""
+    def build_customer_item_matrix(self, threshold: int = 1, as_sparse: bool = False) -> pd.DataFrame:
+        """Tạo Customer × Item boolean (khách đã từng mua item hay chưa).
+
+        as_sparse=True: dựng thẳng ma trận thưa (pandas sparse dtype) từ các cặp
+        (khách, item), không qua unstack dense — dùng cho tập khách rất lớn.
+        """
         df = self.df.copy()
 
         if self.customer_col not in df.columns:
@@ -1299,12 +4127,31 @@ class RuleBasedCustomerClusterer:
         )
 
         customer_item_qty = (
-            df.groupby([self.customer_col, self.item_col])[self.quantity_col]
-            .sum()
-            .unstack(fill_value=0)
+            df.groupby([self.customer_col, self.item_col], observed=True)[self.quantity_col].sum()
         )
-        customer_item_bool = (customer_item_qty >= threshold)
+        if as_sparse:
+            cust_codes, customers = pd.factorize(customer_item_qty.index.get_level_values(0), sort=True)
+            item_codes, items = pd.factorize(customer_item_qty.index.get_level_values(1), sort=True)
+            keep = customer_item_qty.to_numpy() >= threshold
+            M = sparse.csr_matrix(
+                (np.ones(int(keep.sum()), dtype=bool), (cust_codes[keep], item_codes[keep])),
+                shape=(len(customers), len(items)),
+            )
+            customer_item_bool = pd.DataFrame.sparse.from_spmatrix(
+                M,
+                index=pd.Index(np.asarray(customers), name=self.customer_col),
+                columns=pd.Index(np.asarray(items), name=self.item_col),
+            )
+        else:
+            customer_item_bool = customer_item_qty.unstack(fill_value=0) >= threshold
+
+        if self.vocab is not None:
+            item_ids = self.vocab.encode_items(customer_item_bool.columns)
+            customer_item_bool = customer_item_bool.loc[:, item_ids >= 0]
+            customer_item_bool.columns = pd.Index(item_ids[item_ids >= 0], name=self.item_col)
+
         self.customer_item_bool = customer_item_bool
+        self.customer_item_csr_ = None
         self.customers_ = customer_item_bool.index.astype(str).tolist()
         return self.customer_item_bool
 
@@ -1317,14 +4164,36 @@ class RuleBasedCustomerClusterer:
         min_confidence: float | None = None,
         min_lift: float | None = None,
     ) -> pd.DataFrame:
-        """Đọc rules CSV và chọn Top-K luật để tạo feature."""
-        rules = pd.read_csv(rules_csv_path)
+        """Đọc rules (CSV, hoặc Parquet nếu đuôi .parquet) và chọn Top-K luật để tạo feature."""
+        if rules_csv_path.endswith(".parquet"):
+            rules = load_rules_parquet(rules_csv_path, vocab=self.vocab)
+        else:
+            rules = pd.read_csv(rules_csv_path)
 
+        return self.select_rules(
+            rules,
+            top_k=top_k,
+            sort_by=sort_by,
+            min_support=min_support,
+            min_confidence=min_confidence,
+            min_lift=min_lift,
+        )
+
+    def select_rules(
+        self,
+        rules: pd.DataFrame,
+        top_k: int = 200,
+        sort_by: str = "lift",
+        min_support: float | None = None,
+        min_confidence: float | None = None,
+        min_lift: float | None = None,
+    ) -> pd.DataFrame:
+        """Chọn Top-K luật từ rules DataFrame đã có trong bộ nhớ (vd output của miner)."""
         # kỳ vọng notebook Apriori đã add_readable_rule_str()
         required_cols = {"antecedents_str", "consequents_str"}
         if not required_cols.issubset(set(rules.columns)):
             raise ValueError(
-                "rules_csv_path cần có cột antecedents_str và consequents_str. "
+                "rules cần có cột antecedents_str và consequents_str. "
                 "Hãy đảm bảo notebook Apriori đã gọi add_readable_rule_str() và lưu lại."
             )
 
@@ -1346,58 +4215,175 @@ class RuleBasedCustomerClusterer:
         self.rules_df_ = rules
         return rules
 
-    def build_rule_feature_matrix(
-        self,
-        weighting: str = "none",
-        min_antecedent_len: int = 1,
-    ) -> np.ndarray:
-        """Tạo ma trận đặc trưng Customer × Rule.
-
-        weighting:
-        - "none": feature 0/1
-        - "lift" / "confidence" / "support": nhân trọng số theo cột tương ứng (nếu có)
-        - "lift_x_conf": lift * confidence (nếu có)
-        """
+    def _customer_item_csr(self) -> sparse.csr_matrix:
+        """Customer × Item dạng CSR (int32), cache lại cho các lần build sau."""
         if self.customer_item_bool is None:
             self.build_customer_item_matrix()
+        if self.customer_item_csr_ is None:
+            self.customer_item_csr_ = _basket_to_csc(self.customer_item_bool).tocsr()
+        return self.customer_item_csr_
 
-        if self.rules_df_ is None:
-            raise ValueError("Chưa load rules. Hãy gọi load_rules() trước.")
+    def _build_antecedent_matrix(
+        self,
+        rules: pd.DataFrame,
+        min_antecedent_len: int = 1,
+    ) -> tuple[sparse.csc_matrix, np.ndarray, np.ndarray]:
+        """Tạo ma trận chỉ báo antecedent A (Item × Antecedent).
 
-        customer_item = self.customer_item_bool
-        rules = self.rules_df_.copy()
+        Mỗi tập antecedents phân biệt chỉ chiếm một cột của A, các luật có
+        cùng antecedents (chỉ khác consequents) dùng chung cột đó.
 
-        n_customers = customer_item.shape[0]
+        Returns:
+            (A, antecedent_len, rule_group):
+            - A[i, g] = 1 nếu item i thuộc tập antecedents thứ g
+            - antecedent_len[g] = số item (không trùng) trong tập antecedents g
+            - rule_group[j] = cột g của luật j trong A, -1 nếu luật bị bỏ qua
+              (antecedents quá ngắn hoặc có item không nằm trong customer_item matrix)
+        """
+        columns = self.customer_item_bool.columns
+        if self.vocab is None:
+            columns = columns.astype(str)
+        item_index = {item: i for i, item in enumerate(columns)}
         n_rules = rules.shape[0]
-        X = np.zeros((n_customers, n_rules), dtype=np.float32)
 
-        # map cột item -> idx để kiểm tra nhanh
-        item_cols = set(customer_item.columns.astype(str))
+        rows: list[int] = []
+        cols: list[int] = []
+        group_len: list[int] = []
+        group_of: dict[tuple[int, ...], int] = {}
+        rule_group = np.full(n_rules, -1, dtype=np.int64)
 
-        for j, row in rules.iterrows():
-            ants = self._parse_items(row.get("antecedents_str", ""))
+        for j, ants in enumerate(self._rule_antecedents(rules)):
             if len(ants) < min_antecedent_len:
                 continue
 
-            # nếu antecedents có item không nằm trong customer_item matrix => bỏ luật (tránh KeyError)
-            if any(a not in item_cols for a in ants):
+            idx = [item_index.get(a) for a in ants]
+            # antecedents có item không nằm trong customer_item matrix => bỏ luật
+            if any(i is None for i in idx):
                 continue
 
-            # khách hàng nào mua đủ antecedents?
-            mask = customer_item[ants].all(axis=1).astype(np.float32).values
+            key = tuple(sorted(set(idx)))
+            g = group_of.get(key)
+            if g is None:
+                g = len(group_len)
+                group_of[key] = g
+                rows.extend(key)
+                cols.extend([g] * len(key))
+                group_len.append(len(key))
+            rule_group[j] = g
+
+        A = sparse.csc_matrix(
+            (np.ones(len(rows), dtype=np.int32), (rows, cols)),
+            shape=(len(item_index), len(group_len)),
+        )
+        return A, np.asarray(group_len, dtype=np.int32), rule_group
+
+    @staticmethod
+    def _rule_weights(rules: pd.DataFrame, weighting: str = "none") -> np.ndarray:
+        """Vector trọng số cho từng luật theo weighting (mặc định 1.0)."""
+        w = np.ones(rules.shape[0], dtype=np.float32)
+        if weighting in ("lift", "confidence", "support") and weighting in rules.columns:
+            w = rules[weighting].to_numpy(dtype=np.float32)
+        elif weighting == "lift_x_conf" and {"lift", "confidence"}.issubset(rules.columns):
+            w = (rules["lift"] * rules["confidence"]).to_numpy(dtype=np.float32)
+        return w
+
+    def _rule_activation_matrix(
+        self,
+        rules: pd.DataFrame,
+        weighting: str = "none",
+        min_antecedent_len: int = 1,
+        collapse_antecedents: bool = False,
+        collapse_agg: str = "max",
+        rows: slice | None = None,
+        antecedents: tuple | None = None,
+    ) -> np.ndarray:
+        """Tính kích hoạt Customer × Rule cho tất cả luật cùng lúc.
+
+        Khách i kích hoạt tập antecedents g khi
+        (customer_item_csr @ A)[i, g] == |antecedents_g|; mỗi tập antecedents
+        chỉ được tính một lần rồi dùng lại cho mọi luật chung antecedents.
+
+        Nếu collapse_antecedents=True, trả về ma trận Customer × Antecedent
+        (một cột cho mỗi tập antecedents phân biệt, trọng số gộp theo
+        collapse_agg) và lưu ánh xạ cột → luật vào self.feature_rule_map_.
+
+        rows: chỉ tính cho một khối khách (slice trên customer_item matrix),
+        dùng khi sinh feature theo từng khối.
+        antecedents: kết quả _build_antecedent_matrix() đã dựng sẵn (dùng lại
+        giữa các khối thay vì dựng lại cho mỗi khối).
+        """
+        C = self._customer_item_csr()
+        if rows is not None:
+            C = C[rows]
+        if antecedents is None:
+            antecedents = self._build_antecedent_matrix(rules, min_antecedent_len=min_antecedent_len)
+        A, antecedent_len, rule_group = antecedents
+
+        # số antecedents mà mỗi khách đã mua, cho từng tập antecedents
+        hits = (C @ A).toarray()
+        active_groups = hits == antecedent_len[np.newaxis, :]
+
+        weights = self._rule_weights(rules, weighting=weighting)
+        valid = rule_group >= 0
+
+        if collapse_antecedents:
+            rule_ids = np.flatnonzero(valid)
+            groups = pd.DataFrame(
+                {"feature": rule_group[valid], "rule_index": rule_ids, "weight": weights[valid]}
+            ).groupby("feature")
+            group_weights = groups["weight"].agg(collapse_agg).to_numpy(dtype=np.float32)
+
+            feature_rule_map = groups["rule_index"].agg(list).rename("rule_indices").reset_index()
+            feature_rule_map["n_rules"] = feature_rule_map["rule_indices"].apply(len)
+            if "antecedents_str" in rules.columns:
+                first_rule = feature_rule_map["rule_indices"].str[0]
+                feature_rule_map.insert(
+                    1,
+                    "antecedents_str",
+                    rules["antecedents_str"].to_numpy()[first_rule.to_numpy(dtype=np.int64)],
+                )
+            self.feature_rule_map_ = feature_rule_map
+
+            return active_groups.astype(np.float32) * group_weights[np.newaxis, :]
+
+        active = np.zeros((C.shape[0], rules.shape[0]), dtype=bool)
+        active[:, valid] = active_groups[:, rule_group[valid]]
+        X = active.astype(np.float32) * weights[np.newaxis, :]
+        return X
+
+    def build_rule_feature_matrix(
+        self,
+        weighting: str = "none",
+        min_antecedent_len: int = 1,
+        collapse_antecedents: bool = False,
+        collapse_agg: str = "max",
+    ) -> np.ndarray:
+        """Tạo ma trận đặc trưng Customer × Rule.
+
+        weighting:
+        - "none": feature 0/1
+        - "lift" / "confidence" / "support": nhân trọng số theo cột tương ứng (nếu có)
+        - "lift_x_conf": lift * confidence (nếu có)
+
+        collapse_antecedents:
+        - False: mỗi luật một cột (mặc định)
+        - True: gộp các luật có cùng antecedents thành một cột (trọng số gộp
+          theo collapse_agg: "max" / "mean" / "sum"); ánh xạ cột → luật được
+          lưu trong self.feature_rule_map_ để profiling.
+        """
+        if self.customer_item_bool is None:
+            self.build_customer_item_matrix()
 
-            # trọng số
-            w = 1.0
-            if weighting == "lift" and "lift" in row:
-                w = float(row["lift"])
-            elif weighting == "confidence" and "confidence" in row:
-                w = float(row["confidence"])
-            elif weighting == "support" and "support" in row:
-                w = float(row["support"])
-            elif weighting == "lift_x_conf" and ("lift" in row) and ("confidence" in row):
-                w = float(row["lift"]) * float(row["confidence"])
+        if self.rules_df_ is None:
+            raise ValueError("Chưa load rules. Hãy gọi load_rules() trước.")
 
-            X[:, j] = mask * w
+        X = self._rule_activation_matrix(
+            self.rules_df_,
+            weighting=weighting,
+            min_antecedent_len=min_antecedent_len,
+            collapse_antecedents=collapse_antecedents,
+            collapse_agg=collapse_agg,
+        )
 
         self.X_ = X
         return X
@@ -1417,64 +4403,36 @@ class RuleBasedCustomerClusterer:
             self.build_customer_item_matrix()
 
         if rules_df is not None:
-            rules = rules_df.copy()
+            rules = rules_df.reset_index(drop=True)
         elif self.rules_df_ is None:
             raise ValueError("Chưa load rules. Hãy gọi load_rules() hoặc truyền rules_df trước.")
         else:
-            rules = self.rules_df_.copy()
-
-        customer_item = self.customer_item_bool
-        n_customers = customer_item.shape[0]
-        n_rules = rules.shape[0]
-        X = np.zeros((n_customers, n_rules), dtype=np.float32)
-
-        item_cols = set(customer_item.columns.astype(str))
-
-        for j, row in rules.iterrows():
-            ants = self._parse_items(row.get("antecedents_str", ""))
-            if len(ants) < min_antecedent_len:
-                continue
-
-            if any(a not in item_cols for a in ants):
-                continue
-
-            mask = customer_item[ants].all(axis=1).astype(np.float32).values
+            rules = self.rules_df_
 
-            w = 1.0
-            if weighting == "lift" and "lift" in row:
-                w = float(row["lift"])
-            elif weighting == "confidence" and "confidence" in row:
-                w = float(row["confidence"])
-            elif weighting == "support" and "support" in row:
-                w = float(row["support"])
-            elif weighting == "lift_x_conf" and ("lift" in row) and ("confidence" in row):
-                w = float(row["lift"]) * float(row["confidence"])
-
-            X[:, j] = mask * w
-
-        return X
+        return self._rule_activation_matrix(
+            rules,
+            weighting=weighting,
+            min_antecedent_len=min_antecedent_len,
+        )
 
     def compute_rfm(self, snapshot_date=None) -> pd.DataFrame:
-        """Tính RFM trực tiếp từ df_clean (tương tự DataCleaner.compute_rfm)."""
-        df = self.df.copy()
-        if "TotalPrice" not in df.columns:
-            df["TotalPrice"] = df[self.quantity_col] * df[self.price_col]
-
+        """Tính RFM trực tiếp từ df_clean (tương tự DataCleaner.compute_rfm, qua RFMState)."""
+        cols = [self.invoice_col, self.date_col]
+        cols += ["TotalPrice"] if "TotalPrice" in self.df.columns else [self.quantity_col, self.price_col]
+        df = self.df[cols].copy()
         df[self.customer_col] = (
-            df[self.customer_col].astype(str).str.replace(".0", "", regex=False).str.zfill(6)
+            self.df[self.customer_col].astype(str).str.replace(".0", "", regex=False).str.zfill(6)
         )
 
-        if snapshot_date is None:
-            snapshot_date = pd.to_datetime(df[self.date_col]).max() + pd.Timedelta(days=1)
-        else:
-            snapshot_date = pd.to_datetime(snapshot_date)
-
-        rfm = df.groupby(self.customer_col).agg(
-            Recency=(self.date_col, lambda x: (snapshot_date - pd.to_datetime(x).max()).days),
-            Frequency=(self.invoice_col, "nunique"),
-            Monetary=("TotalPrice", "sum"),
+        state = RFMState.from_transactions(
+            df,
+            customer_col=self.customer_col,
+            invoice_col=self.invoice_col,
+            date_col=self.date_col,
+            quantity_col=self.quantity_col,
+            price_col=self.price_col,
         )
-        return rfm.reset_index()
+        return state.rfm(snapshot_date)
 
     def build_final_features(
         self,
@@ -1483,6 +4441,7 @@ class RuleBasedCustomerClusterer:
         rfm_scale: bool = True,
         rule_scale: bool = False,
         min_antecedent_len: int = 1,
+        collapse_antecedents: bool = False,
     ) -> tuple[np.ndarray, pd.DataFrame]:
         """Trả về (X, meta_df) với meta_df gồm CustomerID và (tuỳ chọn) RFM."""
         if self.customer_item_bool is None:
@@ -1492,10 +4451,25 @@ class RuleBasedCustomerClusterer:
         X_rules = self.build_rule_feature_matrix(
             weighting=weighting,
             min_antecedent_len=min_antecedent_len,
+            collapse_antecedents=collapse_antecedents,
         )
 
         meta = pd.DataFrame({self.customer_col: self.customers_})
 
+        # ghi lại cấu hình + scaler đã fit để predict() khách mới theo đúng pipeline này
+        self.feature_params_ = {
+            "weighting": weighting,
+            "use_rfm": use_rfm,
+            "rfm_scale": rfm_scale,
+            "rule_scale": rule_scale,
+            "min_antecedent_len": min_antecedent_len,
+            "collapse_antecedents": collapse_antecedents,
+            "top_k": None,
+        }
+        self.item_columns_ = self.customer_item_bool.columns.tolist()
+        self.rfm_scaler_ = None
+        self.rule_scaler_ = None
+
         if not use_rfm:
             self.X_ = X_rules
             return X_rules, meta
@@ -1509,42 +4483,563 @@ class RuleBasedCustomerClusterer:
         rfm_values = meta[rfm_cols].fillna(0).values.astype(np.float32)
 
         if rfm_scale:
-            rfm_values = StandardScaler().fit_transform(rfm_values)
+            self.rfm_scaler_ = StandardScaler().fit(rfm_values)
+            rfm_values = self.rfm_scaler_.transform(rfm_values)
 
         if rule_scale:
-            X = StandardScaler().fit_transform(X_rules)
+            self.rule_scaler_ = StandardScaler().fit(X_rules)
+            X = self.rule_scaler_.transform(X_rules)
 
         X_final = np.hstack([X, rfm_values]).astype(np.float32)
         self.X_ = X_final
         return X_final, meta
 
+    @staticmethod
+    def _make_kmeans(
+        n_clusters: int,
+        random_state: int = 42,
+        algorithm: str = "kmeans",
+        batch_size: int = 4096,
+    ) -> KMeans | MiniBatchKMeans:
+        """KMeans (full-batch) hoặc MiniBatchKMeans theo algorithm."""
+        if algorithm == "kmeans":
+            return KMeans(n_clusters=int(n_clusters), n_init="auto", random_state=random_state)
+        if algorithm == "minibatch":
+            return MiniBatchKMeans(
+                n_clusters=int(n_clusters),
+                batch_size=int(batch_size),
+                n_init="auto",
+                random_state=random_state,
+            )
+        raise ValueError("algorithm phải là 'kmeans' hoặc 'minibatch'.")
+
     @staticmethod
     def choose_k_by_silhouette(
         X: np.ndarray,
         k_min: int = 2,
         k_max: int = 10,
         random_state: int = 42,
+        algorithm: str = "kmeans",
+        batch_size: int = 4096,
+        sample_size: int | None = None,
+        metrics: tuple = ("silhouette",),
+        sort_by: str = "silhouette",
+        n_jobs: int | None = 1,
+    ) -> pd.DataFrame:
+        """
+        Chọn k: fit KMeans cho từng k và tính các metric trong cùng một lượt.
+
+        Args:
+            X (np.ndarray): Feature matrix
+            k_min, k_max (int): Khoảng k cần thử
+            random_state (int): Random seed
+            algorithm (str): "kmeans" hoặc "minibatch" (MiniBatchKMeans)
+            batch_size (int): Batch size cho MiniBatchKMeans
+            sample_size (int | None): Số điểm lấy mẫu để tính silhouette
+                (None = toàn bộ, O(n²))
+            metrics (tuple): Tập con của K_SELECTION_METRICS:
+                - "silhouette": silhouette_score (có thể lấy mẫu)
+                - "simplified_silhouette": silhouette theo centroid, O(n·k)
+                - "calinski_harabasz" / "davies_bouldin": metric rẻ của sklearn
+                - "inertia": để vẽ elbow (không dùng làm sort_by)
+            sort_by (str): Metric dùng để sắp xếp kết quả, hàng đầu là k tốt
+                nhất (davies_bouldin: tăng dần; còn lại: giảm dần)
+            n_jobs (int | None): Số process đánh giá các k song song
+                (1 = tuần tự, None = số CPU)
+
+        Returns:
+            pd.DataFrame: Mỗi hàng một k với các metric đã chọn
+        """
+        unknown = set(metrics) - set(K_SELECTION_METRICS)
+        if unknown:
+            raise ValueError(f"metrics không hợp lệ: {sorted(unknown)}")
+        if sort_by not in metrics:
+            raise ValueError("sort_by phải nằm trong metrics.")
+        if sort_by == "inertia":
+            # inertia luôn giảm theo k => hàng đầu luôn là k_max
+            raise ValueError("inertia không dùng để chọn k (luôn giảm theo k); hãy vẽ elbow.")
+
+        ks = list(range(int(k_min), int(k_max) + 1))
+        args = (random_state, algorithm, batch_size, sample_size, tuple(metrics))
+        if n_jobs == 1:
+            rows = [_evaluate_k(X, k, *args) for k in ks]
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                futures = [executor.submit(_evaluate_k, X, k, *args) for k in ks]
+                rows = [future.result() for future in futures]
+
+        ascending = sort_by == "davies_bouldin"
+        return pd.DataFrame(rows).sort_values(sort_by, ascending=ascending).reset_index(drop=True)
+
+    def _variant_inputs(self) -> tuple[np.ndarray, np.ndarray, dict, np.ndarray]:
+        """Kích hoạt nhị phân Customer × Rule, RFM thô, trọng số và độ dài antecedents (tính một lần)."""
+        if self.customer_item_bool is None:
+            self.build_customer_item_matrix()
+        if self.rules_df_ is None:
+            raise ValueError("Chưa load rules. Hãy gọi load_rules() trước.")
+
+        rules = self.rules_df_
+        activations = self._rule_activation_matrix(rules, weighting="none")
+
+        meta = pd.DataFrame({self.customer_col: self.customers_})
+        rfm = meta.merge(self.compute_rfm(), on=self.customer_col, how="left")
+        rfm_values = rfm[["Recency", "Frequency", "Monetary"]].fillna(0).values.astype(np.float32)
+
+        rule_weights = {
+            w: self._rule_weights(rules, w)
+            for w in ("none", "lift", "confidence", "support", "lift_x_conf")
+        }
+        antecedent_len = np.array(
+            [len(set(a)) for a in self._rule_antecedents(rules)], dtype=np.int32
+        )
+        return activations, rfm_values, rule_weights, antecedent_len
+
+    def evaluate_variants(
+        self,
+        variants: list[dict],
+        k_min: int = 2,
+        k_max: int = 10,
+        random_state: int = 42,
+        sample_size: int | None = None,
+        n_jobs: int | None = 1,
+        cache_dir: str | None = None,
     ) -> pd.DataFrame:
-        """Chọn k dựa trên silhouette score."""
-        rows = []
-        for k in range(int(k_min), int(k_max) + 1):
-            km = KMeans(n_clusters=k, n_init="auto", random_state=random_state)
-            labels = km.fit_predict(X)
-            score = silhouette_score(X, labels)
-            rows.append({"k": k, "silhouette": score})
-        return pd.DataFrame(rows).sort_values("silhouette", ascending=False).reset_index(drop=True)
+        """
+        So sánh nhiều biến thể feature (weighting / RFM / scale / top_k).
+
+        Ma trận kích hoạt nhị phân Customer × Rule và RFM chỉ tính một lần;
+        mỗi biến thể được suy ra bằng nhân trọng số + scale. Khi n_jobs != 1,
+        hai ma trận này được ghi ra .npy và các process con đọc qua memmap
+        (không pickle bản sao cho từng biến thể).
+
+        Args:
+            variants (list[dict]): Mỗi biến thể gồm các khoá của
+                build_final_features() (weighting, use_rfm, rfm_scale, rule_scale,
+                min_antecedent_len), cộng thêm name, top_k (Top-K luật đầu của
+                rules đã load) và n_clusters (cố định k, bỏ qua chọn k;
+                k_scores của biến thể đó là None)
+            k_min, k_max (int): Khoảng k cho choose_k_by_silhouette()
+            random_state (int): Random seed
+            sample_size (int | None): Lấy mẫu khi tính silhouette
+            n_jobs (int | None): Số process (1 = tuần tự, None = số CPU)
+            cache_dir (str | None): Thư mục ghi ma trận memmap (mặc định thư mục tạm)
+
+        Returns:
+            pd.DataFrame: Một hàng mỗi biến thể, sort theo silhouette giảm dần;
+                chi tiết (k_scores, labels) lưu trong self.variant_results_
+        """
+        activations, rfm_values, rule_weights, antecedent_len = self._variant_inputs()
+        for variant in variants:
+            if variant.get("weighting", "none") not in rule_weights:
+                raise ValueError(f"weighting không hợp lệ: {variant.get('weighting')}")
+            if int(variant.get("top_k") or 0) > activations.shape[1]:
+                raise ValueError("top_k của biến thể lớn hơn số luật đã load.")
+
+        args = (k_min, k_max, random_state, sample_size)
+        if n_jobs == 1:
+            results = [
+                _evaluate_variant(activations, rfm_values, rule_weights, antecedent_len, variant, *args)
+                for variant in variants
+            ]
+        else:
+            work_dir = cache_dir or tempfile.mkdtemp(prefix="variants_")
+            os.makedirs(work_dir, exist_ok=True)
+            activations_path = os.path.join(work_dir, "activations.npy")
+            rfm_path = os.path.join(work_dir, "rfm.npy")
+            np.save(activations_path, activations)
+            np.save(rfm_path, rfm_values)
+            try:
+                with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                    futures = [
+                        executor.submit(
+                            _evaluate_variant_memmap, activations_path, rfm_path,
+                            rule_weights, antecedent_len, variant, *args,
+                        )
+                        for variant in variants
+                    ]
+                    results = [future.result() for future in futures]
+            finally:
+                if cache_dir is None:
+                    shutil.rmtree(work_dir, ignore_errors=True)
+
+        self.variant_results_ = results
+        summary = pd.DataFrame([
+            {
+                "variant": variant.get("name", f"V{i + 1}"),
+                "weighting": variant.get("weighting", "none"),
+                "use_rfm": variant.get("use_rfm", True),
+                "rfm_scale": variant.get("rfm_scale", True),
+                "rule_scale": variant.get("rule_scale", False),
+                "top_k": int(variant.get("top_k") or activations.shape[1]),
+                **{k: v for k, v in res.items() if k not in ("name", "k_scores", "labels")},
+            }
+            for i, (variant, res) in enumerate(zip(variants, results))
+        ])
+        return summary.sort_values("silhouette", ascending=False)
+
+    def build_variant_features(self, variant: dict) -> tuple[np.ndarray, pd.DataFrame]:
+        """
+        Dựng (X, meta) cho một biến thể của evaluate_variants() (vd biến thể tốt nhất).
+
+        Giống build_final_features(): ghi lại cấu hình (kèm top_k), tập item
+        cột và scaler đã fit, nên fit_kmeans() -> predict() / save() dùng
+        đúng biến thể này.
+        """
+        activations, rfm_values, rule_weights, antecedent_len = self._variant_inputs()
+        X, rfm_scaler, rule_scaler = _variant_features(
+            activations, rfm_values, rule_weights, antecedent_len, variant
+        )
+
+        top_k = variant.get("top_k")
+        self.feature_params_ = {
+            "weighting": variant.get("weighting", "none"),
+            "use_rfm": variant.get("use_rfm", True),
+            "rfm_scale": variant.get("rfm_scale", True),
+            "rule_scale": variant.get("rule_scale", False),
+            "min_antecedent_len": int(variant.get("min_antecedent_len", 1)),
+            "collapse_antecedents": False,
+            "top_k": int(top_k) if top_k else None,
+        }
+        self.item_columns_ = self.customer_item_bool.columns.tolist()
+        self.rfm_scaler_ = rfm_scaler
+        self.rule_scaler_ = rule_scaler
+        self.X_ = X
+
+        meta = pd.DataFrame({self.customer_col: self.customers_})
+        if variant.get("use_rfm", True):
+            meta = meta.merge(self.compute_rfm(), on=self.customer_col, how="left")
+        return X, meta
+
+    def _feature_rules(self) -> pd.DataFrame:
+        """Các luật dùng làm feature của pipeline đã fit (Top-K đầu nếu biến thể có top_k)."""
+        top_k = (self.feature_params_ or {}).get("top_k")
+        return self.rules_df_ if not top_k else self.rules_df_.iloc[: int(top_k)]
 
     def fit_kmeans(
         self,
         X: np.ndarray,
         n_clusters: int,
         random_state: int = 42,
+        algorithm: str = "kmeans",
+        batch_size: int = 4096,
     ) -> np.ndarray:
-        """Fit KMeans và trả về labels."""
-        self.model_ = KMeans(n_clusters=int(n_clusters), n_init="auto", random_state=random_state)
+        """Fit KMeans (hoặc MiniBatchKMeans nếu algorithm="minibatch") và trả về labels."""
+        self.model_ = self._make_kmeans(n_clusters, random_state, algorithm, batch_size)
         labels = self.model_.fit_predict(X)
+        self.cluster_centers_ = self.model_.cluster_centers_
         return labels
 
+    def iter_feature_blocks(
+        self,
+        block_size: int = 50_000,
+        antecedents: tuple | None = None,
+        rfm_values: np.ndarray | None = None,
+    ):
+        """
+        Sinh feature cuối cùng theo từng khối khách (không giữ cả ma trận X).
+
+        Dùng cấu hình + scaler đã fit (build_final_features() hoặc
+        fit_kmeans_streaming()); kích hoạt luật được tính trực tiếp từ
+        customer_item CSR cho từng khối. Ma trận antecedent chỉ dựng một lần
+        (hoặc truyền vào qua antecedents để dùng lại giữa nhiều lượt); tương
+        tự, rfm_values (RFM đã scale, cùng thứ tự self.customers_) tránh tính
+        lại RFM trên toàn bộ giao dịch ở mỗi lượt.
+
+        Yields:
+            (rows, X_block): slice khách trong self.customers_ và feature float32
+        """
+        if self.feature_params_ is None:
+            raise ValueError("Chưa có cấu hình feature. Hãy gọi build_final_features() hoặc fit_kmeans_streaming().")
+        params = self.feature_params_
+        n_customers = self._customer_item_csr().shape[0]
+
+        if not params["use_rfm"]:
+            rfm_values = None
+        elif rfm_values is None:
+            rfm_values = self._scaled_rfm_values()
+
+        rules = self._feature_rules()
+        if antecedents is None:
+            antecedents = self._build_antecedent_matrix(
+                rules, min_antecedent_len=params["min_antecedent_len"]
+            )
+
+        for start in range(0, n_customers, int(block_size)):
+            rows = slice(start, min(start + int(block_size), n_customers))
+            X = self._rule_activation_matrix(
+                rules,
+                weighting=params["weighting"],
+                min_antecedent_len=params["min_antecedent_len"],
+                collapse_antecedents=params["collapse_antecedents"],
+                rows=rows,
+                antecedents=antecedents,
+            )
+            if rfm_values is not None:
+                if self.rule_scaler_ is not None:
+                    X = self.rule_scaler_.transform(X)
+                X = np.hstack([X, rfm_values[rows]])
+            yield rows, X.astype(np.float32)
+
+    def _scaled_rfm_values(self) -> np.ndarray:
+        """RFM (n × 3) theo thứ tự self.customers_, đã qua rfm_scaler_ nếu có."""
+        meta = pd.DataFrame({self.customer_col: self.customers_})
+        rfm = meta.merge(self.compute_rfm(), on=self.customer_col, how="left")
+        rfm_values = rfm[["Recency", "Frequency", "Monetary"]].fillna(0).values.astype(np.float32)
+        if self.rfm_scaler_ is not None:
+            rfm_values = self.rfm_scaler_.transform(rfm_values)
+        return rfm_values
+
+    def fit_kmeans_streaming(
+        self,
+        n_clusters: int,
+        block_size: int = 50_000,
+        n_epochs: int = 1,
+        batch_size: int = 4096,
+        random_state: int = 42,
+        weighting: str = "none",
+        use_rfm: bool = True,
+        rfm_scale: bool = True,
+        rule_scale: bool = False,
+        min_antecedent_len: int = 1,
+        collapse_antecedents: bool = False,
+    ) -> tuple[np.ndarray, pd.DataFrame]:
+        """
+        MiniBatchKMeans.partial_fit trên các khối feature sinh trực tiếp từ
+        kích hoạt luật thưa — dành cho hàng triệu khách, không cần giữ toàn bộ X.
+
+        Các tham số feature giống build_final_features(); scaler của RFM fit
+        trên toàn bộ RFM (n × 3), scaler của rule feature fit bằng partial_fit
+        qua một lượt khối. Sau khi fit, predict() / save() dùng được như fit_kmeans().
+
+        Các hàng thừa ở cuối mỗi khối (ít hơn batch_size) được gộp sang khối
+        sau, nên mọi khách đều tham gia partial_fit kể cả khi block_size nhỏ.
+
+        Returns:
+            (labels, meta_df)
+        """
+        if self.customer_item_bool is None:
+            self.build_customer_item_matrix(as_sparse=True)
+        if self.rules_df_ is None:
+            raise ValueError("Chưa load rules. Hãy gọi load_rules() trước.")
+        if len(self.customers_) < int(n_clusters):
+            raise ValueError(
+                f"Số khách ({len(self.customers_)}) nhỏ hơn n_clusters ({int(n_clusters)})."
+            )
+        if int(batch_size) < int(n_clusters):
+            raise ValueError(
+                f"batch_size ({int(batch_size)}) phải >= n_clusters ({int(n_clusters)}) "
+                "vì mỗi lần partial_fit cần ít nhất n_clusters mẫu."
+            )
+
+        self.feature_params_ = {
+            "weighting": weighting,
+            "use_rfm": use_rfm,
+            "rfm_scale": rfm_scale,
+            "rule_scale": rule_scale,
+            "min_antecedent_len": min_antecedent_len,
+            "collapse_antecedents": collapse_antecedents,
+            "top_k": None,
+        }
+        self.item_columns_ = self.customer_item_bool.columns.tolist()
+        self.rfm_scaler_ = None
+        self.rule_scaler_ = None
+        # dựng một lần, dùng lại cho lượt scaler, các epoch và lượt predict
+        antecedents = self._build_antecedent_matrix(self.rules_df_, min_antecedent_len=min_antecedent_len)
+
+        meta = pd.DataFrame({self.customer_col: self.customers_})
+        rfm_values = None
+        if use_rfm:
+            # RFM tính một lần trên toàn bộ giao dịch, dùng lại cho mọi lượt khối
+            meta = meta.merge(self.compute_rfm(), on=self.customer_col, how="left")
+            rfm_values = meta[["Recency", "Frequency", "Monetary"]].fillna(0).values.astype(np.float32)
+            if rfm_scale:
+                self.rfm_scaler_ = StandardScaler().fit(rfm_values)
+                rfm_values = self.rfm_scaler_.transform(rfm_values)
+            if rule_scale:
+                # iter_feature_blocks chỉ ghép rule feature (chưa scale) + RFM => lấy phần rule
+                scaler = StandardScaler()
+                for _, X in self.iter_feature_blocks(
+                    block_size, antecedents=antecedents, rfm_values=rfm_values
+                ):
+                    scaler.partial_fit(X[:, :-3])
+                self.rule_scaler_ = scaler
+
+        self.model_ = MiniBatchKMeans(
+            n_clusters=int(n_clusters),
+            batch_size=int(batch_size),
+            n_init="auto",
+            random_state=random_state,
+        )
+        batch_size = int(batch_size)
+        pending = np.empty((0, 0), dtype=np.float32)
+        for _ in range(int(n_epochs)):
+            for _, X in self.iter_feature_blocks(
+                block_size, antecedents=antecedents, rfm_values=rfm_values
+            ):
+                # partial_fit theo mini-batch đủ batch_size, phần dư gộp sang khối sau
+                X = np.vstack([pending, X]) if pending.shape[0] else X
+                n_full = X.shape[0] // batch_size * batch_size
+                for start in range(0, n_full, batch_size):
+                    self.model_.partial_fit(X[start:start + batch_size])
+                pending = X[n_full:]
+        if pending.shape[0] >= int(n_clusters):
+            self.model_.partial_fit(pending)
+        self.cluster_centers_ = self.model_.cluster_centers_
+
+        labels = np.empty(meta.shape[0], dtype=np.int32)
+        for rows, X in self.iter_feature_blocks(
+            block_size, antecedents=antecedents, rfm_values=rfm_values
+        ):
+            labels[rows] = self.model_.predict(X)
+        return labels, meta
+
+    def predict(self, transactions_df: pd.DataFrame, snapshot_date=None) -> pd.DataFrame:
+        """
+        Gán cụm cho khách hàng mới (out-of-sample) bằng pipeline đã fit.
+
+        Chỉ tạo feature cho các khách có trong transactions_df: cùng luật (Top-K
+        nếu fit từ build_variant_features()), cùng tập item cột, cùng cấu hình
+        feature và scaler đã fit; cụm = centroid KMeans gần nhất.
+
+        Args:
+            transactions_df (pd.DataFrame): Giao dịch đã làm sạch của các khách cần gán cụm
+            snapshot_date: Mốc tính Recency (mặc định: ngày cuối trong transactions_df + 1)
+
+        Returns:
+            pd.DataFrame: CustomerID, (RFM nếu dùng) và cột cluster
+        """
+        if self.cluster_centers_ is None or self.feature_params_ is None:
+            raise ValueError("Chưa fit pipeline. Hãy gọi build_final_features() và fit_kmeans() hoặc load().")
+        params = self.feature_params_
+
+        scorer = RuleBasedCustomerClusterer(
+            transactions_df,
+            customer_col=self.customer_col,
+            invoice_col=self.invoice_col,
+            item_col=self.item_col,
+            quantity_col=self.quantity_col,
+            price_col=self.price_col,
+            date_col=self.date_col,
+            vocab=self.vocab,
+        )
+        # giữ đúng tập item cột lúc fit => cùng tập luật hợp lệ / cùng cột feature
+        scorer.build_customer_item_matrix()
+        scorer.customer_item_bool = scorer.customer_item_bool.reindex(
+            columns=pd.Index(self.item_columns_, name=self.item_col), fill_value=False
+        )
+        scorer.rules_df_ = self._feature_rules()
+
+        X = scorer.build_rule_feature_matrix(
+            weighting=params["weighting"],
+            min_antecedent_len=params["min_antecedent_len"],
+            collapse_antecedents=params["collapse_antecedents"],
+        )
+        meta = pd.DataFrame({self.customer_col: scorer.customers_})
+
+        if params["use_rfm"]:
+            rfm = scorer.compute_rfm(snapshot_date=snapshot_date)
+            meta = meta.merge(rfm, on=self.customer_col, how="left")
+            rfm_values = meta[["Recency", "Frequency", "Monetary"]].fillna(0).values.astype(np.float32)
+            if self.rfm_scaler_ is not None:
+                rfm_values = self.rfm_scaler_.transform(rfm_values)
+            if self.rule_scaler_ is not None:
+                X = self.rule_scaler_.transform(X)
+            X = np.hstack([X, rfm_values]).astype(np.float32)
+
+        meta["cluster"] = pairwise_distances_argmin(X, self.cluster_centers_)
+        return meta
+
+    @staticmethod
+    def _scaler_from_arrays(mean: np.ndarray, scale: np.ndarray) -> StandardScaler:
+        """Dựng lại StandardScaler đã fit từ mean_/scale_ đã lưu."""
+        scaler = StandardScaler()
+        scaler.mean_ = np.asarray(mean, dtype=np.float64)
+        scaler.scale_ = np.asarray(scale, dtype=np.float64)
+        scaler.var_ = scaler.scale_ ** 2
+        scaler.n_features_in_ = scaler.mean_.shape[0]
+        return scaler
+
+    def save(self, output_dir: str):
+        """
+        Lưu pipeline đã fit ra thư mục artifact:
+        - rules.parquet: luật dùng làm feature (rule store nhị phân)
+        - model.npz: centroid KMeans + mean/scale của các scaler
+        - model.json: tên cột, cấu hình feature, tập item cột
+        - vocab.json: item vocabulary (nếu có)
+
+        Args:
+            output_dir (str): Thư mục lưu artifact
+        """
+        if self.cluster_centers_ is None or self.feature_params_ is None:
+            raise ValueError("Chưa fit pipeline. Hãy gọi build_final_features() và fit_kmeans() trước.")
+        os.makedirs(output_dir, exist_ok=True)
+
+        save_rules_parquet(self._feature_rules(), os.path.join(output_dir, "rules.parquet"), vocab=self.vocab)
+
+        arrays = {"cluster_centers": self.cluster_centers_}
+        for name, scaler in (("rfm", self.rfm_scaler_), ("rule", self.rule_scaler_)):
+            if scaler is not None:
+                arrays[f"{name}_mean"] = scaler.mean_
+                arrays[f"{name}_scale"] = scaler.scale_
+        np.savez(os.path.join(output_dir, "model.npz"), **arrays)
+
+        item_columns = [
+            int(x) if isinstance(x, (int, np.integer)) else str(x) for x in self.item_columns_
+        ]
+        meta = {
+            "columns": {
+                "customer_col": self.customer_col,
+                "invoice_col": self.invoice_col,
+                "item_col": self.item_col,
+                "quantity_col": self.quantity_col,
+                "price_col": self.price_col,
+                "date_col": self.date_col,
+            },
+            "feature_params": self.feature_params_,
+            "item_columns": item_columns,
+            "n_clusters": int(self.cluster_centers_.shape[0]),
+        }
+        with open(os.path.join(output_dir, "model.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        if self.vocab is not None:
+            self.vocab.save(os.path.join(output_dir, "vocab.json"))
+
+        print(f"Đã lưu model phân cụm vào: {output_dir}")
+
+    @classmethod
+    def load(cls, model_dir: str, df_clean: pd.DataFrame | None = None) -> "RuleBasedCustomerClusterer":
+        """
+        Đọc pipeline đã lưu bằng save() để predict() khách mới.
+
+        Args:
+            model_dir (str): Thư mục artifact
+            df_clean (pd.DataFrame | None): Dữ liệu giao dịch gắn với clusterer
+                (không bắt buộc cho predict)
+        """
+        with open(os.path.join(model_dir, "model.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+
+        vocab_path = os.path.join(model_dir, "vocab.json")
+        vocab = Vocabulary.load(vocab_path) if os.path.exists(vocab_path) else None
+
+        cols = meta["columns"]
+        if df_clean is None:
+            df_clean = pd.DataFrame(columns=list(cols.values()))
+        clusterer = cls(df_clean, vocab=vocab, **cols)
+
+        clusterer.rules_df_ = load_rules_parquet(os.path.join(model_dir, "rules.parquet"), vocab=vocab)
+        clusterer.feature_params_ = meta["feature_params"]
+        clusterer.item_columns_ = meta["item_columns"]
+
+        arrays = np.load(os.path.join(model_dir, "model.npz"))
+        clusterer.cluster_centers_ = arrays["cluster_centers"]
+        if "rfm_mean" in arrays:
+            clusterer.rfm_scaler_ = cls._scaler_from_arrays(arrays["rfm_mean"], arrays["rfm_scale"])
+        if "rule_mean" in arrays:
+            clusterer.rule_scaler_ = cls._scaler_from_arrays(arrays["rule_mean"], arrays["rule_scale"])
+        return clusterer
+
     @staticmethod
     def project_2d(X: np.ndarray, method: str = "pca", random_state: int = 42) -> np.ndarray:
         """Giảm chiều xuống 2D để vẽ."""
@@ -1554,3 +5049,590 @@ class RuleBasedCustomerClusterer:
         if method in ("svd", "truncatedsvd"):
             return TruncatedSVD(n_components=2, random_state=random_state).fit_transform(X)
         raise ValueError("method phải là 'pca' hoặc 'svd'.")
+
+
+# =========================================================
+# 8. CROSS-SELL RECOMMENDATION (RULES -> TOP-N ITEMS)
+# =========================================================
+
+class CrossSellRecommender:
+    """
+    Gợi ý top-N sản phẩm cho từng khách hàng từ các luật kết hợp.
+
+    Với Customer × Item matrix B (RuleBasedCustomerClusterer.build_customer_item_matrix):
+    - F = luật kích hoạt (RuleIndex.match_batch, Customer × Rule)
+    - điểm item = gộp trọng số (lift / confidence / ...) của các luật kích hoạt
+      có item đó ở consequents: sum -> F·diag(w) @ C, max -> reduce theo (khách, item)
+    - bỏ các item khách đã mua, chọn top-N theo từng hàng bằng một lần sort,
+      không lặp Python theo từng khách.
+    """
+
+    def __init__(
+        self,
+        rules: pd.DataFrame,
+        vocab: Vocabulary = None,
+        score_by: str = "lift",
+        agg: str = "max",
+    ):
+        """
+        Args:
+            rules (pd.DataFrame): Luật đã lọc (miner output, rules CSV hoặc Parquet)
+            vocab (Vocabulary | None): Vocabulary nếu customer_item matrix dùng id item
+            score_by (str): "lift", "confidence", "support" hoặc "lift_x_conf"
+            agg (str): Gộp điểm nhiều luật cùng gợi ý một item: "max" hoặc "sum"
+        """
+        if agg not in ("max", "sum"):
+            raise ValueError("agg phải là 'max' hoặc 'sum'.")
+        if score_by not in ("lift", "confidence", "support", "lift_x_conf"):
+            raise ValueError("score_by phải là 'lift', 'confidence', 'support' hoặc 'lift_x_conf'.")
+
+        self.index = rules if isinstance(rules, RuleIndex) else RuleIndex(rules, vocab=vocab)
+        required = ["lift", "confidence"] if score_by == "lift_x_conf" else [score_by]
+        missing = [c for c in required if c not in self.index.rules.columns]
+        if missing:
+            raise ValueError(f"score_by='{score_by}' cần cột {missing} trong bảng luật.")
+        self.vocab = vocab
+        self.score_by = score_by
+        self.agg = agg
+        self.rule_weights_ = RuleBasedCustomerClusterer._rule_weights(self.index.rules, score_by)
+        # Rule × Item (consequents)
+        self.consequent_matrix_ = self.index.consequent_matrix_.T.tocsr()
+        self.recommendations_ = None
+
+    @classmethod
+    def from_file(cls, path: str, vocab: Vocabulary = None, **kwargs) -> "CrossSellRecommender":
+        """Tạo recommender từ rules CSV (vd rules_apriori_filtered.csv) hoặc Parquet."""
+        return cls(RuleIndex.from_file(path, vocab=vocab), vocab=vocab, **kwargs)
+
+    def _score_block(self, B: sparse.csr_matrix) -> sparse.csr_matrix:
+        """Điểm Customer × Item (chưa loại item đã mua) cho một lô khách."""
+        A = self.index.antecedent_matrix_.tocsr()
+        F = (B @ A).tocsr()
+        F.data = (F.data == self.index.antecedent_len_[F.indices]).astype(np.float32)
+        F.eliminate_zeros()
+
+        if self.agg == "sum":
+            F.data *= self.rule_weights_[F.indices]
+            return (F @ self.consequent_matrix_).tocsr()
+
+        # agg="max": bung từng cặp (khách, luật) thành (khách, item consequents) rồi lấy max
+        C = self.consequent_matrix_
+        F = F.tocoo()
+        n_cons = np.diff(C.indptr)[F.col]
+        rows = np.repeat(F.row, n_cons)
+        rule_of = np.repeat(F.col, n_cons)
+        offsets = np.arange(n_cons.sum()) - np.repeat(np.cumsum(n_cons) - n_cons, n_cons)
+        items = C.indices[C.indptr[rule_of] + offsets]
+        scores = self.rule_weights_[rule_of]
+
+        n_items = C.shape[1]
+        key = rows.astype(np.int64) * n_items + items
+        order = np.lexsort((-scores, key))
+        key, scores = key[order], scores[order]
+        first = np.ones(key.size, dtype=bool)
+        first[1:] = key[1:] != key[:-1]
+        key, scores = key[first], scores[first]
+        return sparse.csr_matrix(
+            (scores, (key // n_items, key % n_items)), shape=(B.shape[0], n_items)
+        )
+
+    @staticmethod
+    def _top_n(S: sparse.csr_matrix, top_n: int) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Top-N phần tử mỗi hàng của S: (row, rank, col, score), sort một lần cho cả ma trận."""
+        rows = np.repeat(np.arange(S.shape[0]), np.diff(S.indptr))
+        order = np.lexsort((S.indices, -S.data, rows))
+        rows, cols, scores = rows[order], S.indices[order], S.data[order]
+        rank = np.arange(rows.size) - S.indptr[rows]
+        keep = rank < top_n
+        return rows[keep], rank[keep] + 1, cols[keep], scores[keep]
+
+    def recommend(
+        self,
+        customer_item_bool: pd.DataFrame,
+        top_n: int = 5,
+        batch_size: int = 100_000,
+    ) -> pd.DataFrame:
+        """
+        Gợi ý top-N item cho mỗi khách hàng.
+
+        Args:
+            customer_item_bool (pd.DataFrame): Customer × Item boolean (dense hoặc
+                pandas sparse dtype), vd RuleBasedCustomerClusterer.customer_item_bool
+            top_n (int): Số item gợi ý tối đa mỗi khách
+            batch_size (int): Số khách mỗi lô (giới hạn bộ nhớ trung gian)
+
+        Returns:
+            pd.DataFrame: Cột [customer, rank, item, score] (kèm item_id nếu có
+                vocabulary), sort theo khách rồi rank; khách không có luật nào
+                kích hoạt sẽ không xuất hiện
+        """
+        B_all = self.index.encode_baskets(customer_item_bool)
+        B_all.data = np.ones_like(B_all.data)
+        customers = customer_item_bool.index
+        customer_col = customers.name or "CustomerID"
+
+        frames = []
+        for start in range(0, B_all.shape[0], batch_size):
+            B = B_all[start:start + batch_size]
+            S = self._score_block(B)
+            # loại item khách đã mua
+            S = (S - S.multiply(B)).tocsr()
+            S.eliminate_zeros()
+            rows, rank, cols, scores = self._top_n(S, int(top_n))
+            frame = pd.DataFrame({
+                customer_col: customers[start + rows],
+                "rank": rank.astype(np.int16),
+                "item": self.index.items_[cols],
+                "score": scores.astype(np.float32),
+            })
+            if self.vocab is not None:
+                frame.insert(2, "item_id", cols.astype(np.int32))
+            frames.append(frame)
+
+        self.recommendations_ = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        return self.recommendations_
+
+    def save_recommendations(self, output_path: str, recommendations: pd.DataFrame = None):
+        """Lưu bảng gợi ý ra CSV."""
+        if recommendations is None:
+            if self.recommendations_ is None:
+                raise ValueError("Chưa có gợi ý. Hãy gọi recommend() trước.")
+            recommendations = self.recommendations_
+
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        recommendations.to_csv(output_path, index=False)
+        print(f"Đã lưu gợi ý vào: {output_path}")
+
+
+# =========================================================
+# 9. END-TO-END PIPELINE (IN-MEMORY, NO NOTEBOOKS)
+# =========================================================
+
+_PIPELINE_MINERS = {
+    "apriori": AssociationRulesMiner,
+    "fpgrowth": FPGrowthMiner,
+    "eclat": EclatMiner,
+}
+
+PIPELINE_ARTIFACTS = ("cleaned", "vocab", "rules", "clusters", "model")
+
+
+def run_pipeline(
+    data_path: str,
+    country: str = "United Kingdom",
+    chunked: bool = True,
+    use_vocab: bool = True,
+    item_col: str = "Description",
+    threshold: int = 1,
+    algorithm: str = "apriori",
+    min_support: float = 0.01,
+    max_len: int = 3,
+    itemset_mode: str = "all",
+    min_confidence: float = 0.3,
+    min_lift: float = 1.2,
+    max_len_antecedents: int = 2,
+    max_len_consequents: int = 1,
+    top_k_rules: int = 200,
+    sort_rules_by: str = "lift",
+    weighting: str = "lift",
+    min_antecedent_len: int = 1,
+    use_rfm: bool = True,
+    rfm_scale: bool = True,
+    rule_scale: bool = False,
+    k_min: int = 2,
+    k_max: int = 10,
+    n_clusters: int | None = None,
+    random_state: int = 42,
+    silhouette_sample_size: int | None = None,
+    output_dir: str | None = None,
+    save: tuple = ("rules", "clusters"),
+) -> dict:
+    """
+    Chạy toàn bộ pipeline trong một process: làm sạch -> basket -> khai phá
+    luật -> feature từ luật -> KMeans. Dữ liệu truyền trực tiếp giữa các bước
+    (DataFrame / ma trận thưa), chỉ ghi file cho các artifact trong save.
+
+    Args:
+        data_path (str): CSV giao dịch gốc (online_retail.csv)
+        country (str): Quốc gia giữ lại (chỉ áp dụng khi chunked=True)
+        chunked (bool): Dùng DataCleaner.load_data_chunked() (ít bộ nhớ hơn)
+        use_vocab (bool): Dùng Vocabulary chung (itemsets/luật mang id item)
+        item_col (str): Cột item (Description hoặc StockCode)
+        threshold (int): Số lượng tối thiểu để coi item có trong hoá đơn
+        algorithm (str): "apriori", "fpgrowth" hoặc "eclat"
+        min_support, max_len: Tham số khai phá itemset phổ biến
+        itemset_mode (str): "all" hoặc "closed" (luật chỉ sinh từ closed
+            itemsets, ít luật dư thừa hơn)
+        min_confidence, min_lift, max_len_antecedents, max_len_consequents:
+            Ràng buộc đẩy vào generate_rules_constrained()
+        top_k_rules, sort_rules_by: Chọn luật làm feature
+        weighting, min_antecedent_len, use_rfm, rfm_scale, rule_scale:
+            Tham số build_final_features()
+        k_min, k_max (int): Khoảng k khi n_clusters=None
+        n_clusters (int | None): Cố định k (bỏ qua chọn k)
+        random_state (int): Random seed
+        silhouette_sample_size (int | None): Lấy mẫu khi tính silhouette
+        output_dir (str | None): Thư mục ghi artifact (None = không ghi gì)
+        save (tuple): Tập con của PIPELINE_ARTIFACTS cần ghi vào output_dir
+
+    Returns:
+        dict: cleaned, vocab, basket_bool, frequent_itemsets, rules, X, clusters
+            (meta + cột cluster), k_scores, clusterer
+    """
+    if algorithm not in _PIPELINE_MINERS:
+        raise ValueError(f"algorithm phải là một trong {sorted(_PIPELINE_MINERS)}.")
+    if itemset_mode not in ("all", "closed"):
+        raise ValueError("itemset_mode phải là 'all' hoặc 'closed'.")
+    unknown = set(save) - set(PIPELINE_ARTIFACTS)
+    if unknown:
+        raise ValueError(f"save không hợp lệ: {sorted(unknown)}")
+
+    # 1. Làm sạch
+    cleaner = DataCleaner(data_path)
+    if chunked:
+        cleaner.load_data_chunked(country=country)
+    else:
+        cleaner.load_data()
+        cleaner.clean_data()
+    df = cleaner.df_uk
+    vocab = cleaner.build_vocabulary(item_col=item_col) if use_vocab else None
+
+    # 2. Basket (sparse, không qua file parquet)
+    basket_bool = BasketPreparer(df, item_col=item_col, vocab=vocab).encode_basket_sparse(threshold)
+
+    # 3. Khai phá luật
+    miner = _PIPELINE_MINERS[algorithm](basket_bool)
+    frequent_itemsets = miner.mine_frequent_itemsets(
+        min_support=min_support, max_len=max_len, mode=itemset_mode
+    )
+    miner.generate_rules_constrained(
+        max_len_antecedents=max_len_antecedents,
+        max_len_consequents=max_len_consequents,
+        min_support=min_support,
+        min_confidence=min_confidence,
+        min_lift=min_lift,
+    )
+    rules = miner.add_readable_rule_str(vocab=vocab)
+
+    # 4. Feature từ luật + phân cụm
+    clusterer = RuleBasedCustomerClusterer(df, item_col=item_col, vocab=vocab)
+    clusterer.select_rules(rules, top_k=top_k_rules, sort_by=sort_rules_by)
+    X, meta = clusterer.build_final_features(
+        weighting=weighting,
+        use_rfm=use_rfm,
+        rfm_scale=rfm_scale,
+        rule_scale=rule_scale,
+        min_antecedent_len=min_antecedent_len,
+    )
+
+    k_scores = None
+    if n_clusters is None:
+        k_scores = clusterer.choose_k_by_silhouette(
+            X, k_min=k_min, k_max=k_max, random_state=random_state,
+            sample_size=silhouette_sample_size,
+        )
+        n_clusters = int(k_scores.loc[0, "k"])
+    meta["cluster"] = clusterer.fit_kmeans(X, n_clusters=n_clusters, random_state=random_state)
+
+    # 5. Ghi artifact (chỉ khi được yêu cầu)
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+        if "cleaned" in save:
+            cleaner.save_cleaned_data(output_dir=output_dir)
+        if "vocab" in save and vocab is not None:
+            vocab.save(os.path.join(output_dir, "vocab.json"))
+        if "rules" in save:
+            miner.save_rules(
+                os.path.join(output_dir, f"rules_{algorithm}_filtered.parquet"), rules, vocab=vocab
+            )
+        if "clusters" in save:
+            clusters_path = os.path.join(output_dir, "customer_clusters_from_rules.csv")
+            meta.to_csv(clusters_path, index=False)
+            print(f"Đã lưu kết quả phân cụm: {clusters_path}")
+        if "model" in save:
+            clusterer.save(os.path.join(output_dir, "cluster_model"))
+
+    return {
+        "cleaned": df,
+        "vocab": vocab,
+        "basket_bool": basket_bool,
+        "frequent_itemsets": frequent_itemsets,
+        "rules": rules,
+        "X": X,
+        "clusters": meta,
+        "k_scores": k_scores,
+        "clusterer": clusterer,
+    }
+
+
+# =========================================================
+# 10. INSTRUMENTATION (OPT-IN TIMING / MEMORY PROFILING)
+# =========================================================
+
+class InstrumentationCollector:
+    """
+    Thu thập sự kiện đo đạc (wall time, CPU time, peak memory, shape vào/ra)
+    cho từng lần gọi được theo dõi bởi track() / enable_instrumentation().
+
+    Nếu có log_path, mỗi sự kiện được ghi thêm một dòng JSON ngay khi kết thúc
+    (log vẫn còn dù process bị dừng giữa chừng).
+    """
+
+    def __init__(self, log_path: str | None = None):
+        self.events: list[dict] = []
+        self.log_path = log_path
+        if log_path:
+            log_dir = os.path.dirname(log_path)
+            if log_dir:
+                os.makedirs(log_dir, exist_ok=True)
+
+    def record(self, event: dict):
+        self.events.append(event)
+        if self.log_path:
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(event, ensure_ascii=False, default=str) + "\n")
+
+    def to_frame(self) -> pd.DataFrame:
+        """Các sự kiện dưới dạng DataFrame (mỗi hàng một lần gọi)."""
+        return pd.DataFrame(self.events)
+
+    def summary(self) -> pd.DataFrame:
+        """Tổng hợp theo stage: số lần gọi, tổng wall/CPU time, peak memory lớn nhất."""
+        df = self.to_frame()
+        if df.empty:
+            return df
+        return (
+            df.groupby("stage")
+            .agg(
+                calls=("stage", "size"),
+                wall_s=("wall_s", "sum"),
+                cpu_s=("cpu_s", "sum"),
+                peak_mem_mb=("peak_mem_mb", "max"),
+            )
+            .sort_values("wall_s", ascending=False)
+            .reset_index()
+        )
+
+    def save(self, output_path: str):
+        """Lưu event log ra .jsonl (mặc định) hoặc .csv."""
+        out_dir = os.path.dirname(output_path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        if output_path.endswith(".csv"):
+            self.to_frame().to_csv(output_path, index=False)
+        else:
+            with open(output_path, "w", encoding="utf-8") as f:
+                for event in self.events:
+                    f.write(json.dumps(event, ensure_ascii=False, default=str) + "\n")
+        print(f"Đã lưu instrumentation log: {output_path}")
+
+    def clear(self):
+        self.events = []
+
+
+# collector đang bật (enable_instrumentation) và stack peak memory của các track() lồng nhau
+_ACTIVE_COLLECTOR: InstrumentationCollector | None = None
+_TRACK_MEMORY = False
+_MEMORY_STACK: list[dict] = []
+_INSTRUMENTED: list[tuple[type, str, object]] = []
+
+
+def _shape_of(obj):
+    """Shape của DataFrame / ndarray / sparse (list), len() của list/dict, None nếu không có."""
+    shape = getattr(obj, "shape", None)
+    if isinstance(shape, tuple):
+        return list(shape)
+    if isinstance(obj, (list, dict)):
+        return [len(obj)]
+    if isinstance(obj, tuple):
+        return [_shape_of(x) for x in obj]
+    return None
+
+
+@contextmanager
+def track(
+    stage: str,
+    collector: InstrumentationCollector | None = None,
+    inputs: dict | None = None,
+    track_memory: bool | None = None,
+):
+    """
+    Context manager đo một khối code: wall time, CPU time, peak memory
+    (tracemalloc, so với lúc bắt đầu) và shape của inputs.
+
+    Gán event["output_shape"] trong khối để ghi shape kết quả. Các track()
+    lồng nhau vẫn cho peak memory đúng ở cả khối ngoài. Nếu tracemalloc đã do
+    code khác bật (vd benchmark_mining_grid), không đo memory (peak_mem_mb =
+    None) để không reset peak của phép đo bên ngoài.
+
+    Args:
+        stage (str): Tên stage (vd "BasketPreparer.encode_basket_sparse")
+        collector (InstrumentationCollector | None): Mặc định collector đang bật
+        inputs (dict | None): Tên -> object đầu vào (chỉ lưu shape)
+        track_memory (bool | None): Đo peak memory (mặc định theo enable_instrumentation)
+    """
+    collector = collector or _ACTIVE_COLLECTOR
+    if track_memory is None:
+        track_memory = _TRACK_MEMORY
+
+    event = {
+        "stage": stage,
+        "start": dt.datetime.now().isoformat(timespec="milliseconds"),
+        "depth": len(_MEMORY_STACK),
+        "input_shapes": {
+            k: _shape_of(v) for k, v in (inputs or {}).items() if _shape_of(v) is not None
+        },
+        "output_shape": None,
+    }
+
+    if track_memory and tracemalloc.is_tracing() and not _MEMORY_STACK:
+        # trace của người khác: reset_peak() sẽ làm hỏng số đo của họ
+        track_memory = False
+
+    started_tracing = False
+    if track_memory:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+        current, peak = tracemalloc.get_traced_memory()
+        if _MEMORY_STACK:
+            # peak của khối ngoài trước khi reset cho khối này
+            _MEMORY_STACK[-1]["peak"] = max(_MEMORY_STACK[-1]["peak"], peak)
+        tracemalloc.reset_peak()
+        frame = {"start": current, "peak": current}
+        _MEMORY_STACK.append(frame)
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield event
+    except Exception as exc:
+        event["error"] = f"{type(exc).__name__}: {exc}"
+        raise
+    finally:
+        event["wall_s"] = time.perf_counter() - wall_start
+        event["cpu_s"] = time.process_time() - cpu_start
+        event["peak_mem_mb"] = None
+        if track_memory:
+            _MEMORY_STACK.pop()
+            peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+            event["peak_mem_mb"] = (peak - frame["start"]) / 1024 ** 2
+            if _MEMORY_STACK:
+                _MEMORY_STACK[-1]["peak"] = max(_MEMORY_STACK[-1]["peak"], peak)
+            if started_tracing:
+                tracemalloc.stop()
+        if collector is not None:
+            collector.record(event)
+
+
+# Dữ liệu chính của instance, ghi shape vào inputs (method có state như
+# encode_basket_sparse() / build_customer_item_matrix() không nhận dữ liệu qua tham số)
+_INSTANCE_DATA_ATTRS = ("df", "basket_bool", "customer_item_bool")
+
+
+def _instrumented(owner: type, name: str, func, skip_first: bool):
+    """
+    Bọc func bằng track(); skip_first=True bỏ self/cls khỏi inputs nhưng ghi
+    shape của self.df / self.basket_bool / self.customer_item_bool (nếu có)
+    dưới tên "self.<attr>". Tên stage lấy theo class thực tế của self/cls lúc
+    gọi (method kế thừa, vd EclatMiner.generate_rules, không bị ghi thành tên
+    lớp cha).
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _ACTIVE_COLLECTOR is None:
+            return func(*args, **kwargs)
+        if skip_first and args:
+            first = args[0]
+            stage = f"{(first if isinstance(first, type) else type(first)).__name__}.{name}"
+        else:
+            stage = f"{owner.__name__}.{name}"
+        positional = args[1:] if skip_first else args
+        inputs = {}
+        if skip_first and args and not isinstance(args[0], type):
+            state = vars(args[0]) if hasattr(args[0], "__dict__") else {}
+            inputs.update(
+                {f"self.{attr}": state[attr] for attr in _INSTANCE_DATA_ATTRS if state.get(attr) is not None}
+            )
+        inputs.update({f"arg{i}": a for i, a in enumerate(positional)})
+        inputs.update(kwargs)
+        with track(stage, inputs=inputs) as event:
+            result = func(*args, **kwargs)
+            event["output_shape"] = _shape_of(result)
+        return result
+
+    return wrapper
+
+
+INSTRUMENTED_CLASSES = (
+    DataCleaner,
+    BasketPreparer,
+    AssociationRulesMiner,
+    FPGrowthMiner,
+    EclatMiner,
+    RuleBasedCustomerClusterer,
+)
+
+
+def enable_instrumentation(
+    collector: InstrumentationCollector | None = None,
+    classes: tuple = INSTRUMENTED_CLASSES,
+    track_memory: bool = False,
+) -> InstrumentationCollector:
+    """
+    Bật đo đạc cho mọi public method của các class (mặc định DataCleaner,
+    BasketPreparer, các miner và RuleBasedCustomerClusterer).
+
+    Method chỉ bị bọc khi bật; disable_instrumentation() trả lại method gốc,
+    nên khi không dùng thì không có overhead.
+
+    Args:
+        collector (InstrumentationCollector | None): Collector nhận sự kiện (mặc định tạo mới)
+        classes (tuple): Các class cần bọc
+        track_memory (bool): Đo peak memory bằng tracemalloc (mặc định tắt vì
+            chậm hơn đáng kể, ~2x)
+
+    Returns:
+        InstrumentationCollector: Collector đang bật
+    """
+    global _ACTIVE_COLLECTOR, _TRACK_MEMORY
+    disable_instrumentation()
+
+    _ACTIVE_COLLECTOR = collector or InstrumentationCollector()
+    _TRACK_MEMORY = track_memory
+
+    for cls in classes:
+        for name, raw in list(vars(cls).items()):
+            if name.startswith("_"):
+                continue
+            if isinstance(raw, staticmethod):
+                wrapped = staticmethod(_instrumented(cls, name, raw.__func__, skip_first=False))
+            elif isinstance(raw, classmethod):
+                wrapped = classmethod(_instrumented(cls, name, raw.__func__, skip_first=True))
+            elif inspect.isfunction(raw):
+                wrapped = _instrumented(cls, name, raw, skip_first=True)
+            else:
+                continue
+            _INSTRUMENTED.append((cls, name, raw))
+            setattr(cls, name, wrapped)
+
+    return _ACTIVE_COLLECTOR
+
+
+def disable_instrumentation() -> InstrumentationCollector | None:
+    """Tắt đo đạc, trả lại method gốc; trả về collector vừa dùng (nếu có)."""
+    global _ACTIVE_COLLECTOR
+    while _INSTRUMENTED:
+        cls, name, raw = _INSTRUMENTED.pop()
+        setattr(cls, name, raw)
+    collector, _ACTIVE_COLLECTOR = _ACTIVE_COLLECTOR, None
+    return collector
+
+
+# Bật tự động qua biến môi trường (run_papermill.py dùng để ghi log cạnh notebook output)
+if os.environ.get("CLUSTER_LIBRARY_INSTRUMENT"):
+    enable_instrumentation(
+        InstrumentationCollector(log_path=os.environ["CLUSTER_LIBRARY_INSTRUMENT"]),
+        track_memory=os.environ.get("CLUSTER_LIBRARY_INSTRUMENT_MEMORY", "0") == "1",
+    )
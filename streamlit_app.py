@@ -46,8 +46,20 @@ def load_cluster_data():
 def load_rules_data():
     """Tải dữ liệu luật kết hợp."""
     data_dir = "data/processed"
+    parquet_file = os.path.join(data_dir, "rules_apriori_filtered.parquet")
     rules_file = os.path.join(data_dir, "rules_apriori_filtered.csv")
     
+    # Dùng file mới hơn: run_pipeline ghi Parquet, notebook papermill ghi CSV
+    # (Parquet được ưu tiên khi cả hai cùng thời điểm)
+    use_parquet = os.path.exists(parquet_file) and (
+        not os.path.exists(rules_file)
+        or os.path.getmtime(parquet_file) >= os.path.getmtime(rules_file)
+    )
+    if use_parquet:
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+        from cluster_library import load_rules_parquet
+        return load_rules_parquet(parquet_file)
+    
     if not os.path.exists(rules_file):
         return None
     